@@ -1,7 +1,7 @@
 from logging.config import fileConfig
 
 from alembic import context
-from codechallenge.app import DB_DSN
+from codechallenge.app import get_db_dsn
 from codechallenge.entities.meta import Base, get_engine
 
 # this is the Alembic Config object, which provides
@@ -27,7 +27,7 @@ def run_migrations_offline():
     script output.
     """
     context.configure(
-        url=DB_DSN,
+        url=get_db_dsn(),
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
@@ -43,7 +43,7 @@ def run_migrations_online():
     In this scenario we need to create an Engine
     and associate a connection with the context.
     """
-    connectable = get_engine({"sqlalchemy.url": DB_DSN})
+    connectable = get_engine({"sqlalchemy.url": get_db_dsn()})
     with connectable.connect() as connection:
         context.configure(connection=connection, target_metadata=target_metadata)
 
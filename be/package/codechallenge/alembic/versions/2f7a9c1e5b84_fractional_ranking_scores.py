@@ -0,0 +1,36 @@
+"""Fractional ranking scores
+
+Revision ID: 2f7a9c1e5b84
+Revises: 8c2d4e6f1a3b
+Create Date: 2026-10-18 09:41:26.118304
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "2f7a9c1e5b84"
+down_revision = "8c2d4e6f1a3b"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("rankings") as batch_op:
+        batch_op.alter_column(
+            "score",
+            existing_type=sa.Integer(),
+            type_=sa.Float(),
+            existing_nullable=False,
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("rankings") as batch_op:
+        batch_op.alter_column(
+            "score",
+            existing_type=sa.Float(),
+            type_=sa.Integer(),
+            existing_nullable=False,
+        )
@@ -0,0 +1,36 @@
+"""Longer password hashes
+
+Revision ID: 5b1f3c9a7d2e
+Revises: e4cd8502970b
+Create Date: 2026-10-17 15:02:11.804417
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "5b1f3c9a7d2e"
+down_revision = "e4cd8502970b"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("users") as batch_op:
+        batch_op.alter_column(
+            "password_hash",
+            existing_type=sa.String(length=60),
+            type_=sa.String(length=128),
+            existing_nullable=True,
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("users") as batch_op:
+        batch_op.alter_column(
+            "password_hash",
+            existing_type=sa.String(length=128),
+            type_=sa.String(length=60),
+            existing_nullable=True,
+        )
@@ -0,0 +1,63 @@
+"""Match and question stats
+
+Revision ID: 6d1e8b3f0c27
+Revises: 2f7a9c1e5b84
+Create Date: 2026-10-18 11:06:52.730418
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "6d1e8b3f0c27"
+down_revision = "2f7a9c1e5b84"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # rows are built from the plays at the first use of the counters
+    op.create_table(
+        "match_stats",
+        sa.Column("match_uid", sa.Integer(), nullable=False),
+        sa.Column("started", sa.Integer(), nullable=False),
+        sa.Column("completed", sa.Integer(), nullable=False),
+        sa.Column("plays", sa.Integer(), nullable=False),
+        sa.Column("score", sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["match_uid"],
+            ["matches.uid"],
+            name=op.f("fk_match_stats_match_uid_matches"),
+            ondelete="CASCADE",
+        ),
+        sa.PrimaryKeyConstraint("match_uid", name=op.f("pk_match_stats")),
+    )
+    op.create_table(
+        "question_stats",
+        sa.Column("question_uid", sa.Integer(), nullable=False),
+        sa.Column("match_uid", sa.Integer(), nullable=False),
+        sa.Column("answers", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["match_uid"],
+            ["matches.uid"],
+            name=op.f("fk_question_stats_match_uid_matches"),
+            ondelete="CASCADE",
+        ),
+        sa.ForeignKeyConstraint(
+            ["question_uid"],
+            ["questions.uid"],
+            name=op.f("fk_question_stats_question_uid_questions"),
+            ondelete="CASCADE",
+        ),
+        sa.PrimaryKeyConstraint("question_uid", name=op.f("pk_question_stats")),
+    )
+    op.create_index(
+        "ix_question_stats_match_uid", "question_stats", ["match_uid"], unique=False
+    )
+
+
+def downgrade():
+    op.drop_index("ix_question_stats_match_uid", table_name="question_stats")
+    op.drop_table("question_stats")
+    op.drop_table("match_stats")
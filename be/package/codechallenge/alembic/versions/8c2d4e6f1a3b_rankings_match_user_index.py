@@ -0,0 +1,28 @@
+"""Rankings match and user index
+
+Revision ID: 8c2d4e6f1a3b
+Revises: 5b1f3c9a7d2e
+Create Date: 2026-10-17 18:24:07.552190
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "8c2d4e6f1a3b"
+down_revision = "5b1f3c9a7d2e"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_rankings_match_uid_user_uid",
+        "rankings",
+        ["match_uid", "user_uid"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index("ix_rankings_match_uid_user_uid", table_name="rankings")
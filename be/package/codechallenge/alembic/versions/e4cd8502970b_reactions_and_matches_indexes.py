@@ -0,0 +1,40 @@
+"""Reactions and matches indexes
+
+Revision ID: e4cd8502970b
+Revises: 913b930b207d
+Create Date: 2026-10-17 09:12:41.318062
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "e4cd8502970b"
+down_revision = "913b930b207d"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_reactions_user_uid_match_uid_uid",
+        "reactions",
+        ["user_uid", "match_uid", "uid"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_reactions_match_uid_user_uid",
+        "reactions",
+        ["match_uid", "user_uid"],
+        unique=False,
+    )
+    op.create_index("ix_matches_uhash", "matches", ["uhash"], unique=False)
+    op.create_index(
+        "ix_matches_code_to_time", "matches", ["code", "to_time"], unique=False
+    )
+
+
+def downgrade():
+    op.drop_index("ix_matches_code_to_time", table_name="matches")
+    op.drop_index("ix_matches_uhash", table_name="matches")
+    op.drop_index("ix_reactions_match_uid_user_uid", table_name="reactions")
+    op.drop_index("ix_reactions_user_uid_match_uid_uid", table_name="reactions")
@@ -7,13 +7,16 @@ from pyramid.session import SignedCookieSessionFactory
 logger = logging.getLogger(__name__)
 
 
-DB_DSN = "{sql_protocol}://{user}:{pwd}@{host}/{db}?charset=utf8mb4".format(
-    sql_protocol=os.getenv("SQL_PROTOCOL"),
-    user=os.getenv("MYSQL_USER"),
-    pwd=os.getenv("MYSQL_PASSWORD"),
-    host=os.getenv("MYSQL_HOST"),
-    db=os.getenv("MYSQL_DATABASE"),
-)
+def get_db_dsn():
+    """DSN of the database, read from the environment when called"""
+    return "{sql_protocol}://{user}:{pwd}@{host}/{db}?charset=utf8mb4".format(
+        sql_protocol=os.getenv("SQL_PROTOCOL"),
+        user=os.getenv("MYSQL_USER"),
+        pwd=os.getenv("MYSQL_PASSWORD"),
+        host=os.getenv("MYSQL_HOST"),
+        db=os.getenv("MYSQL_DATABASE"),
+    )
+
 
 REDIS_CONF = {"host": "redis", "port": "6379", "password": os.getenv("REDIS_PW")}
 
@@ -21,7 +24,6 @@ REDIS_CONF = {"host": "redis", "port": "6379", "password": os.getenv("REDIS_PW")
 class StoreConfig:
     _instance = None
     _config = None
-    _session = None
 
     def __new__(cls):
         if cls._instance is None:
@@ -36,20 +38,28 @@ class StoreConfig:
     def config(self, value):
         self._config = value
 
+    @property
+    def settings(self):
+        registry = getattr(self._config, "registry", None)
+        if registry is None:
+            return {}
+        return registry.settings or {}
+
     @property
     def session(self):
-        factory = self._config.registry.get("dbsession_factory")
-        if self._session is None:
-            self._session = factory()
-        if not self._session.is_active:
-            self._session = factory()
+        """Session of the current request, or thread, see meta.session_scope"""
+        registry = self._config.registry.get("dbsession_registry")
+        session = registry()
+        if not session.is_active:
+            registry.remove()
+            session = registry()
 
-        return self._session
+        return session
 
 
 def main(global_config, **settings):
     if not settings.get("testing", False):
-        settings["sqlalchemy.url"] = DB_DSN
+        settings["sqlalchemy.url"] = get_db_dsn()
     session_factory = SignedCookieSessionFactory("sessionFactory")
     config = Configurator(
         settings=settings,
@@ -58,8 +68,13 @@ def main(global_config, **settings):
     )
     config.include("pyramid_jinja2")
     config.include("codechallenge.security")
+    config.include("codechallenge.passwords")
     config.include("codechallenge.endpoints.routes")
     config.include("codechallenge.entities.meta")
+    config.include("codechallenge.instrumentation")
+    config.include("codechallenge.play.plan")
+    config.include("codechallenge.play.write_behind")
+    config.include("codechallenge.play.stats")
 
     StoreConfig().config = config
     return config.make_wsgi_app()
@@ -22,6 +22,22 @@ DIGEST_SIZE = 16
 DIGEST_LENGTH = 32
 KEY_LENGTH = 32
 USER_NAME_MAX_LENGTH = 30
-# no matter the password's length,
-# the hash length stays the same
-PASSWORD_HASH_LENGTH = 60
+# no matter the password's length, the hash length stays
+# the same: 60 for bcrypt, up to ~100 for argon2
+PASSWORD_HASH_LENGTH = 128
+
+# seconds a compiled match plan is kept in the cache
+MATCH_PLAN_TTL = 24 * 60 * 60
+
+# questions validated and inserted at once while importing
+IMPORT_CHUNK_SIZE = 500
+# errors reported back, at most, by an import
+IMPORT_MAX_ERRORS = 100
+
+# matches returned by default, and at most, by a page of /match/list
+MATCH_LIST_PAGE_SIZE = 20
+MATCH_LIST_MAX_PAGE_SIZE = 100
+
+# entries returned by default, and at most, by a page of /rankings
+RANKINGS_PAGE_SIZE = 10
+RANKINGS_MAX_PAGE_SIZE = 100
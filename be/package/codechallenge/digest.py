@@ -0,0 +1,61 @@
+import os
+from hashlib import blake2b
+
+from codechallenge.constants import DIGEST_SIZE
+from pyramid.settings import aslist
+
+# service of the keys in the environment, see digest_service
+service = None
+
+
+class DigestService:
+    """Keyed BLAKE2b digests of words (i.e. emails and tokens)
+
+    The keyed state is computed once per key and copied for every
+    digest. The first key digests the new words, the previous ones
+    are kept to find the rows digested before a rotation.
+    """
+
+    def __init__(self, key, *previous_keys):
+        self._states = [
+            blake2b(key=k.encode("utf-8"), digest_size=DIGEST_SIZE)
+            for k in (key, *previous_keys)
+        ]
+
+    def _digest(self, state, word):
+        h = state.copy()
+        h.update(word.encode("utf-8"))
+        return h.hexdigest()
+
+    def digest(self, word):
+        return self._digest(self._states[0], word)
+
+    def digest_many(self, words):
+        state = self._states[0]
+        return [self._digest(state, word) for word in words]
+
+    def digests(self, word):
+        """Digests of the word with every key, the current one first"""
+        return [self._digest(state, word) for state in self._states]
+
+
+def digest_service():
+    """
+    Service of the keys in SIGNED_KEY and SIGNED_KEY_PREVIOUS
+
+    SIGNED_KEY_PREVIOUS lists the keys used before the current one,
+    separated by spaces or new lines. Keys are read at the first use,
+    rotating them requires a restart (or reset_digest_service).
+    """
+    global service
+
+    if service is None:
+        previous_keys = aslist(os.getenv("SIGNED_KEY_PREVIOUS", ""))
+        service = DigestService(os.getenv("SIGNED_KEY"), *previous_keys)
+    return service
+
+
+def reset_digest_service():
+    global service
+
+    service = None
@@ -1,16 +1,32 @@
 import logging
 
-from cerberus import Validator
 from codechallenge.entities import User
-from codechallenge.utils import view_decorator
+from codechallenge.exceptions import HasherBusyError
+from codechallenge.utils import CompiledValidator, view_decorator
 from codechallenge.validation.syntax import user_login_schema
 from pyramid.csrf import new_csrf_token
 from pyramid.httpexceptions import HTTPSeeOther
 from pyramid.response import Response
 from pyramid.security import forget, remember
+from pyramid.view import view_config
 
 logger = logging.getLogger(__name__)
 
+login_validator = CompiledValidator(user_login_schema)
+
+
+@view_config(context=HasherBusyError)
+def hasher_busy(exc, request):
+    """Refuse the requests hashing a password while the hasher is full
+
+    Logins verify (and may rehash) passwords, users created with a
+    password hash it: whatever the view, the client retries later.
+    """
+    logger.warning(f"{request.method} {request.path} refused: {exc.message}")
+    response = Response(status=503, json={"error": exc.message})
+    response.headers["Retry-After"] = "1"
+    return response
+
 
 class Login:
     def __init__(self, request):
@@ -25,7 +41,7 @@ class Login:
     @view_decorator(route_name="login", request_method="POST", require_csrf=False)
     def login(self):
         user_data = getattr(self.request, "json", None)
-        v = Validator(user_login_schema)
+        v = login_validator.get()
         if not v.validate(user_data):
             return Response(status=400, json=v.errors)
 
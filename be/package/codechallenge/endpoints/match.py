@@ -1,17 +1,20 @@
 import logging
+from io import BytesIO
 
-from codechallenge.entities import Game, Match, Matches, Question
+from codechallenge.entities import Match, Matches, MatchStats
 from codechallenge.exceptions import NotFoundObjectError, ValidateError
+from codechallenge.importer import QuestionsImport, XlsxQuestions, YamlQuestions
 from codechallenge.security import login_required
 from codechallenge.utils import view_decorator
 from codechallenge.validation.logical import (
-    RetrieveObject,
     ValidateEditMatch,
     ValidateMatchImport,
 )
 from codechallenge.validation.syntax import (
     create_match_schema,
     edit_match_schema,
+    list_matches_schema,
+    match_import_schema,
     match_yaml_import_schema,
 )
 from pyramid.response import Response
@@ -27,26 +30,35 @@ class MatchEndPoints:
     @view_decorator(
         route_name="list_matches",
         request_method="GET",
+        read_only=True,
+        syntax=list_matches_schema,
+        data_attr="params",
     )
-    def list_matches(self):
-        # TODO: to fix the filtering parameters
-        _ = self.request.params
-        all_matches = Matches.all_matches(**{})
-        return Response(json={"matches": [m.json for m in all_matches]})
+    def list_matches(self, user_input):
+        with_questions = "questions" in user_input.pop("fields")
+        matches, cursor = Matches.page(with_questions=with_questions, **user_input)
+        return Response(
+            json={
+                "matches": [m.json if with_questions else m.summary for m in matches],
+                "next": cursor,
+            }
+        )
 
     @login_required
     @view_decorator(
         route_name="get_match",
         request_method="GET",
+        read_only=True,
     )
     def get_match(self):
         uid = self.request.matchdict.get("uid")
-        try:
-            match = RetrieveObject(uid=uid, otype="match").get()
-        except NotFoundObjectError:
+        match = Matches.get(uid=uid, with_questions=True)
+        if match is None:
             return Response(status=404)
 
-        return Response(json={"match": match.json})
+        return Response(
+            json={"match": match.json, "stats": MatchStats.of_match(match.uid)}
+        )
 
     @login_required
     @view_decorator(
@@ -57,13 +69,7 @@ class MatchEndPoints:
     )
     def create_match(self, user_input):
         questions = user_input.pop("questions", [])
-        new_match = Match(**user_input).save()
-        new_game = Game(match_uid=new_match.uid).save()
-        for position, question in enumerate(questions):
-            new = Question(
-                game_uid=new_game.uid, text=question["text"], position=position
-            )
-            new.create_with_answers(question.get("answers"))
+        new_match = Match(**user_input).create_with_questions(questions)
         return Response(json={"match": new_match.json})
 
     @login_required
@@ -103,5 +109,34 @@ class MatchEndPoints:
                 return Response(status=404)
             return Response(status=400, json={"error": e.message})
 
-        match.insert_questions(user_input["data"]["questions"])
+        match.bulk_insert_questions(user_input["data"]["questions"])
         return Response(json={"match": match.json})
+
+    @login_required
+    @view_decorator(
+        route_name="match_import",
+        request_method="POST",
+        syntax=match_import_schema,
+        data_attr="json",
+    )
+    def match_import(self, user_input):
+        match_uid = user_input.get("match_uid")
+
+        try:
+            match = ValidateMatchImport(match_uid).is_valid()
+        except (NotFoundObjectError, ValidateError) as e:
+            if isinstance(e, NotFoundObjectError):
+                return Response(status=404)
+            return Response(status=400, json={"error": e.message})
+
+        source = {"yaml": YamlQuestions, "xlsx": XlsxQuestions}[user_input["format"]]
+
+        def progress(imported, failed):
+            logger.info(f"Match {match.uid}: {imported} imported, {failed} failed")
+
+        # the file is decoded from the json body as a whole, only the
+        # questions are streamed (see QuestionsImport)
+        summary = QuestionsImport(
+            match, source(BytesIO(user_input["data"])), progress=progress
+        ).run()
+        return Response(json={"match": match.uid, **summary})
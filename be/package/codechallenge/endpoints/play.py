@@ -2,6 +2,7 @@ import logging
 
 from codechallenge.entities.user import UserFactory
 from codechallenge.exceptions import MatchOver, NotFoundObjectError, ValidateError
+from codechallenge.play.plan import MatchPlans
 from codechallenge.play.single_player import PlayerStatus, PlayScore, SinglePlayer
 from codechallenge.utils import view_decorator
 from codechallenge.validation.logical import (
@@ -32,6 +33,7 @@ class PlayEndPoints:
         request_method="POST",
         syntax=land_play_schema,
         data_attr="matchdict",
+        fast_syntax=True,
     )
     def land(self, user_input):
         try:
@@ -49,6 +51,7 @@ class PlayEndPoints:
         request_method="POST",
         syntax=code_play_schema,
         data_attr="json",
+        fast_syntax=True,
     )
     def code(self, user_input):
         try:
@@ -67,6 +70,7 @@ class PlayEndPoints:
         request_method="POST",
         syntax=start_play_schema,
         data_attr="json",
+        fast_syntax=True,
     )
     def start(self, user_input):
         try:
@@ -82,11 +86,11 @@ class PlayEndPoints:
             user = UserFactory(signed=match.is_restricted).fetch()
 
         status = PlayerStatus(user, match)
-        player = SinglePlayer(status, user, match)
+        player = SinglePlayer(status, user, match, plan=MatchPlans.get(match))
         current_question = player.start()
         match_data = {
             "match": match.uid,
-            "question": current_question.json,
+            "question": player.question_json(current_question),
             "user": user.uid,
         }
         return Response(json=match_data)
@@ -96,6 +100,7 @@ class PlayEndPoints:
         request_method="POST",
         syntax=next_play_schema,
         data_attr="json",
+        fast_syntax=True,
     )
     def next(self, user_input):
         try:
@@ -110,14 +115,16 @@ class PlayEndPoints:
         answer = data.get("answer")
 
         status = PlayerStatus(user, match)
-        player = SinglePlayer(status, user, match)
+        player = SinglePlayer(status, user, match, plan=MatchPlans.get(match))
         try:
             next_q = player.react(answer)
         except MatchOver:
             PlayScore(match.uid, user.uid, status.current_score()).save_to_ranking()
             return Response(json={"question": None})
 
-        return Response(json={"question": next_q.json, "user": user.uid})
+        return Response(
+            json={"question": player.question_json(next_q), "user": user.uid}
+        )
 
     @view_decorator(
         route_name="sign",
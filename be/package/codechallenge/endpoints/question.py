@@ -47,7 +47,7 @@ class QuestionEndPoints:
     def edit_question(self, user_input):
         uid = self.request.matchdict.get("uid")
         try:
-            question = RetrieveObject(uid=uid, otype="question").get()
+            question = RetrieveObject(uid=uid, otype="question", fresh=True).get()
         except NotFoundObjectError:
             return Response(status=404)
 
@@ -1,4 +1,5 @@
-from codechallenge.entities import Rankings
+from codechallenge.entities import Matches, Users
+from codechallenge.play.leaderboard import Leaderboard
 from codechallenge.security import login_required
 from codechallenge.utils import view_decorator
 from codechallenge.validation.syntax import match_rankings_schema
@@ -13,10 +14,33 @@ class RankingEndPoints:
     @view_decorator(
         route_name="match_rankings",
         request_method="GET",
+        read_only=True,
         syntax=match_rankings_schema,
         data_attr="params",
     )
     def match_rankings(self, user_input):
-        match_uid = user_input["match_uid"]
-        rankings = Rankings.of_match(match_uid)
-        return Response(json={"rankings": [rank.json for rank in rankings]})
+        match = Matches.get(uid=user_input["match_uid"])
+        if match is None:
+            return Response(json={"rankings": []})
+
+        leaderboard = Leaderboard(match.uid)
+        limit = user_input["limit"]
+        user_uid = user_input.get("user_uid")
+        result = {}
+        if user_uid is None:
+            entries = leaderboard.top(limit, offset=user_input["offset"])
+        else:
+            result["user_rank"], entries = leaderboard.around(user_uid, limit)
+
+        users = Users.users_with_ids(*[uid for _, uid, _ in entries])
+        names = {user.uid: user.name for user in users}
+        result["rankings"] = [
+            {
+                "rank": rank,
+                "score": score,
+                "match": {"name": match.name, "uid": match.uid},
+                "user": {"uid": uid, "name": names.get(uid)},
+            }
+            for rank, uid, score in entries
+        ]
+        return Response(json=result)
@@ -1,3 +1,6 @@
+from codechallenge.entities.meta import read_only_view
+
+
 def default_routes(config):
     # /new must come before /{uid} suffixed routes
     # because of route matching logic
@@ -10,10 +13,13 @@ def default_routes(config):
     config.add_route("list_matches", "/match/list")
     config.add_route("new_match", "/match/new")
     config.add_route("match_yaml_import", "/match/yaml_import")
+    config.add_route("match_import", "/match/import")
     config.add_route("get_match", "/match/{uid}")
     config.add_route("edit_match", "/match/edit/{uid}")
     config.add_route("list_players", "/players")
+    config.add_route("provision_players", "/players/provision")
     config.add_route("match_rankings", "/rankings")
+    config.add_route("cache_stats", "/stats/cache")
 
 
 def play_routes(config):
@@ -27,6 +33,8 @@ def play_routes(config):
 
 
 def includeme(config):
+    # accept read_only=True in the view configuration
+    config.add_view_deriver(read_only_view)
     config.include(default_routes)
     config.include(play_routes, route_prefix="/play")
     config.scan("codechallenge.endpoints.login")
@@ -35,3 +43,4 @@ def includeme(config):
     config.scan("codechallenge.endpoints.play")
     config.scan("codechallenge.endpoints.user")
     config.scan("codechallenge.endpoints.ranking")
+    config.scan("codechallenge.endpoints.stats")
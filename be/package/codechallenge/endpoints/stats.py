@@ -0,0 +1,15 @@
+from codechallenge.identity import identity_cache
+from codechallenge.security import login_required
+from codechallenge.utils import view_decorator
+from pyramid.response import Response
+
+
+class StatsEndPoints:
+    def __init__(self, request):
+        self.request = request
+
+    @login_required
+    @view_decorator(route_name="cache_stats", request_method="GET")
+    def cache_stats(self):
+        cache = identity_cache()
+        return Response(json={"identity": cache.stats() if cache else None})
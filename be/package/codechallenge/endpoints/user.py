@@ -1,9 +1,14 @@
 import logging
+from io import BytesIO
 
 from codechallenge.entities import Users
+from codechallenge.importer import CsvPlayers, JsonPlayers, PlayersImport
 from codechallenge.security import login_required
 from codechallenge.utils import view_decorator
-from codechallenge.validation.syntax import player_list_schema
+from codechallenge.validation.syntax import (
+    player_list_schema,
+    provision_players_schema,
+)
 from pyramid.response import Response
 
 logger = logging.getLogger(__name__)
@@ -17,6 +22,7 @@ class UserEndPoints:
     @view_decorator(
         route_name="list_players",
         request_method="GET",
+        read_only=True,
         syntax=player_list_schema,
         data_attr="params",
     )
@@ -24,3 +30,21 @@ class UserEndPoints:
         match_uid = user_input["match_uid"]
         all_players = Users.players_of_match(match_uid)
         return Response(json={"players": [u.json for u in all_players]})
+
+    @login_required
+    @view_decorator(
+        route_name="provision_players",
+        request_method="POST",
+        syntax=provision_players_schema,
+        data_attr="json",
+    )
+    def provision_players(self, user_input):
+        source = {"csv": CsvPlayers, "json": JsonPlayers}[user_input["format"]]
+
+        def progress(provisioned, failed):
+            logger.info(f"Players: {provisioned} provisioned, {failed} failed")
+
+        summary = PlayersImport(
+            source(BytesIO(user_input["data"])), progress=progress
+        ).run()
+        return Response(json=summary)
@@ -5,4 +5,5 @@ from codechallenge.entities.open_answer import OpenAnswer, OpenAnswers  # noqa:
 from codechallenge.entities.question import Question, Questions  # noqa: F401
 from codechallenge.entities.ranking import Ranking, Rankings  # noqa: F401
 from codechallenge.entities.reaction import Reaction, Reactions  # noqa: F401
+from codechallenge.entities.stats import MatchStats  # noqa: F401
 from codechallenge.entities.user import User, Users  # noqa: F401
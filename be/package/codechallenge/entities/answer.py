@@ -1,6 +1,6 @@
 from codechallenge.app import StoreConfig
 from codechallenge.constants import ANSWER_TEXT_MAX_LENGTH, URL_LENGTH
-from codechallenge.entities.meta import Base, TableMixin, classproperty
+from codechallenge.entities.meta import Base, TableMixin, classproperty, fresh_query
 from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, select
 from sqlalchemy.orm import relationship
 from sqlalchemy.schema import UniqueConstraint
@@ -74,5 +74,6 @@ class Answers:
         return cls.session.query(Answer).count()
 
     @classmethod
-    def get(cls, uid):
-        return cls.session.query(Answer).filter_by(uid=uid).one_or_none()
+    def get(cls, uid, fresh=False):
+        query = cls.session.query(Answer).filter_by(uid=uid)
+        return fresh_query(query, fresh).one_or_none()
@@ -8,15 +8,31 @@ from codechallenge.constants import (
     HASH_POPULATION,
     MATCH_CODE_LEN,
     MATCH_HASH_LEN,
+    MATCH_LIST_PAGE_SIZE,
     MATCH_NAME_MAX_LENGTH,
     MATCH_PASSWORD_LEN,
     PASSWORD_POPULATION,
 )
 from codechallenge.entities.game import Game
-from codechallenge.entities.meta import Base, TableMixin, classproperty
+from codechallenge.entities.meta import Base, TableMixin, classproperty, fresh_query
 from codechallenge.entities.question import Question, Questions
+from codechallenge.entities.ranking import Rankings
+from codechallenge.entities.reaction import Reaction
 from codechallenge.exceptions import NotUsableQuestionError
-from sqlalchemy import Boolean, Column, DateTime, Integer, String, select
+from codechallenge.play.allocator import CodeAllocator, HashAllocator
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    Index,
+    Integer,
+    String,
+    exists,
+    not_,
+    or_,
+    select,
+)
+from sqlalchemy.orm import selectinload
 
 
 class Match(TableMixin, Base):
@@ -42,6 +58,11 @@ class Match(TableMixin, Base):
     # when True games should be played in order
     order = Column(Boolean, default=True)
 
+    __table_args__ = (
+        Index("ix_matches_uhash", "uhash"),
+        Index("ix_matches_code_to_time", "code", "to_time"),
+    )
+
     def __init__(self, **kwargs):
         """
         Initiate the instance
@@ -65,7 +86,7 @@ class Match(TableMixin, Base):
 
         with_code = kwargs.pop("with_code", False)
         if with_code:
-            self.code = MatchCode().get_code()
+            self.code = MatchCode().get_code(expires=kwargs.get("to_time") or expires)
 
         with_hash = not with_code
         if with_hash:
@@ -88,6 +109,11 @@ class Match(TableMixin, Base):
     def questions_count(self):
         return sum(len(g.questions) for g in self.games)
 
+    @property
+    def next_game_index(self):
+        """Index of a game added after the existing ones"""
+        return max((g.index or 0 for g in self.games), default=-1) + 1
+
     @property
     def expires(self):
         return self.to_time
@@ -119,7 +145,9 @@ class Match(TableMixin, Base):
 
     @property
     def is_started(self):
-        return len(self.reactions)
+        return self.session.execute(
+            select(exists().where(Reaction.match_uid == self.uid))
+        ).scalar()
 
     def update(self, **attrs):
         for name, value in attrs.items():
@@ -128,6 +156,8 @@ class Match(TableMixin, Base):
             else:
                 setattr(self, name, value)
         self.session.commit()
+        if self.code and "to_time" in attrs:
+            MatchCode().extend(self.code, self.to_time)
 
     def insert_questions(self, questions, commit=False):
         result = []
@@ -145,6 +175,28 @@ class Match(TableMixin, Base):
             self.session.commit()
         return result
 
+    def bulk_insert_questions(self, questions, commit=True):
+        """Add a new game with the questions, in a single transaction
+
+        Questions and answers are inserted in bulk (see
+        Questions.bulk_create). Return the uids of the new questions
+        """
+        g = Game(match=self, index=self.next_game_index)
+        self.session.add(g)
+        self.session.flush()
+        result = Questions.bulk_create(g.uid, questions)
+
+        if commit:
+            self.session.commit()
+        return result
+
+    def create_with_questions(self, questions):
+        """Save the match and its questions in a single transaction"""
+        self.session.add(self)
+        self.session.flush()
+        self.bulk_insert_questions(questions)
+        return self
+
     def update_questions(self, questions, commit=False):
         """Add or update questions for this match
 
@@ -170,7 +222,7 @@ class Match(TableMixin, Base):
                 question.position = q.get("position", question.position)
             else:
                 question = Question(
-                    game_uid=g.uid,
+                    game=g,
                     text=q.get("text"),
                     position=len(g.questions),
                 )
@@ -205,15 +257,19 @@ class Match(TableMixin, Base):
         self.session.commit()
         return result
 
-    # TODO: to fix. It should not count the reaction but the number of completed
-    # attempts for this match.
     def left_attempts(self, user):
-        return len([r for r in self.reactions if r.user.uid == user.uid]) - self.times
+        """Plays left to the user, None when the match can be played at will
+
+        Only the completed plays (i.e. ranked) are counted.
+        """
+        if self.times is None:
+            return None
+        return max(self.times - Rankings.completed_plays(self.uid, user.uid), 0)
 
     @property
-    def json(self):
+    def summary(self):
         """
-        Store questions as list, one per game
+        Metadata of the match, questions excluded
         """
         return {
             "name": self.name,
@@ -223,6 +279,15 @@ class Match(TableMixin, Base):
             "times": self.times,
             "code": self.code,
             "uhash": self.uhash,
+        }
+
+    @property
+    def json(self):
+        """
+        Store questions as list, one per game
+        """
+        return {
+            **self.summary,
             "questions": [[q.json for q in g.ordered_questions] for g in self.games],
         }
 
@@ -237,6 +302,11 @@ class MatchHash:
         return "".join(choices(HASH_POPULATION, k=length))
 
     def get_hash(self, length=MATCH_HASH_LEN):
+        value = HashAllocator(HASH_POPULATION, length, Matches.hashes).allocate()
+        if value:
+            return value
+
+        # without Redis, look for collisions in the database
         value = self.new_value(length)
         while Matches.get(uhash=value):
             value = self.new_value(length)
@@ -252,24 +322,33 @@ class MatchPassword:
         return "".join(choices(PASSWORD_POPULATION, k=length))
 
     def get_value(self, length=MATCH_PASSWORD_LEN):
-        value = self.new_value(length)
-        while Matches.get(uhash=self.match_uhash, password=value):
-            value = self.new_value(length)
-
-        return value
+        # hashes are unique, the password of another
+        # match can not be the same of this one
+        return self.new_value(length)
 
 
 class MatchCode:
     def new_value(self, length):
         return "".join(choices(CODE_POPULATION, k=length))
 
-    def get_code(self, length=MATCH_CODE_LEN):
+    def allocator(self, length):
+        return CodeAllocator(CODE_POPULATION, length, Matches.active_codes)
+
+    def get_code(self, length=MATCH_CODE_LEN, expires=None):
+        value = self.allocator(length).allocate(expires)
+        if value:
+            return value
+
+        # without Redis, look for collisions in the database
         value = self.new_value(length)
         while Matches.active_with_code(value):
             value = self.new_value(length)
 
         return value
 
+    def extend(self, code, expires):
+        self.allocator(len(code)).extend(code, expires)
+
 
 class Matches:
     @classproperty
@@ -281,8 +360,24 @@ class Matches:
         return cls.session.query(Match).count()
 
     @classmethod
-    def get(cls, **filters):
-        return cls.session.query(Match).filter_by(**filters).one_or_none()
+    def with_questions(cls, query):
+        """Load games, questions and answers of the matches
+
+        Each level is loaded with one query, no matter how many
+        rows, so that Match.json does not trigger lazy loads.
+        """
+        return query.options(
+            selectinload(Match.games)
+            .selectinload(Game.questions)
+            .selectinload(Question.answers)
+        )
+
+    @classmethod
+    def get(cls, fresh=False, with_questions=False, **filters):
+        query = cls.session.query(Match).filter_by(**filters)
+        if with_questions:
+            query = cls.with_questions(query)
+        return fresh_query(query, fresh).one_or_none()
 
     @classmethod
     def active_with_code(cls, code):
@@ -292,6 +387,56 @@ class Matches:
             .one_or_none()
         )
 
+    @classmethod
+    def hashes(cls):
+        return cls.session.execute(
+            select(Match.uhash).where(Match.uhash.isnot(None))
+        ).scalars()
+
+    @classmethod
+    def active_codes(cls):
+        return cls.session.execute(
+            select(Match.code, Match.to_time).where(
+                Match.code.isnot(None), Match.to_time > datetime.now()
+            )
+        ).all()
+
     @classmethod
     def all_matches(cls, **filters):
         return cls.session.query(Match).filter_by(**filters).all()
+
+    @classmethod
+    def page(
+        cls, after=None, limit=MATCH_LIST_PAGE_SIZE, with_questions=False, **filters
+    ):
+        """Return the matches following the `after` uid and the next cursor
+
+        The cursor is the uid of the last match returned, None
+        when there are no more matches. Supported filters are
+        `active`, `restricted` and `with_code`.
+        """
+        query = cls.session.query(Match).order_by(Match.uid)
+        if with_questions:
+            query = cls.with_questions(query)
+        if after is not None:
+            query = query.filter(Match.uid > after)
+
+        active = filters.get("active")
+        if active is not None:
+            not_expired = or_(Match.to_time.is_(None), Match.to_time > datetime.now())
+            query = query.filter(not_expired if active else not_(not_expired))
+
+        restricted = filters.get("restricted")
+        if restricted is not None:
+            query = query.filter(Match.is_restricted == restricted)
+
+        with_code = filters.get("with_code")
+        if with_code is not None:
+            query = query.filter(
+                Match.code.isnot(None) if with_code else Match.code.is_(None)
+            )
+
+        # one more row tells whether another page follows
+        matches = query.limit(limit + 1).all()
+        cursor = matches[limit - 1].uid if len(matches) > limit else None
+        return matches[:limit], cursor
@@ -1,14 +1,24 @@
+import random
+import threading
 from datetime import datetime, timezone
 
 import zope.sqlalchemy
+from codechallenge.app import StoreConfig
 from pyramid.authorization import Allow, Everyone
+from pyramid.events import NewRequest
+from pyramid.settings import asbool, aslist
+from pyramid.threadlocal import get_current_request
 from sqlalchemy import Column, DateTime, Integer, engine_from_config
+from sqlalchemy.dialects import mysql, sqlite
 from sqlalchemy.orm import (
+    Session,
     declarative_base,
     declarative_mixin,
     declared_attr,
+    scoped_session,
     sessionmaker,
 )
+from sqlalchemy.sql.dml import UpdateBase
 
 NAMING_CONVENTION = {
     "ix": "ix_%(column_0_label)s",
@@ -29,8 +39,12 @@ def t_now():
 
 @declarative_mixin
 class TableMixin:
+    """Columns shared by all entities
 
-    __mapper_args__ = {"always_refresh": True}
+    Queries reuse the objects already in the identity map. Callers
+    that need the latest rows (i.e. admin edits) must ask for them
+    via the `fresh` flag of the entity helpers or via .refresh()
+    """
 
     uid = Column(Integer, primary_key=True)
     create_timestamp = Column(DateTime(timezone=True), nullable=False, default=t_now)
@@ -53,15 +67,151 @@ class classproperty(property):
         super(classproperty, self).__delete__(type(obj))
 
 
+def fresh_query(query, fresh=False):
+    """Overwrite the identity map state with the loaded rows"""
+    return query.populate_existing() if fresh else query
+
+
+def upsert(session, table, values, keys, update):
+    """Statement inserting values, or updating the row with the same keys
+
+    update(new) maps the columns to set on conflict to their value,
+    `new` being the columns of the values inserted. One statement on
+    MySQL and SQLite, without the race of an UPDATE then INSERT.
+    """
+    if session.get_bind(clause=table.insert()).dialect.name == "mysql":
+        statement = mysql.insert(table).values(values)
+        return statement.on_duplicate_key_update(**update(statement.inserted))
+
+    statement = sqlite.insert(table).values(values)
+    return statement.on_conflict_do_update(
+        index_elements=keys, set_=update(statement.excluded)
+    )
+
+
+def session_scope():
+    """Key of the session in use: one per request and thread
+
+    Outside of a request (scripts, tests) the session is
+    shared by the code running on the same thread.
+    """
+    return threading.get_ident(), id(get_current_request())
+
+
+def get_session_registry(session_factory):
+    return scoped_session(session_factory, scopefunc=session_scope)
+
+
+def bind_request_session(event):
+    """Discard the session of the request once it is served"""
+    registry = event.request.registry["dbsession_registry"]
+    event.request.add_finished_callback(lambda request: registry.remove())
+
+
+# engine arguments that can be set, with the prefix, in the settings
+ENGINE_OPTIONS = {
+    "pool_size": int,
+    "max_overflow": int,
+    "pool_timeout": float,
+    "pool_recycle": int,
+    "pool_pre_ping": asbool,
+    "isolation_level": str,
+}
+
+
+def engine_options(settings, prefix="sqlalchemy."):
+    """Read the engine arguments from the settings
+
+    Only the options that are set are returned, so that
+    the defaults of the pool class of the dialect apply.
+    """
+    options = {}
+    for name, coerce in ENGINE_OPTIONS.items():
+        value = settings.get(f"{prefix}{name}")
+        if value is not None and value != "":
+            options[name] = coerce(value)
+    return options
+
+
 def get_engine(settings, prefix="sqlalchemy."):
     echo = settings.get("echo", False)
     if not cache.get("engine"):
-        cache["engine"] = engine_from_config(settings, echo=echo)
+        # the replicas get their own engines, see get_replica_engines
+        settings = {k: v for k, v in settings.items() if k != f"{prefix}replicas"}
+        cache["engine"] = engine_from_config(
+            settings, prefix=prefix, echo=echo, **engine_options(settings, prefix)
+        )
     return cache["engine"]
 
 
-def get_session_factory(engine):
-    factory = sessionmaker(expire_on_commit=False)
+def get_replica_engines(settings, prefix="sqlalchemy."):
+    """Engines of the read replicas, listed in `sqlalchemy.replicas`"""
+    engines = []
+    for url in aslist(settings.get(f"{prefix}replicas", "")):
+        if not cache.get(url):
+            cache[url] = engine_from_config(
+                {f"{prefix}url": url}, prefix=prefix, **engine_options(settings, prefix)
+            )
+        engines.append(cache[url])
+    return engines
+
+
+class RoutingSession(Session):
+    """Session reading from a replica when the view is read-only
+
+    Views declare it via `read_only=True` (see read_only_view).
+    Once the session writes, it sticks to the primary engine
+    for the rest of its life, that is the request.
+    """
+
+    @property
+    def reads_from_replica(self):
+        return (
+            self.info.get("read_only", False)
+            and not self.info.get("wrote", False)
+            and bool(self.info.get("replicas"))
+        )
+
+    def use_primary(self):
+        """Read from the primary engine for the rest of the session"""
+        self.info["wrote"] = True
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self._flushing or isinstance(clause, UpdateBase):
+            self.info["wrote"] = True
+
+        if not self.reads_from_replica:
+            return super().get_bind(mapper=mapper, clause=clause, **kwargs)
+
+        if "replica" not in self.info:
+            self.info["replica"] = random.choice(self.info["replicas"])
+        return self.info["replica"]
+
+
+def read_only_view(view, info):
+    """Route the reads of the view to the replicas
+
+    Enabled by the `read_only` argument of the view configuration.
+    """
+    if not info.options.get("read_only"):
+        return view
+
+    def wrapper_view(context, request):
+        StoreConfig().session.info["read_only"] = True
+        return view(context, request)
+
+    return wrapper_view
+
+
+read_only_view.options = ("read_only",)
+
+
+def get_session_factory(engine, replicas=()):
+    factory = sessionmaker(
+        class_=RoutingSession,
+        expire_on_commit=False,
+        info={"replicas": list(replicas)},
+    )
     factory.configure(bind=engine)
     return factory
 
@@ -98,7 +248,8 @@ def includeme(config):
     if not dbengine:
         dbengine = get_engine(settings)
 
-    session_factory = get_session_factory(dbengine)
+    config.registry["dbengine"] = dbengine
+    session_factory = get_session_factory(dbengine, get_replica_engines(settings))
     config.registry["dbsession_factory"] = session_factory
 
     # make request.dbsession available for use in Pyramid
@@ -111,6 +262,9 @@ def includeme(config):
         return dbsession
 
     config.add_request_method(dbsession, reify=True)
+    # sessions used by the entities, see StoreConfig.session
+    config.registry["dbsession_registry"] = get_session_registry(session_factory)
+    config.add_subscriber(bind_request_session, NewRequest)
 
 
 class Root:
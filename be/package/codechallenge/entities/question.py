@@ -1,7 +1,7 @@
 from codechallenge.app import StoreConfig
 from codechallenge.constants import QUESTION_TEXT_MAX_LENGTH, URL_LENGTH
 from codechallenge.entities.answer import Answer
-from codechallenge.entities.meta import Base, TableMixin, classproperty
+from codechallenge.entities.meta import Base, TableMixin, classproperty, fresh_query
 from sqlalchemy import Column, ForeignKey, Integer, String, select
 from sqlalchemy.orm import relationship
 from sqlalchemy.schema import UniqueConstraint
@@ -144,5 +144,46 @@ class Questions:
         return cls.session.query(Question).filter(Question.uid.in_(ids))
 
     @classmethod
-    def get(cls, **filters):
-        return cls.session.query(Question).filter_by(**filters).one_or_none()
+    def get(cls, fresh=False, **filters):
+        query = cls.session.query(Question).filter_by(**filters)
+        return fresh_query(query, fresh).one_or_none()
+
+    @classmethod
+    def bulk_create(cls, game_uid, questions, start=0):
+        """Insert the questions of a game together with their answers
+
+        Questions and answers are inserted with one executemany each,
+        the uids of the new questions are read back via their position
+        (unique within the game). Nothing is committed.
+        """
+        if not questions:
+            return []
+
+        positions = range(start, start + len(questions))
+        cls.session.execute(
+            Question.__table__.insert(),
+            [
+                {"game_uid": game_uid, "text": q.get("text"), "position": p}
+                for p, q in zip(positions, questions)
+            ],
+        )
+        rows = cls.session.execute(
+            select(Question.position, Question.uid).where(
+                Question.game_uid == game_uid, Question.position.in_(positions)
+            )
+        )
+        uids = dict(rows.all())
+
+        answers = [
+            {
+                "question_uid": uids[p],
+                "text": a["text"],
+                "position": i,
+                "is_correct": i == 0,
+            }
+            for p, q in zip(positions, questions)
+            for i, a in enumerate(q.get("answers") or [])
+        ]
+        if answers:
+            cls.session.execute(Answer.__table__.insert(), answers)
+        return [uids[p] for p in positions]
@@ -1,7 +1,21 @@
+from sqlalchemy import (
+    Column,
+    Float,
+    ForeignKey,
+    Integer,
+    String,
+    and_,
+    cast,
+    distinct,
+    func,
+    or_,
+    select,
+)
+from sqlalchemy.orm import relationship
+from sqlalchemy.schema import Index
+
 from codechallenge.app import StoreConfig
 from codechallenge.entities.meta import Base, TableMixin, classproperty
-from sqlalchemy import Column, ForeignKey, Integer
-from sqlalchemy.orm import relationship
 
 
 class Ranking(TableMixin, Base):
@@ -15,7 +29,13 @@ class Ranking(TableMixin, Base):
     match_uid = Column(Integer, ForeignKey("matches.uid"))
     match = relationship("Match", backref="rankings")
 
-    score = Column(Integer, nullable=False)
+    # sum of the scores of the reactions, see ReactionScore
+    score = Column(Float, nullable=False)
+
+    __table_args__ = (
+        # plays of a user to a match, best scores of a match
+        Index("ix_rankings_match_uid_user_uid", "match_uid", "user_uid"),
+    )
 
     @property
     def session(self):
@@ -49,3 +69,64 @@ class Rankings:
     @classmethod
     def all(cls):
         return cls.session.query(Ranking).all()
+
+    @classmethod
+    def completed_plays(cls, match_uid, user_uid):
+        """How many times the user played the match to the end"""
+        return cls.session.execute(
+            select(func.count())
+            .select_from(Ranking)
+            .where(Ranking.match_uid == match_uid, Ranking.user_uid == user_uid)
+        ).scalar()
+
+    @classmethod
+    def plays_summary(cls, match_uid):
+        """Return the players, the plays and their total score of the match"""
+        return cls.session.execute(
+            select(
+                func.count(distinct(Ranking.user_uid)),
+                func.count(),
+                func.coalesce(func.sum(Ranking.score), 0),
+            ).where(Ranking.match_uid == match_uid)
+        ).one()
+
+    @classmethod
+    def best_scores(cls, match_uid):
+        """Best score of every user of the match, highest first
+
+        Ties are broken by user uid as a string, descending, the
+        same way Redis orders the members of a sorted set in reverse
+        (i.e. "9" comes before "10").
+        """
+        score = func.max(Ranking.score).label("score")
+        return (
+            cls.session.query(Ranking.user_uid, score)
+            .filter(Ranking.match_uid == match_uid)
+            .group_by(Ranking.user_uid)
+            .order_by(score.desc(), cast(Ranking.user_uid, String).desc())
+        )
+
+    @classmethod
+    def top(cls, match_uid, limit, offset=0):
+        return cls.best_scores(match_uid).limit(limit).offset(offset).all()
+
+    @classmethod
+    def rank_of(cls, match_uid, user_uid):
+        """Position of the user (starting from 0), None if not ranked"""
+        best = cls.best_scores(match_uid).order_by(None).subquery()
+        score = cls.session.execute(
+            select(best.c.score).where(best.c.user_uid == user_uid)
+        ).scalar()
+        if score is None:
+            return
+
+        ahead = or_(
+            best.c.score > score,
+            and_(
+                best.c.score == score,
+                cast(best.c.user_uid, String) > str(user_uid),
+            ),
+        )
+        return cls.session.execute(
+            select(func.count()).select_from(best).where(ahead)
+        ).scalar()
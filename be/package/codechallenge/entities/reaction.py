@@ -2,9 +2,21 @@ from datetime import datetime, timezone
 
 from codechallenge.app import StoreConfig
 from codechallenge.entities.meta import Base, TableMixin, classproperty
-from sqlalchemy import Boolean, Column, DateTime, Float, ForeignKey, Integer
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    Float,
+    ForeignKey,
+    Integer,
+    distinct,
+    func,
+    select,
+    update,
+)
 from sqlalchemy.orm import relationship
-from sqlalchemy.schema import UniqueConstraint
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.schema import Index, UniqueConstraint
 
 
 class Reaction(TableMixin, Base):
@@ -39,7 +51,8 @@ class Reaction(TableMixin, Base):
     q_counter = Column(Integer)
     g_counter = Column(Integer)
 
-    # used to mark reactions of a user when drops out of a match
+    # used to mark reactions of a user when drops out of a match,
+    # and the ones of the completed plays (see Reactions.close_play)
     dirty = Column(Boolean, default=False)
     answer_time = Column(DateTime(timezone=True), nullable=True)
     score = Column(Float)
@@ -48,6 +61,10 @@ class Reaction(TableMixin, Base):
         UniqueConstraint(
             "question_uid", "answer_uid", "user_uid", "match_uid", "create_timestamp"
         ),
+        # reactions of a user to a match (see PlayerStatus)
+        Index("ix_reactions_user_uid_match_uid_uid", "user_uid", "match_uid", "uid"),
+        # players of a match
+        Index("ix_reactions_match_uid_user_uid", "match_uid", "user_uid"),
     )
 
     @property
@@ -69,12 +86,14 @@ class Reaction(TableMixin, Base):
         self.session.commit()
         return self
 
-    def record_answer(self, answer):
+    def record_answer(self, answer, queue=None):
         """Save the answer given by the user
 
         If question is expired discard the answer
         Store the answer for bot, open or timed
-        questions.
+        questions. When a queue is given (write-behind
+        mode) the answer is appended to it instead of
+        being committed.
         """
         response_datetime = datetime.now(tz=timezone.utc)
         if not self.create_timestamp.tzinfo:
@@ -93,16 +112,29 @@ class Reaction(TableMixin, Base):
             return self
 
         rs = ReactionScore(response_time_in_secs, self.question.time, answer.level)
-        self.score = rs.value()
-
-        # TODO to fix. The update_timestamp should be updated via handler
-        self.update_timestamp = response_datetime
+        values = {
+            "score": rs.value(),
+            # TODO to fix. The update_timestamp should be updated via handler
+            "update_timestamp": response_datetime,
+            "answer_time": response_datetime,
+            "answer_uid": self.answer_uid,
+            "open_answer_uid": self.open_answer_uid,
+        }
         if self.question.is_open:
-            self.open_answer_uid = answer.uid
+            values["open_answer_uid"] = answer.uid
         else:
-            self.answer_uid = answer.uid
-        self.answer_time = self.update_timestamp
-        self.session.commit()
+            values["answer_uid"] = answer.uid
+
+        if queue is None:
+            for name, value in values.items():
+                setattr(self, name, value)
+            self.session.commit()
+            return self
+
+        queue.append(self.uid, values)
+        # not flushed by the session, the queue writes them
+        for name, value in values.items():
+            set_committed_value(self, name, value)
         return self
 
     @property
@@ -152,3 +184,47 @@ class Reactions:
         else:
             field = Reaction.uid.desc
         return qs.order_by(field())
+
+    @classmethod
+    def players_count(cls, match_uid):
+        """How many users reacted to the match"""
+        return cls.session.execute(
+            select(func.count(distinct(Reaction.user_uid))).where(
+                Reaction.match_uid == match_uid
+            )
+        ).scalar()
+
+    @classmethod
+    def unanswered_questions(cls, reaction_uids):
+        """Return [(match_uid, question_uid), ...] of the unanswered reactions"""
+        return cls.session.execute(
+            select(Reaction.match_uid, Reaction.question_uid).where(
+                Reaction.uid.in_(reaction_uids), Reaction.answer_time.is_(None)
+            )
+        ).all()
+
+    @classmethod
+    def answers_by_question(cls, match_uid):
+        """Return [(question_uid, answers), ...] of the match"""
+        return cls.session.execute(
+            select(Reaction.question_uid, func.count())
+            .where(Reaction.match_uid == match_uid, Reaction.answer_time.isnot(None))
+            .group_by(Reaction.question_uid)
+        ).all()
+
+    @classmethod
+    def close_play(cls, match_uid, user_uid):
+        """Mark the reactions of the play just completed by the user
+
+        Replays start from a clean status: PlayerStatus skips them.
+        Nothing is committed.
+        """
+        cls.session.execute(
+            update(Reaction.__table__)
+            .where(
+                Reaction.match_uid == match_uid,
+                Reaction.user_uid == user_uid,
+                Reaction.dirty.isnot(True),
+            )
+            .values(dirty=True)
+        )
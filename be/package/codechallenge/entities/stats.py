@@ -0,0 +1,179 @@
+from codechallenge.app import StoreConfig
+from codechallenge.entities.meta import Base, classproperty, upsert
+from codechallenge.entities.ranking import Rankings
+from codechallenge.entities.reaction import Reactions
+from sqlalchemy import Column, Float, ForeignKey, Integer, select, update
+from sqlalchemy.schema import Index
+
+
+class MatchStat(Base):
+    """Counters of the plays of a match, see MatchStats"""
+
+    __tablename__ = "match_stats"
+
+    match_uid = Column(
+        Integer, ForeignKey("matches.uid", ondelete="CASCADE"), primary_key=True
+    )
+    # players with at least a reaction to the match
+    started = Column(Integer, nullable=False, default=0)
+    # players that played the match to the end
+    completed = Column(Integer, nullable=False, default=0)
+    # completed plays and the sum of their scores
+    plays = Column(Integer, nullable=False, default=0)
+    score = Column(Float, nullable=False, default=0)
+
+
+class QuestionStat(Base):
+    """Answers given to a question, see MatchStats"""
+
+    __tablename__ = "question_stats"
+
+    question_uid = Column(
+        Integer, ForeignKey("questions.uid", ondelete="CASCADE"), primary_key=True
+    )
+    match_uid = Column(
+        Integer, ForeignKey("matches.uid", ondelete="CASCADE"), nullable=False
+    )
+    answers = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (Index("ix_question_stats_match_uid", "match_uid"),)
+
+
+class MatchStats:
+    """Counters of the plays of a match, updated as they happen
+
+    The row of a match is built from the reactions and rankings
+    tables when missing (i.e. matches played before the counters)
+    and when reconciled, then every start, answer and completed
+    play updates it with a single statement. Counters are updated
+    after the change they count is committed, but the answers
+    queued by the write-behind mode, counted together with their
+    write (see AnswersWorker): a counter lost in between is
+    corrected by the next rebuild (see play.stats).
+    """
+
+    @classproperty
+    def session(self):
+        return StoreConfig().session
+
+    @classmethod
+    def _update(cls, match_uid, **amounts):
+        table = MatchStat.__table__
+        result = cls.session.execute(
+            update(table)
+            .where(table.c.match_uid == match_uid)
+            .values({name: table.c[name] + n for name, n in amounts.items()})
+        )
+        if result.rowcount == 0:
+            # the rebuilt row already counts the change
+            cls.rebuild(match_uid)
+        cls.session.commit()
+
+    @classmethod
+    def player_started(cls, match_uid):
+        cls._update(match_uid, started=1)
+
+    @classmethod
+    def play_completed(cls, match_uid, user_uid, score):
+        """Count a completed play, and its player at the first one"""
+        amounts = {"plays": 1, "score": score or 0}
+        if Rankings.completed_plays(match_uid, user_uid) == 1:
+            amounts["completed"] = 1
+        cls._update(match_uid, **amounts)
+
+    @classmethod
+    def question_answered(cls, match_uid, question_uid, answers=1, commit=True):
+        table = QuestionStat.__table__
+        cls.session.execute(
+            upsert(
+                cls.session,
+                table,
+                {
+                    "question_uid": question_uid,
+                    "match_uid": match_uid,
+                    "answers": answers,
+                },
+                keys=["question_uid"],
+                update=lambda new: {"answers": table.c.answers + new.answers},
+            )
+        )
+        if commit:
+            cls.session.commit()
+
+    @classmethod
+    def rebuild(cls, match_uid):
+        """Overwrite the counters of the match with the source tables"""
+        # a replica may lag, the counters would keep its values
+        cls.session.use_primary()
+        completed, plays, score = Rankings.plays_summary(match_uid)
+        counters = {
+            "match_uid": match_uid,
+            "started": Reactions.players_count(match_uid),
+            "completed": completed,
+            "plays": plays,
+            "score": float(score),
+        }
+        table = MatchStat.__table__
+        cls.session.execute(
+            upsert(
+                cls.session,
+                table,
+                counters,
+                keys=["match_uid"],
+                update=lambda new: {
+                    name: getattr(new, name) for name in counters if name != "match_uid"
+                },
+            )
+        )
+
+        table = QuestionStat.__table__
+        answers = Reactions.answers_by_question(match_uid)
+        cls.session.execute(table.delete().where(table.c.match_uid == match_uid))
+        if answers:
+            cls.session.execute(
+                table.insert(),
+                [
+                    {"question_uid": q, "match_uid": match_uid, "answers": n}
+                    for q, n in answers
+                ],
+            )
+        return counters
+
+    @classmethod
+    def reconcile(cls, match_uids):
+        """Rebuild the counters of the matches, one transaction each"""
+        for match_uid in match_uids:
+            cls.rebuild(match_uid)
+            cls.session.commit()
+
+    @classmethod
+    def all_match_uids(cls):
+        return cls.session.execute(select(MatchStat.match_uid)).scalars().all()
+
+    @classmethod
+    def of_match(cls, match_uid):
+        """Counters of the match, built at the first read"""
+        row = cls.session.execute(
+            select(MatchStat.__table__).where(MatchStat.match_uid == match_uid)
+        ).first()
+        counters = dict(row._mapping) if row else None
+        if counters is None:
+            counters = cls.rebuild(match_uid)
+            cls.session.commit()
+
+        answers = cls.session.execute(
+            select(QuestionStat.question_uid, QuestionStat.answers).where(
+                QuestionStat.match_uid == match_uid
+            )
+        ).all()
+        plays = counters["plays"]
+        return {
+            "players": {
+                "started": counters["started"],
+                "completed": counters["completed"],
+                "playing": max(counters["started"] - counters["completed"], 0),
+            },
+            "plays": plays,
+            "average_score": round(counters["score"] / plays, 3) if plays else None,
+            "answers": {str(q): n for q, n in answers},
+        }
@@ -1,32 +1,46 @@
-import os
-from hashlib import blake2b
 from uuid import uuid4
 
-import bcrypt
 from codechallenge.app import StoreConfig
 from codechallenge.constants import (
     DIGEST_LENGTH,
-    DIGEST_SIZE,
     EMAIL_MAX_LENGTH,
     KEY_LENGTH,
     PASSWORD_HASH_LENGTH,
     USER_NAME_MAX_LENGTH,
 )
+from codechallenge.digest import digest_service
 from codechallenge.entities import Reaction
-from codechallenge.entities.meta import Base, TableMixin, classproperty
-from sqlalchemy import Boolean, Column, String
+from codechallenge.entities.meta import (
+    Base,
+    TableMixin,
+    classproperty,
+    fresh_query,
+    upsert,
+)
+from codechallenge.passwords import password_hasher
+from sqlalchemy import (
+    Boolean,
+    Column,
+    String,
+    and_,
+    bindparam,
+    or_,
+    select,
+    update,
+)
 from sqlalchemy.ext.hybrid import hybrid_property
 
+# uids of the users changed by a transaction, the identity cache
+# invalidates them once committed (see codechallenge.identity)
+CHANGED_KEY = "changed_users"
+
 
 class WordDigest:
     def __init__(self, word):
         self.word = word
 
     def value(self):
-        key = os.getenv("SIGNED_KEY").encode("utf-8")
-        h = blake2b(key=key, digest_size=DIGEST_SIZE)
-        h.update(self.word.encode("utf-8"))
-        return h.hexdigest()
+        return digest_service().digest(self.word)
 
 
 class UserFactory:
@@ -35,9 +49,6 @@ class UserFactory:
         self.signed = kwargs.pop("signed", None) or self.original_email
         self.kwargs = kwargs
 
-    def exists(self, email_digest, token_digest):
-        return Users.get(email_digest=email_digest, token_digest=token_digest)
-
     def fetch(self):
         email = self.kwargs.get("email")
         if email:
@@ -58,12 +69,12 @@ class UserFactory:
             return User(email=email).save()
 
         token = self.kwargs.get("token", "")
-        email_digest = WordDigest(self.original_email).value()
-        token_digest = WordDigest(token).value()
-        user = self.exists(email_digest, token_digest)
+        user = Users.signed(self.original_email, token)
         if user:
             return user
 
+        email_digest = WordDigest(self.original_email).value()
+        token_digest = WordDigest(token).value()
         user = User()
         user.email = f"{email_digest}@progame.io"
         user.email_digest = email_digest
@@ -97,14 +108,20 @@ class User(TableMixin, Base):
         return self.email_digest is not None
 
     def set_password(self, pw):
-        pwhash = bcrypt.hashpw(pw.encode("utf8"), bcrypt.gensalt())
-        self.password_hash = pwhash.decode("utf8")
+        self.password_hash = password_hasher().hash(pw)
 
     def check_password(self, pw):
-        if self.password_hash is not None:
-            expected_hash = self.password_hash.encode("utf8")
-            return bcrypt.checkpw(pw.encode("utf8"), expected_hash)
-        return False
+        """Verify the password, rehashing it when the hasher changed"""
+        if self.password_hash is None:
+            return False
+
+        hasher = password_hasher()
+        if not hasher.verify(pw, self.password_hash):
+            return False
+
+        if hasher.needs_rehash(self.password_hash):
+            self.set_password(pw)
+        return True
 
     @property
     def session(self):
@@ -130,13 +147,133 @@ class Users:
         return cls.session.query(User).count()
 
     @classmethod
-    def get(cls, **filters):
-        return cls.session.query(User).filter_by(**filters).one_or_none()
+    def get(cls, fresh=False, **filters):
+        query = cls.session.query(User).filter_by(**filters)
+        return fresh_query(query, fresh).one_or_none()
 
     @classmethod
     def all(cls):
         return cls.session.query(User).all()
 
+    @classmethod
+    def bulk_upsert_signed(cls, digests):
+        """Create or update the signed users of (email digests, token digest)
+
+        Email digests are the ones of every key, the current one first
+        (see DigestService.digests) and must not repeat. Users found
+        with any of them are moved to the current key and get the new
+        token digest, as Users.signed does. One select, one insert
+        and one executemany update at most: the insert updates the
+        users created meanwhile (i.e. by a concurrent provisioning).
+        Nothing is committed, the identities of the updated users are
+        invalidated once it is. Return the count of created and
+        updated users.
+        """
+        players = {email_digests[0]: (email_digests, t) for email_digests, t in digests}
+        if not players:
+            return 0, 0
+
+        # digest of any key -> current digest of the player
+        current = {
+            email_digest: email_digests[0]
+            for email_digests, _ in players.values()
+            for email_digest in email_digests
+        }
+        rows = cls.session.execute(
+            select(User.uid, User.email_digest, User.token_digest).where(
+                User.email_digest.in_(current)
+            )
+        ).all()
+        found = {}
+        for uid, email_digest, token_digest in rows:
+            key = current[email_digest]
+            # a user already on the current key wins over an older one
+            if key not in found or email_digest == key:
+                found[key] = (uid, email_digest, token_digest)
+
+        changed = []
+        for key, (uid, email_digest, token_digest) in found.items():
+            new_token = players[key][1]
+            if email_digest != key or token_digest != new_token:
+                changed.append(
+                    {
+                        "user_uid": uid,
+                        "email": f"{key}@progame.io",
+                        "email_digest": key,
+                        "token_digest": new_token,
+                    }
+                )
+        created = [
+            {
+                "email": f"{key}@progame.io",
+                "email_digest": key,
+                "token_digest": token_digest,
+            }
+            for key, (_, token_digest) in players.items()
+            if key not in found
+        ]
+        if created:
+            table = User.__table__
+            cls.session.execute(
+                upsert(
+                    cls.session,
+                    table,
+                    created,
+                    keys=["email"],
+                    update=lambda new: {
+                        "email_digest": new.email_digest,
+                        "token_digest": new.token_digest,
+                    },
+                )
+            )
+        if changed:
+            # Core statements skip the mapper events of the identity cache
+            cls.session.info.setdefault(CHANGED_KEY, set()).update(
+                c["user_uid"] for c in changed
+            )
+            cls.session.execute(
+                update(User.__table__)
+                .where(User.__table__.c.uid == bindparam("user_uid"))
+                .values(
+                    email=bindparam("email"),
+                    email_digest=bindparam("email_digest"),
+                    token_digest=bindparam("token_digest"),
+                ),
+                changed,
+            )
+        return len(created), len(changed)
+
+    @classmethod
+    def signed(cls, email, token):
+        """Return the signed user of email and token, None if missing
+
+        Users digested with a previous key are looked up too and
+        moved to the current key.
+        """
+        service = digest_service()
+        pairs = list(zip(service.digests(email), service.digests(token)))
+        user = (
+            cls.session.query(User)
+            .filter(
+                or_(
+                    *(
+                        and_(User.email_digest == e, User.token_digest == t)
+                        for e, t in pairs
+                    )
+                )
+            )
+            .first()
+        )
+        if user and user.email_digest != pairs[0][0]:
+            user.email_digest, user.token_digest = pairs[0]
+            user.email = f"{user.email_digest}@progame.io"
+            user.save()
+        return user
+
+    @classmethod
+    def users_with_ids(cls, *ids):
+        return cls.session.query(User).filter(User.uid.in_(ids))
+
     @classmethod
     def players_of_match(cls, match_uid):
         return (
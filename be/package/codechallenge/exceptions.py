@@ -12,6 +12,10 @@ class InternalException(BaseException):
     """"""
 
 
+class HasherBusyError(BaseException):
+    """Too many passwords are being hashed, see passwords.PasswordHasher"""
+
+
 class MatchOver(BaseException):
     """"""
 
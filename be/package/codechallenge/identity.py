@@ -0,0 +1,216 @@
+import json
+import logging
+import threading
+from collections import OrderedDict
+from time import monotonic
+
+from codechallenge.app import StoreConfig
+from codechallenge.entities import User
+from codechallenge.entities.user import CHANGED_KEY
+from codechallenge.play.cache import ClientFactory
+from redis.exceptions import RedisError
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = "identity_cache"
+
+
+class Identity:
+    """Fields of the authenticated user, detached from any session"""
+
+    fields = ("uid", "email", "name", "is_admin", "signed")
+
+    def __init__(self, uid, email=None, name=None, is_admin=False, signed=False):
+        self.uid = uid
+        self.email = email
+        self.name = name
+        self.is_admin = is_admin
+        self.signed = signed
+
+    @classmethod
+    def of(cls, user):
+        return cls(**{name: getattr(user, name) for name in cls.fields})
+
+    @property
+    def json(self):
+        return {name: getattr(self, name) for name in self.fields}
+
+
+class LocalBackend:
+    """In-process LRU, with a TTL per entry"""
+
+    name = "local"
+
+    def __init__(self, ttl, maxsize=1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, uid):
+        with self._lock:
+            entry = self._entries.get(uid)
+            if entry is None:
+                return
+
+            expires, identity = entry
+            if expires < monotonic():
+                del self._entries[uid]
+                return
+
+            self._entries.move_to_end(uid)
+            return identity
+
+    def set(self, identity):
+        with self._lock:
+            self._entries[identity.uid] = (monotonic() + self.ttl, identity)
+            self._entries.move_to_end(identity.uid)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, uid):
+        with self._lock:
+            self._entries.pop(uid, None)
+
+
+class RedisBackend:
+    """Identities shared by the processes, expired by Redis"""
+
+    name = "redis"
+    key_prefix = "identity"
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.factory = ClientFactory()
+
+    def key(self, uid):
+        return f"{self.key_prefix}:{uid}"
+
+    def get(self, uid):
+        try:
+            value = self.factory.new_client().get(self.key(uid))
+        except RedisError as e:
+            logger.warning(f"Identity of {uid} not read: {e}")
+            return
+        return Identity(**json.loads(value)) if value else None
+
+    def set(self, identity):
+        try:
+            self.factory.new_client().set(
+                self.key(identity.uid), json.dumps(identity.json), ex=self.ttl
+            )
+        except RedisError as e:
+            logger.warning(f"Identity of {identity.uid} not stored: {e}")
+
+    def delete(self, uid):
+        try:
+            self.factory.new_client().delete(self.key(uid))
+        except RedisError as e:
+            logger.error(f"Identity of {uid} not invalidated: {e}")
+
+
+class IdentityCache:
+    """Identities by user uid, across requests
+
+    Users are read from the database only on a miss. Entries are
+    invalidated when the transaction changing (or deleting) the user
+    commits; with the local backend the other processes still see the
+    previous identity until the TTL expires.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, uid, load):
+        """Return the identity of the user, via load(uid) on a miss"""
+        identity = self.backend.get(uid)
+        if identity is not None:
+            self.hits += 1
+            return identity
+
+        self.misses += 1
+        user = load(uid)
+        if user is None:
+            return
+
+        identity = Identity.of(user)
+        self.backend.set(identity)
+        return identity
+
+    def invalidate(self, uid):
+        self.backend.delete(uid)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+        }
+
+
+def identity_cache():
+    """Cache of the app, None when it is disabled"""
+    registry = getattr(StoreConfig().config, "registry", None)
+    return None if registry is None else registry.get(CACHE_KEY)
+
+
+def user_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(CHANGED_KEY, set()).add(target.uid)
+
+
+def invalidate_changed(session):
+    changed = session.info.pop(CHANGED_KEY, ())
+    cache = identity_cache()
+    if cache is None:
+        return
+
+    for uid in changed:
+        cache.invalidate(uid)
+
+
+def forget_changed(session):
+    session.info.pop(CHANGED_KEY, None)
+
+
+def includeme(config):
+    """
+    Cache the identity of the authenticated users across requests.
+
+    Settings:
+      identity.cache: local (default), redis or none
+      identity.cache.ttl: seconds an identity is kept (default 300)
+      identity.cache.size: identities kept by the local cache (default 1024)
+    """
+    settings = config.get_settings()
+    backend = settings.get("identity.cache", "local")
+    if backend == "none":
+        return
+
+    ttl = int(settings.get("identity.cache.ttl", 300))
+    if backend == "redis":
+        cache = IdentityCache(RedisBackend(ttl))
+    else:
+        size = int(settings.get("identity.cache.size", 1024))
+        cache = IdentityCache(LocalBackend(ttl, maxsize=size))
+    config.registry[CACHE_KEY] = cache
+
+    for name, listener in (
+        ("after_update", user_changed),
+        ("after_delete", user_changed),
+    ):
+        if not event.contains(User, name, listener):
+            event.listen(User, name, listener)
+    for name, listener in (
+        ("after_commit", invalidate_changed),
+        ("after_rollback", forget_changed),
+    ):
+        if not event.contains(Session, name, listener):
+            event.listen(Session, name, listener)
@@ -0,0 +1,333 @@
+import csv
+import json
+from io import TextIOWrapper
+from zipfile import BadZipFile
+
+import yaml
+from codechallenge.constants import IMPORT_CHUNK_SIZE, IMPORT_MAX_ERRORS
+from codechallenge.digest import digest_service
+from codechallenge.entities import Game, Questions, Users
+from codechallenge.play.plan import MatchPlans
+from codechallenge.utils import CompiledValidator
+from codechallenge.validation.syntax import import_question_schema, sign_play_schema
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+
+# errors of a source that can not be read (further)
+SOURCE_ERRORS = (yaml.YAMLError, BadZipFile, InvalidFileException)
+# json and encoding errors are ValueError too
+PLAYERS_SOURCE_ERRORS = (ValueError, csv.Error)
+
+question_validator = CompiledValidator(import_question_schema)
+# players are validated as the ones signing via /play/sign
+player_validator = CompiledValidator(sign_play_schema)
+
+
+def as_question(text, answers):
+    return {
+        "text": text,
+        "answers": [{"text": a} for a in answers or [] if a is not None],
+    }
+
+
+class YamlQuestions:
+    """Questions of a yaml file, parsed one at a time
+
+    The file is read via the parser events, therefore only the
+    question being parsed is held in memory. Both forms are accepted
+    (also across multiple documents)
+
+        questions:
+          - Where is Paris?
+          - answers:
+            - France
+            - Italy
+          - text: Where is Rome?
+            answers:
+              - Italy
+              - France
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def __iter__(self):
+        text = None
+        for item in self._items():
+            if isinstance(item, dict) and "text" in item:
+                yield as_question(item.get("text"), item.get("answers"))
+                text = None
+            elif isinstance(item, dict):
+                yield as_question(text, item.get("answers"))
+                text = None
+            else:
+                text = item
+
+    def _items(self):
+        """Yield the items of every top level `questions` sequence"""
+        events = yaml.parse(self.stream, Loader=yaml.SafeLoader)
+        for event in events:
+            if not isinstance(event, yaml.MappingStartEvent):
+                continue
+
+            for key_event in events:
+                if isinstance(key_event, yaml.MappingEndEvent):
+                    break
+
+                value_event = next(events)
+                is_questions = (
+                    isinstance(key_event, yaml.ScalarEvent)
+                    and key_event.value == "questions"
+                    and isinstance(value_event, yaml.SequenceStartEvent)
+                )
+                if not is_questions:
+                    self._construct(value_event, events)
+                    continue
+
+                for item_event in events:
+                    if isinstance(item_event, yaml.SequenceEndEvent):
+                        break
+                    yield self._construct(item_event, events)
+
+    def _construct(self, event, events):
+        if isinstance(event, yaml.ScalarEvent):
+            is_null = event.implicit[0] and event.value in ("", "~", "null")
+            return None if is_null else event.value
+
+        if isinstance(event, yaml.SequenceStartEvent):
+            result = []
+            for item_event in events:
+                if isinstance(item_event, yaml.SequenceEndEvent):
+                    return result
+                result.append(self._construct(item_event, events))
+
+        if isinstance(event, yaml.MappingStartEvent):
+            result = {}
+            for key_event in events:
+                if isinstance(key_event, yaml.MappingEndEvent):
+                    return result
+                key = self._construct(key_event, events)
+                result[key] = self._construct(next(events), events)
+
+        # aliases are not supported
+        return None
+
+
+class XlsxQuestions:
+    """Questions of the first sheet of a workbook, one per row
+
+    The first row is the header, the following ones hold the text
+    of the question followed by its answers (the correct one first).
+    The workbook is opened in read-only mode, rows are streamed.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def __iter__(self):
+        workbook = load_workbook(self.stream, read_only=True, data_only=True)
+        try:
+            sheet = workbook.worksheets[0]
+            for row in sheet.iter_rows(min_row=2, values_only=True):
+                if not any(cell is not None for cell in row):
+                    continue
+
+                text, answers = row[0], row[1:]
+                yield as_question(
+                    None if text is None else str(text),
+                    [None if a is None else str(a) for a in answers],
+                )
+        finally:
+            workbook.close()
+
+
+class QuestionsImport:
+    """Validate and insert questions into a new game of the match
+
+    Questions are handled in chunks of fixed size, each one inserted
+    in bulk and committed, so the questions held in memory stay
+    bounded whatever the size of the source (the source itself is
+    up to the caller). The game is created with the first chunk,
+    none when every question fails. After every chunk
+    progress(imported, failed) is invoked, when provided.
+    """
+
+    def __init__(self, match, questions, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+        self.match = match
+        self.questions = questions
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+        self.game = None
+
+    @property
+    def session(self):
+        return self.match.session
+
+    def _insert(self, chunk):
+        if not chunk:
+            return
+
+        if self.game is None:
+            self.game = Game(match=self.match, index=self.match.next_game_index)
+            self.session.add(self.game)
+            self.session.flush()
+        Questions.bulk_create(self.game.uid, chunk, start=self.imported)
+        # the questions are inserted without the ORM, see play.plan
+        MatchPlans.changed(self.session, self.match.uid)
+        self.session.commit()
+        self.imported += len(chunk)
+        if self.progress:
+            self.progress(self.imported, self.failed)
+
+    def _reject(self, index, errors):
+        self.failed += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({"index": index, "errors": errors})
+
+    def run(self):
+        v = question_validator.get()
+        chunk = []
+        # index of the question being read, reported when the source breaks
+        next_index = 0
+        try:
+            for index, question in enumerate(self.questions):
+                next_index = index + 1
+                if not v.validate(question):
+                    self._reject(index, v.errors)
+                    continue
+
+                chunk.append(v.document)
+                if len(chunk) == self.chunk_size:
+                    self._insert(chunk)
+                    chunk = []
+        except SOURCE_ERRORS as e:
+            self._reject(next_index, {"data": [str(e)]})
+
+        self._insert(chunk)
+        return {
+            "imported": self.imported,
+            "failed": self.failed,
+            "errors": self.errors,
+        }
+
+
+class CsvPlayers:
+    """Players of a csv file, one (email, token) per row
+
+    The first row is skipped when it is the header (email, token).
+    Rows are read one at a time.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def __iter__(self):
+        text = TextIOWrapper(self.stream, encoding="utf-8-sig", newline="")
+        reader = csv.reader(text)
+        for row in reader:
+            cells = [cell.strip() for cell in row]
+            if not any(cells):
+                continue
+            if reader.line_num == 1 and cells[0].lower() == "email":
+                continue
+
+            cells += [None] * (2 - len(cells))
+            yield {"email": cells[0], "token": cells[1]}
+
+
+class JsonPlayers:
+    """Players of a json list, i.e. [{"email": ..., "token": ...}, ...]"""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def __iter__(self):
+        players = json.load(self.stream)
+        if not isinstance(players, list):
+            raise ValueError("A list of players is expected")
+        yield from players
+
+
+class PlayersImport:
+    """Validate and create (or update) signed players in chunks
+
+    Emails and tokens of each chunk are digested at once, then users
+    are upserted in bulk and committed (see Users.bulk_upsert_signed).
+    An email repeated within a chunk is rejected, a later chunk
+    updates the token again.
+    """
+
+    def __init__(self, players, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+        self.players = players
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+
+    @property
+    def session(self):
+        return Users.session
+
+    def _upsert(self, chunk):
+        if not chunk:
+            return
+
+        service = digest_service()
+        # emails with every key, to find the players signed before a rotation
+        digests = zip(
+            [service.digests(p["email"]) for p in chunk],
+            service.digest_many(p["token"] for p in chunk),
+        )
+        created, updated = Users.bulk_upsert_signed(digests)
+        self.session.commit()
+        self.created += created
+        self.updated += updated
+        if self.progress:
+            self.progress(self.created + self.updated, self.failed)
+
+    def _reject(self, index, errors):
+        self.failed += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({"index": index, "errors": errors})
+
+    def run(self):
+        v = player_validator.get()
+        chunk = []
+        # emails of the chunk, a user is upserted once per chunk
+        emails = set()
+        # index of the row being read, reported when the source breaks
+        next_index = 0
+        try:
+            for index, player in enumerate(self.players):
+                next_index = index + 1
+                if not isinstance(player, dict):
+                    self._reject(index, {"player": ["must be of dict type"]})
+                    continue
+                if not v.validate(player):
+                    self._reject(index, v.errors)
+                    continue
+                if v.document["email"] in emails:
+                    self._reject(index, {"email": ["repeated in the source"]})
+                    continue
+
+                chunk.append(v.document)
+                emails.add(v.document["email"])
+                if len(chunk) == self.chunk_size:
+                    self._upsert(chunk)
+                    chunk = []
+                    emails = set()
+        except PLAYERS_SOURCE_ERRORS as e:
+            self._reject(next_index, {"data": [str(e)]})
+
+        self._upsert(chunk)
+        return {
+            "created": self.created,
+            "updated": self.updated,
+            "failed": self.failed,
+            "errors": self.errors,
+        }
@@ -0,0 +1,181 @@
+import logging
+from time import perf_counter
+
+from pyramid.settings import asbool
+from pyramid.threadlocal import get_current_request
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+STATS_KEY = "codechallenge.query_stats"
+# PoolStats by pool, the engine is created once per process
+cache = {}
+
+
+class QueryStats:
+    """Statements executed while serving one request"""
+
+    def __init__(self, slow_threshold, slowest_size):
+        # seconds after which a statement is logged as slow
+        self.slow_threshold = slow_threshold
+        self.slowest_size = slowest_size
+        self.count = 0
+        self.total = 0.0
+        # [(duration, statement), ...] the slowest first
+        self.slowest = []
+
+    def record(self, statement, duration, route=None):
+        self.count += 1
+        self.total += duration
+        self.slowest.append((duration, statement))
+        self.slowest.sort(key=lambda item: item[0], reverse=True)
+        del self.slowest[self.slowest_size :]
+
+        if duration >= self.slow_threshold:
+            logger.warning(
+                f"Slow query on route {route} ({duration * 1000:.1f} ms): {statement}"
+            )
+
+    def json(self, route=None):
+        return {
+            "route": route,
+            "queries": self.count,
+            "db_time_ms": round(self.total * 1000, 1),
+            "slowest": [
+                {"ms": round(duration * 1000, 1), "statement": statement}
+                for duration, statement in self.slowest
+            ],
+        }
+
+
+class PoolStats:
+    """Usage of a QueuePool, i.e. the one of the MySQL engine"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        # the most connections checked out at the same time
+        self.peak = 0
+        # checkouts that took the last connection available: the
+        # following ones waited for a checkin, up to pool_timeout
+        self.saturated = 0
+
+    @property
+    def limit(self):
+        max_overflow = self.pool._max_overflow
+        return None if max_overflow < 0 else self.pool.size() + max_overflow
+
+    def checkout(self, dbapi_connection, connection_record, connection_proxy):
+        checked_out = self.pool.checkedout()
+        self.peak = max(self.peak, checked_out)
+        if self.limit is not None and checked_out >= self.limit:
+            self.saturated += 1
+
+    def json(self):
+        return {
+            "size": self.pool.size(),
+            "checked_out": self.pool.checkedout(),
+            "overflow": self.pool.overflow(),
+            "peak": self.peak,
+            "saturated": self.saturated,
+        }
+
+
+def pool_stats(pool):
+    """Return the stats of the pool, None if it is not a QueuePool"""
+    if not isinstance(pool, QueuePool):
+        return
+
+    if pool not in cache:
+        cache[pool] = PoolStats(pool)
+        event.listen(pool, "checkout", cache[pool].checkout)
+    return cache[pool]
+
+
+def route_name(request):
+    route = getattr(request, "matched_route", None)
+    return route.name if route else None
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = perf_counter() - conn.info["query_start"].pop()
+    request = get_current_request()
+    if request is None:
+        return
+
+    stats = request.environ.get(STATS_KEY)
+    if stats is not None:
+        stats.record(statement, duration, route=route_name(request))
+
+
+def handle_error(context):
+    # after_cursor_execute is not called for a failed statement
+    connection = context.connection
+    if connection is not None and connection.info.get("query_start"):
+        connection.info["query_start"].pop()
+
+
+def instrument_engine(engine):
+    """Time every statement of the engine, only once"""
+    for name, listener in (
+        ("before_cursor_execute", before_cursor_execute),
+        ("after_cursor_execute", after_cursor_execute),
+        ("handle_error", handle_error),
+    ):
+        if not event.contains(engine, name, listener):
+            event.listen(engine, name, listener)
+
+
+def query_stats_tween_factory(handler, registry):
+    settings = registry.settings
+    with_headers = asbool(settings.get("sql.stats.headers", False))
+    slow_threshold = float(settings.get("sql.slow_query_ms", 500)) / 1000
+    slowest_size = int(settings.get("sql.stats.slowest", 3))
+    engine = registry["dbengine"]
+
+    def query_stats_tween(request):
+        # stored in the environ so that retried requests share it
+        stats = request.environ.setdefault(
+            STATS_KEY, QueryStats(slow_threshold, slowest_size)
+        )
+        response = handler(request)
+
+        summary = stats.json(route=route_name(request))
+        message = (
+            f"route={summary['route']} queries={summary['queries']} "
+            f"db_time_ms={summary['db_time_ms']}"
+        )
+        # engine.pool changes when the engine is disposed
+        pool = pool_stats(engine.pool)
+        if pool:
+            summary["pool"] = pool.json()
+            message += " " + " ".join(
+                f"pool_{k}={v}" for k, v in summary["pool"].items()
+            )
+        logger.info(message, extra={"query_stats": summary})
+        if with_headers:
+            response.headers["X-DB-Queries"] = str(summary["queries"])
+            response.headers["X-DB-Time-Ms"] = str(summary["db_time_ms"])
+        return response
+
+    return query_stats_tween
+
+
+def includeme(config):
+    """
+    Count and time the statements of every request.
+
+    Settings:
+      sql.stats.headers: add X-DB-Queries and X-DB-Time-Ms to responses
+      sql.slow_query_ms: threshold of the slow query log (default 500)
+      sql.stats.slowest: statements kept as the slowest (default 3)
+
+    When the engine uses a QueuePool (MySQL) its usage is logged too,
+    to size sqlalchemy.pool_size against the threads of the server.
+    """
+    instrument_engine(config.registry["dbengine"])
+    config.add_tween("codechallenge.instrumentation.query_stats_tween_factory")
@@ -0,0 +1,172 @@
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+from codechallenge.app import StoreConfig
+from codechallenge.exceptions import HasherBusyError
+from pyramid.settings import aslist
+
+try:
+    import argon2
+except ImportError:  # optional, see the argon2 extra of setup.py
+    argon2 = None
+
+logger = logging.getLogger(__name__)
+
+HASHER_KEY = "password_hasher"
+# used when the app is not configured, e.g. by scripts
+default_hasher = None
+BCRYPT_COST = re.compile(r"^\$2[aby]?\$(\d\d)\$")
+
+
+class BcryptHasher:
+    prefix = "$2"
+
+    def __init__(self, rounds=12):
+        self.rounds = rounds
+
+    def hash(self, password):
+        value = bcrypt.hashpw(password.encode("utf8"), bcrypt.gensalt(self.rounds))
+        return value.decode("utf8")
+
+    def verify(self, password, password_hash):
+        return bcrypt.checkpw(password.encode("utf8"), password_hash.encode("utf8"))
+
+    def needs_rehash(self, password_hash):
+        cost = BCRYPT_COST.match(password_hash)
+        return cost is None or int(cost.group(1)) != self.rounds
+
+
+class Argon2Hasher:
+    """Argon2id, requires the argon2-cffi package (extra "argon2")"""
+
+    prefix = "$argon2"
+
+    def __init__(self, time_cost=3, memory_cost=65536, parallelism=1):
+        if argon2 is None:
+            raise RuntimeError("argon2-cffi is required by the argon2 scheme")
+
+        self.hasher = argon2.PasswordHasher(
+            time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism
+        )
+
+    def hash(self, password):
+        return self.hasher.hash(password)
+
+    def verify(self, password, password_hash):
+        try:
+            return self.hasher.verify(password_hash, password)
+        except (argon2.exceptions.VerificationError, argon2.exceptions.InvalidHash):
+            return False
+
+    def needs_rehash(self, password_hash):
+        return self.hasher.check_needs_rehash(password_hash)
+
+
+class PasswordHasher:
+    """
+    Hash and verify passwords on a dedicated pool of threads
+
+    Hashes are created with the first scheme and verified with the
+    scheme they were created with, so that changing scheme or cost
+    does not lock users out: their hash is replaced at the next
+    login (see User.check_password).
+
+    At most `max_pending` hashes are computed or waiting at once,
+    further ones raise HasherBusyError instead of holding more
+    request threads.
+    """
+
+    def __init__(self, schemes, workers=2, max_pending=4):
+        self.schemes = schemes
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="password-hasher"
+        )
+        self.slots = threading.BoundedSemaphore(max_pending)
+
+    @property
+    def scheme(self):
+        return self.schemes[0]
+
+    def scheme_of(self, password_hash):
+        for scheme in self.schemes:
+            if password_hash.startswith(scheme.prefix):
+                return scheme
+
+    def run(self, fn, *args):
+        if not self.slots.acquire(blocking=False):
+            raise HasherBusyError("Too many passwords being hashed")
+
+        try:
+            return self.executor.submit(fn, *args).result()
+        finally:
+            self.slots.release()
+
+    def hash(self, password):
+        return self.run(self.scheme.hash, password)
+
+    def verify(self, password, password_hash):
+        scheme = self.scheme_of(password_hash)
+        if scheme is None:
+            logger.warning("Password hash of an unknown scheme")
+            return False
+        return self.run(scheme.verify, password, password_hash)
+
+    def needs_rehash(self, password_hash):
+        if self.scheme_of(password_hash) is not self.scheme:
+            return True
+        return self.scheme.needs_rehash(password_hash)
+
+
+def from_settings(settings):
+    schemes = {
+        "bcrypt": lambda: BcryptHasher(
+            rounds=int(settings.get("passwords.bcrypt.rounds", 12))
+        ),
+        "argon2": lambda: Argon2Hasher(
+            time_cost=int(settings.get("passwords.argon2.time_cost", 3)),
+            memory_cost=int(settings.get("passwords.argon2.memory_cost", 65536)),
+            parallelism=int(settings.get("passwords.argon2.parallelism", 1)),
+        ),
+    }
+    names = aslist(settings.get("passwords.schemes", "bcrypt"))
+    return PasswordHasher(
+        [schemes[name]() for name in names],
+        workers=int(settings.get("passwords.workers", 2)),
+        max_pending=int(settings.get("passwords.max_pending", 4)),
+    )
+
+
+def password_hasher():
+    """Hasher of the app, a default one outside of it"""
+    global default_hasher
+
+    registry = getattr(StoreConfig().config, "registry", None)
+    hasher = None if registry is None else registry.get(HASHER_KEY)
+    if hasher is not None:
+        return hasher
+
+    if default_hasher is None:
+        default_hasher = from_settings({})
+    return default_hasher
+
+
+def includeme(config):
+    """
+    Hash the passwords on a bounded pool of threads.
+
+    Settings:
+      passwords.schemes: schemes accepted, the first one hashes the
+        new passwords (bcrypt, argon2; default bcrypt)
+      passwords.bcrypt.rounds: cost of bcrypt (default 12)
+      passwords.argon2.time_cost, passwords.argon2.memory_cost,
+      passwords.argon2.parallelism: parameters of argon2id
+      passwords.workers: threads computing the hashes (default 2)
+      passwords.max_pending: hashes computed or waiting at once,
+        beyond them requests are refused with 503 (default 4); the
+        request threads wait for their hash, keep it well below the
+        threads of the server
+    """
+    config.registry[HASHER_KEY] = from_settings(config.get_settings())
@@ -0,0 +1,228 @@
+import logging
+import os
+from datetime import datetime
+from hashlib import blake2b
+from itertools import product
+
+from codechallenge.play.cache import ClientFactory
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+# give back the expired codes, then pop a free one and reserve it
+# until the expiration of its match, all at once
+ALLOCATE_CODE_SCRIPT = """
+redis.replicate_commands()
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+for _, code in ipairs(expired) do
+    redis.call('SADD', KEYS[1], code)
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+local code = redis.call('SPOP', KEYS[1])
+if code then
+    redis.call('ZADD', KEYS[2], ARGV[2], code)
+end
+return code
+"""
+
+
+class FeistelPermutation:
+    """Keyed bijection of range(size), i.e. a shuffled counter
+
+    A balanced Feistel network over the smallest even number of bits
+    covering size; values out of range are walked through the network
+    again until they fall into it.
+    """
+
+    rounds = 4
+
+    def __init__(self, size, key):
+        self.size = size
+        self.key = key
+        self.half_bits = max((size - 1).bit_length() + 1, 2) // 2
+        self.mask = (1 << self.half_bits) - 1
+
+    def round(self, i, value):
+        h = blake2b(value.to_bytes(8, "big"), key=self.key, digest_size=8)
+        h.update(bytes([i]))
+        return int.from_bytes(h.digest(), "big") & self.mask
+
+    def encrypt(self, value):
+        left, right = value >> self.half_bits, value & self.mask
+        for i in range(self.rounds):
+            left, right = right, left ^ self.round(i, right)
+        return (left << self.half_bits) | right
+
+    def __call__(self, value):
+        value = self.encrypt(value % self.size)
+        while value >= self.size:
+            value = self.encrypt(value)
+        return value
+
+
+def to_word(value, population, length):
+    chars = []
+    for _ in range(length):
+        value, i = divmod(value, len(population))
+        chars.append(population[i])
+    return "".join(reversed(chars))
+
+
+class HashAllocator:
+    """Hand out match hashes from a shuffled counter
+
+    The counter is kept by Redis and shuffled by a keyed permutation,
+    so hashes never repeat and can not be guessed from the previous
+    ones. The hashes already used are kept in a set too: the first
+    allocation loads them from the database (i.e. the ones created
+    before the counter) and each new hash is reserved via SADD.
+    """
+
+    key_prefix = "match_hashes"
+
+    def __init__(self, population, length, in_use):
+        self.population = population
+        self.length = length
+        # callable returning the hashes already in the database
+        self.in_use = in_use
+        self.factory = ClientFactory()
+        key = (os.getenv("SIGNED_KEY") or "").encode("utf-8")
+        self.permutation = FeistelPermutation(
+            len(population) ** length,
+            blake2b(key, person=b"match-hash", digest_size=32).digest(),
+        )
+
+    @property
+    def counter_key(self):
+        return f"{self.key_prefix}:{self.length}:counter"
+
+    @property
+    def used_key(self):
+        return f"{self.key_prefix}:{self.length}:used"
+
+    def _client(self):
+        if not self.factory.enabled:
+            return
+
+        client = self.factory.new_client()
+        try:
+            if not client.exists(self.counter_key):
+                self.populate(client)
+        except RedisError as e:
+            logger.warning(f"Match hashes not available: {e}")
+            return
+        return client
+
+    def populate(self, client):
+        used = [value for value in self.in_use() if value]
+        if used:
+            client.sadd(self.used_key, *used)
+        client.set(self.counter_key, 0, nx=True)
+
+    def allocate(self):
+        """Return a new hash, None without Redis or once all are used"""
+        client = self._client()
+        if client is None:
+            return
+
+        size = self.permutation.size
+        try:
+            for _ in range(size):
+                counter = client.incr(self.counter_key)
+                if counter > size:
+                    # every value of the permutation was handed out
+                    break
+                value = to_word(self.permutation(counter), self.population, self.length)
+                if client.sadd(self.used_key, value):
+                    return value
+        except RedisError as e:
+            logger.warning(f"Match hash not allocated: {e}")
+            return
+        logger.error(f"Match hashes of length {self.length} are exhausted")
+
+
+class CodeAllocator:
+    """Hand out the match codes that are not in use
+
+    The free codes are kept in a set and the ones in use in a sorted
+    set, by expiration of their match: allocating pops a free code
+    after giving back the expired ones. The first allocation reads
+    the codes in use from the database.
+    """
+
+    key_prefix = "match_codes"
+
+    def __init__(self, population, length, in_use):
+        self.population = population
+        self.length = length
+        # callable returning the (code, to_time) of the active matches
+        self.in_use = in_use
+        self.factory = ClientFactory()
+
+    @property
+    def free_key(self):
+        return f"{self.key_prefix}:{self.length}:free"
+
+    @property
+    def reserved_key(self):
+        return f"{self.key_prefix}:{self.length}:reserved"
+
+    def _client(self):
+        if not self.factory.enabled:
+            return
+
+        client = self.factory.new_client()
+        try:
+            if not (client.exists(self.free_key) or client.exists(self.reserved_key)):
+                self.populate(client)
+        except RedisError as e:
+            logger.warning(f"Match codes not available: {e}")
+            return
+        return client
+
+    def populate(self, client):
+        reserved = {code: to_time.timestamp() for code, to_time in self.in_use()}
+        free = [
+            code
+            for code in map("".join, product(self.population, repeat=self.length))
+            if code not in reserved
+        ]
+        pipe = client.pipeline()
+        if free:
+            pipe.sadd(self.free_key, *free)
+        if reserved:
+            pipe.zadd(self.reserved_key, reserved)
+        pipe.execute()
+
+    def allocate(self, expires=None):
+        """Return a code reserved until expires, None if not available
+
+        Without expiration the code is given back with the next
+        allocation, as the code of a match that does not expire is
+        not considered in use.
+        """
+        client = self._client()
+        if client is None:
+            return
+
+        now = datetime.now().timestamp()
+        until = expires.timestamp() if expires else now
+        try:
+            code = client.eval(
+                ALLOCATE_CODE_SCRIPT, 2, self.free_key, self.reserved_key, now, until
+            )
+        except RedisError as e:
+            logger.warning(f"Match code not allocated: {e}")
+            return
+        return code.decode() if code else None
+
+    def extend(self, code, expires):
+        """Update the expiration of a code still reserved"""
+        client = self._client()
+        if client is None or not expires:
+            return
+
+        try:
+            client.zadd(self.reserved_key, {code: expires.timestamp()}, xx=True)
+        except RedisError as e:
+            logger.error(f"Expiration of code {code} not updated: {e}")
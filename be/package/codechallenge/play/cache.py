@@ -1,14 +1,17 @@
-import os
-
+from codechallenge.app import REDIS_CONF, StoreConfig
+from pyramid.settings import asbool
 from redis import Redis
 
 
 class ClientFactory:
     _client = None
 
+    @property
+    def enabled(self):
+        """Redis is opt-in, via the redis.enabled setting"""
+        return asbool(StoreConfig().settings.get("redis.enabled", False))
+
     def new_client(self):
-        if self._client is None:
-            self._client = Redis(
-                **{"host": "redis", "port": "6379", "password": os.getenv("REDIS_PW")}
-            )
-        return self._client
+        if ClientFactory._client is None:
+            ClientFactory._client = Redis(**REDIS_CONF)
+        return ClientFactory._client
@@ -0,0 +1,112 @@
+import logging
+
+from codechallenge.entities import Rankings
+from codechallenge.play.cache import ClientFactory
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+# keep the highest score of the user, whatever the version of Redis
+# (ZADD GT requires 6.2)
+KEEP_BEST_SCRIPT = """
+local current = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if (not current) or tonumber(ARGV[2]) > tonumber(current) then
+    return redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+end
+return 0
+"""
+
+
+class Leaderboard:
+    """Best score of each user of a match, highest first
+
+    Backed by a sorted set per match: top(), rank() and around()
+    run in O(log n) plus the size of the page. The set is rebuilt
+    from the rankings table when missing (i.e. cold start), while
+    without Redis the same results are read via SQL.
+    """
+
+    key_prefix = "leaderboard"
+
+    def __init__(self, match_uid):
+        self.match_uid = match_uid
+        self.factory = ClientFactory()
+
+    @property
+    def key(self):
+        return f"{self.key_prefix}:{self.match_uid}"
+
+    def _client(self):
+        """Return the client once the set is populated, None without Redis"""
+        if not self.factory.enabled:
+            return
+
+        client = self.factory.new_client()
+        try:
+            if not client.exists(self.key):
+                self.rebuild(client)
+        except RedisError as e:
+            logger.warning(f"Leaderboard of {self.match_uid} not available: {e}")
+            return
+        return client
+
+    def rebuild(self, client):
+        scores = {
+            user_uid: score
+            for user_uid, score in Rankings.best_scores(self.match_uid).all()
+        }
+        if scores:
+            client.zadd(self.key, scores)
+
+    def add(self, user_uid, score):
+        client = self._client()
+        if client is None:
+            return
+
+        try:
+            client.eval(KEEP_BEST_SCRIPT, 1, self.key, user_uid, score)
+        except RedisError as e:
+            logger.error(f"Score of {user_uid} not added to {self.key}: {e}")
+
+    def top(self, limit, offset=0):
+        """Return [(rank, user_uid, score), ...] of the requested page"""
+        client = self._client()
+        try:
+            if client is not None:
+                entries = client.zrevrange(
+                    self.key, offset, offset + limit - 1, withscores=True
+                )
+                entries = [(int(member), float(score)) for member, score in entries]
+                return self._ranked(entries, offset)
+        except RedisError as e:
+            logger.warning(f"Leaderboard of {self.match_uid} not read: {e}")
+
+        return self._ranked(Rankings.top(self.match_uid, limit, offset), offset)
+
+    def _ranked(self, entries, offset):
+        return [
+            (offset + i, user_uid, score) for i, (user_uid, score) in enumerate(entries)
+        ]
+
+    def rank(self, user_uid):
+        """Position of the user starting from 0, None if not ranked"""
+        client = self._client()
+        try:
+            if client is not None:
+                return client.zrevrank(self.key, user_uid)
+        except RedisError as e:
+            logger.warning(f"Leaderboard of {self.match_uid} not read: {e}")
+
+        return Rankings.rank_of(self.match_uid, user_uid)
+
+    def around(self, user_uid, limit):
+        """Page of `limit` entries with the user in the middle
+
+        Return the rank of the user and the page, that is empty
+        when the user is not ranked.
+        """
+        rank = self.rank(user_uid)
+        if rank is None:
+            return None, []
+
+        return rank, self.top(limit, offset=max(rank - limit // 2, 0))
@@ -0,0 +1,189 @@
+import json
+import logging
+from itertools import chain
+
+from codechallenge.constants import MATCH_PLAN_TTL
+from codechallenge.entities import Answer, Game, Match, Question
+from codechallenge.play.cache import ClientFactory
+from redis.exceptions import RedisError
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# uids of the matches changed by a transaction, invalidated once committed
+CHANGED_KEY = "changed_plans"
+
+
+class MatchPlan:
+    """Precompiled and immutable structure of a match
+
+    It stores the order in which games and questions are
+    played, the json of every question and the uids of the
+    answers valid for each question.
+    """
+
+    def __init__(self, match_uid, games, questions, answers):
+        self.match_uid = match_uid
+        # games: [[game_uid, [question_uid, ...]], ...] in play order
+        self._games = tuple((g_uid, tuple(q_uids)) for g_uid, q_uids in games)
+        self._questions = {int(k): v for k, v in questions.items()}
+        self._answers = {int(k): frozenset(v) for k, v in answers.items()}
+
+    @classmethod
+    def compile(cls, match):
+        games = []
+        questions = {}
+        answers = {}
+        for game in match.ordered_games if match.order else match.games:
+            game_questions = game.ordered_questions if game.order else game.questions
+            games.append([game.uid, [q.uid for q in game_questions]])
+            for question in game_questions:
+                questions[question.uid] = question.json
+                answers[question.uid] = [a.uid for a in question.answers]
+
+        return cls(match.uid, games, questions, answers)
+
+    @classmethod
+    def from_json(cls, value):
+        data = json.loads(value)
+        return cls(data["match"], data["games"], data["questions"], data["answers"])
+
+    def to_json(self):
+        return json.dumps(
+            {
+                "match": self.match_uid,
+                "games": [[g_uid, list(q_uids)] for g_uid, q_uids in self._games],
+                "questions": self._questions,
+                "answers": {k: sorted(v) for k, v in self._answers.items()},
+            }
+        )
+
+    @property
+    def game_ids(self):
+        return tuple(g_uid for g_uid, _ in self._games)
+
+    def question_ids(self, game_uid):
+        for g_uid, q_uids in self._games:
+            if g_uid == game_uid:
+                return q_uids
+        return ()
+
+    def question_json(self, question_uid):
+        return self._questions.get(question_uid)
+
+    def answer_ids(self, question_uid):
+        return self._answers.get(question_uid, frozenset())
+
+    def is_valid_answer(self, question_uid, answer_uid):
+        return answer_uid in self.answer_ids(question_uid)
+
+
+class MatchPlans:
+    key_prefix = "match-plan"
+
+    @classmethod
+    def key(cls, match_uid):
+        return f"{cls.key_prefix}:{match_uid}"
+
+    @classmethod
+    def get(cls, match):
+        """Return the plan of the match from the cache
+
+        On a miss the plan is compiled and stored. None is
+        returned when Redis is not enabled so that callers
+        fall back to the ORM relationships.
+        """
+        factory = ClientFactory()
+        if not factory.enabled:
+            return
+
+        client = factory.new_client()
+        try:
+            value = client.get(cls.key(match.uid))
+        except RedisError as e:
+            logger.warning(f"Match plan of {match.uid} not read: {e}")
+            return
+
+        if value is not None:
+            return MatchPlan.from_json(value)
+
+        plan = MatchPlan.compile(match)
+        try:
+            client.set(cls.key(match.uid), plan.to_json(), ex=MATCH_PLAN_TTL)
+        except RedisError as e:
+            logger.warning(f"Match plan of {match.uid} not stored: {e}")
+        return plan
+
+    @classmethod
+    def changed(cls, session, match_uid):
+        """Invalidate the plan of the match once the session commits"""
+        session.info.setdefault(CHANGED_KEY, set()).add(match_uid)
+
+    @classmethod
+    def invalidate(cls, match_uid):
+        factory = ClientFactory()
+        if not factory.enabled or match_uid is None:
+            return
+
+        try:
+            factory.new_client().delete(cls.key(match_uid))
+        except RedisError as e:
+            logger.error(f"Match plan of {match_uid} not invalidated: {e}")
+
+
+def plans_changed(session, flush_context):
+    """Collect the matches whose games, questions or answers are flushed"""
+    if not ClientFactory().enabled:
+        return
+
+    match_uids, game_uids, question_uids = set(), set(), set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Match):
+            match_uids.add(obj.uid)
+        elif isinstance(obj, Game):
+            match_uids.add(obj.match_uid)
+        elif isinstance(obj, Question):
+            game_uids.add(obj.game_uid)
+        elif isinstance(obj, Answer):
+            question_uids.add(obj.question_uid)
+
+    question_uids.discard(None)
+    if question_uids:
+        game_uids.update(
+            session.execute(
+                select(Question.game_uid).where(Question.uid.in_(question_uids))
+            ).scalars()
+        )
+    game_uids.discard(None)
+    if game_uids:
+        match_uids.update(
+            session.execute(
+                select(Game.match_uid).where(Game.uid.in_(game_uids))
+            ).scalars()
+        )
+    for match_uid in match_uids - {None}:
+        MatchPlans.changed(session, match_uid)
+
+
+def invalidate_changed(session):
+    for match_uid in session.info.pop(CHANGED_KEY, ()):
+        MatchPlans.invalidate(match_uid)
+
+
+def forget_changed(session):
+    session.info.pop(CHANGED_KEY, None)
+
+
+def includeme(config):
+    """
+    Invalidate the cached plans once the changes to their matches
+    are committed, a rollback leaves them in place.
+    """
+    for name, listener in (
+        ("after_flush", plans_changed),
+        ("after_commit", invalidate_changed),
+        ("after_rollback", forget_changed),
+    ):
+        if not event.contains(Session, name, listener):
+            event.listen(Session, name, listener)
@@ -1,4 +1,12 @@
-from codechallenge.entities import Ranking, Reaction, Reactions
+from codechallenge.entities import (
+    Game,
+    MatchStats,
+    Question,
+    Ranking,
+    Rankings,
+    Reaction,
+    Reactions,
+)
 from codechallenge.exceptions import (
     GameError,
     GameOver,
@@ -6,39 +14,113 @@ from codechallenge.exceptions import (
     MatchNotPlayableError,
     MatchOver,
 )
+from codechallenge.play.leaderboard import Leaderboard
+from codechallenge.play.write_behind import answers_queue, merge_pending
+from sqlalchemy.orm import joinedload
+
+
+class PlayOrder:
+    """Uids in play order together with the ones already played
+
+    The played uids are kept in a set and the position of the
+    next candidate in a cursor, therefore next(), previous() and
+    is_last run in constant (amortised) time.
+    """
+
+    def __init__(self, uids, played_ids):
+        self.uids = tuple(uids)
+        self._positions = {uid: i for i, uid in enumerate(self.uids)}
+        # played_ids are ordered based on their play order
+        self.played_ids = list(played_ids)
+        self._played = set(self.played_ids)
+        # played_ids might include uids of other games
+        self._played_count = sum(1 for uid in self._played if uid in self)
+        self._cursor = 0
+
+    def __contains__(self, uid):
+        return uid in self._positions
+
+    def __len__(self):
+        return len(self.uids)
+
+    def next(self):
+        while self._cursor < len(self.uids):
+            uid = self.uids[self._cursor]
+            self._cursor += 1
+            if uid not in self._played:
+                self._played.add(uid)
+                self.played_ids.append(uid)
+                self._played_count += 1
+                return uid
+
+    def previous(self):
+        if len(self.played_ids) < 2:
+            return
+
+        uid = self.played_ids[-2]
+        if uid in self:
+            return uid
+
+    @property
+    def is_last(self):
+        return self._played_count == len(self.uids)
 
 
 class QuestionFactory:
-    def __init__(self, game, *displayed_ids):
+    def __init__(self, game, *displayed_ids, plan=None):
         self._game = game
-        # displayed_ids are ordered based on their display order
-        self.displayed_ids = displayed_ids
+        self._displayed_ids = displayed_ids
         self._question = None
+        self._plan = plan
+        self._order = None
+        self._questions = {}
+
+    @property
+    def order(self):
+        """Build the play order once, on first use
+
+        When the match plan is available the relationships are not
+        walked: only the uids are known and each question is loaded
+        when it is returned.
+        """
+        if self._order is None:
+            if self._plan:
+                uids = self._plan.question_ids(self._game.uid)
+            else:
+                questions = (
+                    self._game.ordered_questions
+                    if self._game.order
+                    else self._game.questions
+                )
+                self._questions = {q.uid: q for q in questions}
+                uids = [q.uid for q in questions]
+            self._order = PlayOrder(uids, self._displayed_ids)
+        return self._order
+
+    @property
+    def displayed_ids(self):
+        return self.order.played_ids
+
+    def _load(self, uid):
+        question = self._questions.get(uid)
+        if question is None:
+            question = self._game.session.get(Question, uid)
+        return question
 
     def next(self):
-        questions = (
-            self._game.ordered_questions if self._game.order else self._game.questions
-        )
-        for q in questions:
-            if q.uid not in self.displayed_ids:
-                self._question = q
-                self.displayed_ids += (q.uid,)
-                return q
+        uid = self.order.next()
+        if uid is None:
+            raise GameOver(f"Game {self._game.uid} has no questions")
 
-        raise GameOver(f"Game {self._game.uid} has no questions")
+        self._question = self._load(uid)
+        return self._question
 
     def previous(self):
         # remember that the reaction is not deleted
-        questions = (
-            self._game.ordered_questions if self._game.order else self._game.questions
-        )
-        for q in questions:
-            if not self._question or len(self.displayed_ids) == 1:
-                continue
-
-            if q.uid == self.displayed_ids[-2]:
-                self._question = q
-                return q
+        uid = self.order.previous() if self._question else None
+        if uid is not None:
+            self._question = self._load(uid)
+            return self._question
 
         msg = (
             "No questions were displayed"
@@ -53,37 +135,57 @@ class QuestionFactory:
 
     @property
     def is_last_question(self):
-        questions = (
-            self._game.ordered_questions if self._game.order else self._game.questions
-        )
-        return len(self.displayed_ids) == len(questions)
+        return self.order.is_last
 
 
 class GameFactory:
-    def __init__(self, match, *played_ids):
+    def __init__(self, match, *played_ids, plan=None):
         self._match = match
-        self.played_ids = played_ids
+        self._played_ids = played_ids
         self._game = None
+        self._plan = plan
+        self._order = None
+        self._games = {}
+
+    @property
+    def order(self):
+        if self._order is None:
+            if self._plan:
+                uids = self._plan.game_ids
+            else:
+                games = (
+                    self._match.ordered_games
+                    if self._match.order
+                    else self._match.games
+                )
+                self._games = {g.uid: g for g in games}
+                uids = [g.uid for g in games]
+            self._order = PlayOrder(uids, self._played_ids)
+        return self._order
+
+    @property
+    def played_ids(self):
+        return self.order.played_ids
+
+    def _load(self, uid):
+        game = self._games.get(uid)
+        if game is None:
+            game = self._match.session.get(Game, uid)
+        return game
 
     def next(self):
-        games = self._match.ordered_games if self._match.order else self._match.games
-        for g in games:
-            if g.uid not in self.played_ids:
-                self.played_ids += (g.uid,)
-                self._game = g
-                return g
+        uid = self.order.next()
+        if uid is None:
+            raise MatchOver(f"Match {self._match.name}")
 
-        raise MatchOver(f"Match {self._match.name}")
+        self._game = self._load(uid)
+        return self._game
 
     def previous(self):
-        games = self._match.ordered_games if self._match.order else self._match.games
-        for g in games:
-            if not self._game or len(self.played_ids) == 1:
-                continue
-
-            if g.uid == self.played_ids[-2]:
-                self._game = g
-                return g
+        uid = self.order.previous() if self._game else None
+        if uid is not None:
+            self._game = self._load(uid)
+            return self._game
 
         msg = (
             "No game were played" if not self.played_ids else "Only one game was played"
@@ -100,50 +202,85 @@ class GameFactory:
 
     @property
     def is_last_game(self):
-        games = self._match.ordered_games if self._match.order else self._match.games
-        return len(self.played_ids) == len(games)
+        return self.order.is_last
 
 
 class PlayerStatus:
+    """Snapshot of the reactions of a user to the current play of a match
+
+    The reactions of the completed plays are skipped (see
+    Reactions.close_play). Reactions are loaded once, together with their question
+    and game, and every accessor is served from memory for
+    the rest of the request. Reactions created meanwhile
+    must be registered via .add_reaction()
+    """
+
     def __init__(self, user, match):
         self._user = user
         self._current_match = match
+        self._reactions = None
 
     @property
     def _all_reactions_query(self):
-        return Reactions.all_reactions_of_user_to_match(
-            self._user, self._current_match
+        return (
+            Reactions.all_reactions_of_user_to_match(self._user, self._current_match)
+            .filter(Reaction.dirty.isnot(True))
+            .options(joinedload(Reaction.question), joinedload(Reaction.game))
         )  # .filter_by(_answer=None)
 
     def all_reactions(self):
-        return self._all_reactions_query.all()  # TODO to fix: or _open_answer=None
+        if self._reactions is None:
+            # TODO to fix: or _open_answer=None
+            self._reactions = merge_pending(self._all_reactions_query.all())
+        return self._reactions
+
+    def add_reaction(self, reaction):
+        # reactions are ordered from the most recent
+        self._reactions = [reaction] + self.all_reactions()
+
+    def refresh(self):
+        self._reactions = None
+        return self
+
+    def last_unanswered_reaction(self):
+        for r in self.all_reactions():
+            if r.answer_uid is None:
+                return r
 
     def questions_displayed(self):
-        return {r.question.uid: r.question for r in self._all_reactions_query.all()}
+        return {r.question.uid: r.question for r in self.all_reactions()}
 
     def questions_displayed_by_game(self, game):
         return {
             r.question.uid: r.question
-            for r in self._all_reactions_query.all()
+            for r in self.all_reactions()
             if r.game.uid == game.uid
         }
 
     def all_games_played(self):
-        return {r.game.uid: r.game for r in self._all_reactions_query.all()}
+        return {r.game.uid: r.game for r in self.all_reactions()}
 
     def current_score(self):
         return sum([r.score for r in self.all_reactions()])
 
+    def is_new_player(self):
+        """No reactions to the match, in this play nor in a completed one"""
+        return not self.all_reactions() and not Rankings.completed_plays(
+            self._current_match.uid, self._user.uid
+        )
+
     @property
     def match(self):
         return self._current_match
 
 
 class SinglePlayer:
-    def __init__(self, status, user, match):
+    def __init__(self, status, user, match, plan=None):
         self._status = status
         self._user = user
         self._match = match
+        # the match plan (when cached) replaces the ORM walk
+        self._plan = plan
 
         self._game_factory = None
         self._question_factory = None
@@ -151,7 +288,6 @@ class SinglePlayer:
 
     def start(self):
         self._match.refresh()
-        # TODO to fix
         if self._match.left_attempts(self._user) == 0:
             raise MatchNotPlayableError(
                 f"User {self._user.email} has no left attempts for Match {self._match.name}"
@@ -160,20 +296,26 @@ class SinglePlayer:
         if not self._match.is_active:
             raise MatchError("Expired match")
 
-        self._game_factory = GameFactory(self._match, *self._status.all_games_played())
+        self._game_factory = GameFactory(
+            self._match, *self._status.all_games_played(), plan=self._plan
+        )
         game = self._game_factory.next()
 
         self._question_factory = QuestionFactory(
-            game, *self._status.questions_displayed()
+            game, *self._status.questions_displayed(), plan=self._plan
         )
         question = self._question_factory.next()
 
+        first = self._status.is_new_player()
         self._current_reaction = Reaction(
             match_uid=self._match.uid,
             user_uid=self._user.uid,
             game_uid=game.uid,
             question_uid=question.uid,
         ).save()
+        self._status.add_reaction(self._current_reaction)
+        if first:
+            MatchStats.player_started(self._match.uid)
 
         return question
 
@@ -197,21 +339,22 @@ class SinglePlayer:
         return self._status.total_score()
 
     def last_reaction(self, question):
-        reactions = Reactions.all_reactions_of_user_to_match(
-            self._user, self._match
-        ).filter_by(
-            _answer=None
-        )  # TODO to fix: or _open_answer=None
+        # TODO to fix: or _open_answer=None
+        reaction = self._status.last_unanswered_reaction()
+        if reaction:
+            return reaction
 
-        if reactions.count() > 0:
-            return reactions.first()
-
-        return Reaction(
+        first = self._status.is_new_player()
+        reaction = Reaction(
             match_uid=self._match.uid,
             question_uid=question.uid,
             game_uid=question.game.uid,
             user_uid=self._user.uid,
         ).save()
+        self._status.add_reaction(reaction)
+        if first:
+            MatchStats.player_started(self._match.uid)
+        return reaction
 
     @property
     def match_can_be_resumed(self):
@@ -232,14 +375,22 @@ class SinglePlayer:
         if not self._current_reaction:
             self._current_reaction = self.last_reaction(answer.question)
             self._game_factory = GameFactory(
-                self._match, *self._status.all_games_played()
+                self._match, *self._status.all_games_played(), plan=self._plan
             )
 
             self._question_factory = QuestionFactory(
-                self._current_reaction.game, *self._status.questions_displayed()
+                self._current_reaction.game,
+                *self._status.questions_displayed(),
+                plan=self._plan,
             )
 
-        self._current_reaction.record_answer(answer)
+        reaction = self._current_reaction
+        answered = reaction.answer_time is not None
+        queue = answers_queue()
+        reaction.record_answer(answer, queue=queue)
+        # queued answers are counted once written, see AnswersWorker
+        if queue is None and not answered and reaction.answer_time is not None:
+            MatchStats.question_answered(self._match.uid, reaction.question_uid)
         question = self.forward()
         return question
 
@@ -253,10 +404,15 @@ class SinglePlayer:
         except GameOver:
             game = self._game_factory.next()
             self._question_factory = QuestionFactory(
-                game, *self._status.questions_displayed()
+                game, *self._status.questions_displayed(), plan=self._plan
             )
             return self._question_factory.next()
 
+    def question_json(self, question):
+        if self._plan:
+            return self._plan.question_json(question.uid)
+        return question.json
+
 
 class PlayScore:
     def __init__(self, match_uid, user_uid, score):
@@ -265,6 +421,11 @@ class PlayScore:
         self.score = score
 
     def save_to_ranking(self):
-        return Ranking(
+        # committed together with the ranking
+        Reactions.close_play(self.match_uid, self.user_uid)
+        ranking = Ranking(
             match_uid=self.match_uid, user_uid=self.user_uid, score=self.score
         ).save()
+        Leaderboard(self.match_uid).add(self.user_uid, self.score)
+        MatchStats.play_completed(self.match_uid, self.user_uid, self.score)
+        return ranking
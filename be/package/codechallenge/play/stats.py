@@ -0,0 +1,66 @@
+import logging
+import threading
+
+from codechallenge.app import StoreConfig
+from codechallenge.entities.stats import MatchStats
+from pyramid.settings import asbool
+
+logger = logging.getLogger(__name__)
+
+RECONCILER_KEY = "match_stats_reconciler"
+
+
+class StatsReconciler(threading.Thread):
+    """Rebuild the match stats from the source tables, every `interval` seconds
+
+    Counters drift when an update is lost (e.g. the process stops
+    between the commit of a play and the one of its counter),
+    reconciling brings them back to the reactions and rankings
+    tables. Answers still queued by the write-behind mode are not in
+    the reactions table yet: they are counted when written, unless
+    their batch commits while a match is being rebuilt, which is then
+    corrected by the next reconciliation.
+    """
+
+    def __init__(self, interval):
+        super().__init__(name="match-stats-reconciler", daemon=True)
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def reconcile(self):
+        """Rebuild the stats of every match, return how many were rebuilt"""
+        session = StoreConfig().session
+        try:
+            match_uids = MatchStats.all_match_uids()
+            MatchStats.reconcile(match_uids)
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Match stats not reconciled: {e}")
+            return 0
+        return len(match_uids)
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.reconcile()
+
+    def stop(self):
+        self._stopped.set()
+
+
+def includeme(config):
+    """
+    Reconcile the match stats in background, opt-in.
+
+    Settings:
+      match_stats.reconcile: enable the reconciliation
+      match_stats.reconcile_interval: seconds between two (default 3600)
+    """
+    settings = config.get_settings()
+    if not asbool(settings.get("match_stats.reconcile", False)):
+        return
+
+    reconciler = StatsReconciler(
+        float(settings.get("match_stats.reconcile_interval", 3600))
+    )
+    config.registry[RECONCILER_KEY] = reconciler
+    reconciler.start()
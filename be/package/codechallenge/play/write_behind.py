@@ -0,0 +1,263 @@
+import atexit
+import json
+import logging
+import os
+import threading
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone
+
+from codechallenge.app import StoreConfig
+from codechallenge.entities import MatchStats, Reaction, Reactions
+from pyramid.settings import asbool
+from sqlalchemy import bindparam, update
+from sqlalchemy.orm.attributes import set_committed_value
+
+logger = logging.getLogger(__name__)
+
+QUEUE_KEY = "answers_queue"
+WORKER_KEY = "answers_worker"
+
+
+def encode(values):
+    return {
+        name: value.timestamp() if isinstance(value, datetime) else value
+        for name, value in values.items()
+    }
+
+
+def decode(values):
+    return {
+        name: (
+            datetime.fromtimestamp(value, tz=timezone.utc)
+            if name in ("answer_time", "update_timestamp") and value is not None
+            else value
+        )
+        for name, value in values.items()
+    }
+
+
+class AnswersQueue:
+    """Answers recorded but not yet written to the reactions table
+
+    Every answer is appended (and synced) to a file before being
+    acknowledged, so that the ones not written are replayed after
+    a restart. The file is emptied whenever the queue is drained,
+    and rewritten with the pending entries only once it is larger
+    than `compact_size` bytes and mostly made of written ones.
+    Answers are kept in memory too, by reaction uid, so that read
+    paths can merge them (see merge_pending).
+    """
+
+    def __init__(self, path, fsync=True, compact_size=1 << 20):
+        self.path = path
+        self.fsync = fsync
+        self.compact_size = compact_size
+        self._lock = threading.Lock()
+        self._pending = OrderedDict()
+        # bytes of the file, and of the lines of the pending entries
+        self._size = 0
+        self._live = 0
+        self._lines = {}
+        self._replay()
+        self._file = open(self.path, "ab")
+
+    def _replay(self):
+        if not os.path.exists(self.path):
+            return
+
+        valid_size = 0
+        with open(self.path, "rb") as fp:
+            for line in fp:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # write interrupted by a crash
+                    break
+                self._keep(entry, len(line))
+                valid_size += len(line)
+
+        os.truncate(self.path, valid_size)
+        self._size = valid_size
+        if self._pending:
+            logger.info(f"{len(self._pending)} answers replayed from {self.path}")
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _keep(self, entry, length):
+        reaction_uid = entry["reaction_uid"]
+        self._pending.pop(reaction_uid, None)
+        self._pending[reaction_uid] = entry
+        self._live += length - self._lines.get(reaction_uid, 0)
+        self._lines[reaction_uid] = length
+
+    def _write(self, fp, data):
+        fp.write(data)
+        fp.flush()
+        if self.fsync:
+            os.fsync(fp.fileno())
+
+    def _compact(self):
+        """Rewrite the file with the pending entries only"""
+        temp_path = f"{self.path}.compact"
+        with open(temp_path, "wb") as fp:
+            self._write(
+                fp,
+                b"".join(
+                    json.dumps(entry).encode() + b"\n"
+                    for entry in self._pending.values()
+                ),
+            )
+        # atomic: a crash leaves either file, both replay the same answers
+        os.replace(temp_path, self.path)
+        self._file.close()
+        self._file = open(self.path, "ab")
+        self._size = self._live
+
+    def append(self, reaction_uid, values):
+        entry = {"reaction_uid": reaction_uid, **encode(values)}
+        line = json.dumps(entry).encode() + b"\n"
+        with self._lock:
+            self._write(self._file, line)
+            self._size += len(line)
+            self._keep(entry, len(line))
+
+    def get(self, reaction_uid):
+        entry = self._pending.get(reaction_uid)
+        if entry is None:
+            return
+
+        values = dict(entry)
+        values.pop("reaction_uid")
+        return decode(values)
+
+    def take(self, limit):
+        """Return the oldest entries, they stay pending until ack()"""
+        with self._lock:
+            return list(self._pending.values())[:limit]
+
+    def ack(self, entries):
+        with self._lock:
+            for entry in entries:
+                # skip the entries replaced meanwhile
+                if self._pending.get(entry["reaction_uid"]) is entry:
+                    del self._pending[entry["reaction_uid"]]
+                    self._live -= self._lines.pop(entry["reaction_uid"])
+
+            if not self._pending:
+                self._file.truncate(0)
+                self._size = 0
+            elif self._size > self.compact_size and self._size > 2 * self._live:
+                self._compact()
+
+    def close(self):
+        self._file.close()
+
+
+class AnswersWorker(threading.Thread):
+    """Write the queued answers in batches, every `interval` seconds
+
+    The first answers to their questions are counted (see MatchStats)
+    in the transaction that writes them.
+    """
+
+    def __init__(self, queue, interval=1.0, batch_size=500):
+        super().__init__(name="answers-worker", daemon=True)
+        self.queue = queue
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stopped = threading.Event()
+
+    def flush(self):
+        """Write the pending answers, return how many were written"""
+        written = 0
+        while len(self.queue):
+            entries = self.queue.take(self.batch_size)
+            statement = (
+                update(Reaction.__table__)
+                .where(Reaction.__table__.c.uid == bindparam("reaction_uid"))
+                .execution_options(synchronize_session=False)
+            )
+            session = StoreConfig().session
+            try:
+                answered = Counter(
+                    Reactions.unanswered_questions(
+                        [entry["reaction_uid"] for entry in entries]
+                    )
+                )
+                session.execute(statement, [decode(entry) for entry in entries])
+                for (match_uid, question_uid), n in answered.items():
+                    MatchStats.question_answered(
+                        match_uid, question_uid, answers=n, commit=False
+                    )
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                logger.error(f"{len(entries)} answers not written: {e}")
+                break
+
+            self.queue.ack(entries)
+            written += len(entries)
+        return written
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.flush()
+
+    def stop(self):
+        self._stopped.set()
+        self.flush()
+
+
+def answers_queue():
+    """Queue of the app, None unless write-behind is enabled"""
+    registry = getattr(StoreConfig().config, "registry", None)
+    return None if registry is None else registry.get(QUEUE_KEY)
+
+
+def merge_pending(reactions):
+    """Apply the answers not yet written to the loaded reactions
+
+    Values are set as committed ones, the session does not
+    write them back.
+    """
+    queue = answers_queue()
+    if queue is None or not len(queue):
+        return reactions
+
+    for reaction in reactions:
+        values = queue.get(reaction.uid)
+        for name, value in (values or {}).items():
+            set_committed_value(reaction, name, value)
+    return reactions
+
+
+def includeme(config):
+    """
+    Write the answers of /play/next in background, opt-in.
+
+    Settings:
+      reactions.write_behind: enable the write-behind mode
+      reactions.queue_path: file of the answers to be written
+      reactions.flush_interval: seconds between writes (default 1)
+      reactions.batch_size: answers written at once (default 500)
+      reactions.compact_size: bytes of the file before it is
+        rewritten with the pending answers only (default 1MiB)
+    """
+    settings = config.get_settings()
+    if not asbool(settings.get("reactions.write_behind", False)):
+        return
+
+    queue = AnswersQueue(
+        settings["reactions.queue_path"],
+        compact_size=int(settings.get("reactions.compact_size", 1 << 20)),
+    )
+    worker = AnswersWorker(
+        queue,
+        interval=float(settings.get("reactions.flush_interval", 1)),
+        batch_size=int(settings.get("reactions.batch_size", 500)),
+    )
+    config.registry[QUEUE_KEY] = queue
+    config.registry[WORKER_KEY] = worker
+    worker.start()
+    atexit.register(worker.stop)
@@ -1,4 +1,5 @@
 from codechallenge.entities import User
+from codechallenge.identity import identity_cache
 from pyramid.authentication import AuthTktCookieHelper
 from pyramid.csrf import CookieCSRFStoragePolicy
 from pyramid.httpexceptions import HTTPSeeOther
@@ -16,8 +17,11 @@ class SecurityPolicy:
             return None
 
         userid = identity["userid"]
-        user = request.dbsession.query(User).get(userid)
-        return user
+        cache = identity_cache()
+        if cache is None:
+            return request.dbsession.query(User).get(userid)
+
+        return cache.get(userid, request.dbsession.query(User).get)
 
     def identity(self, request):
         return self.identity_cache.get_or_create(request)
@@ -25,7 +29,7 @@ class SecurityPolicy:
     def authenticated_userid(self, request):
         user = self.identity(request)
         if user is not None:
-            return user.id
+            return user.uid
 
     def remember(self, request, userid, **kw):
         return self.authtkt.remember(request, userid, **kw)
@@ -40,6 +44,7 @@ def includeme(config):
     config.set_csrf_storage_policy(CookieCSRFStoragePolicy())
     config.set_default_csrf_options(require_csrf=True)
     config.set_security_policy(SecurityPolicy(settings["auth.secret"]))
+    config.include("codechallenge.identity")
 
 
 def login_required(func):
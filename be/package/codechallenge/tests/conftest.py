@@ -8,6 +8,7 @@ import pytest
 import transaction
 import webtest
 from codechallenge.app import main
+from codechallenge.digest import reset_digest_service
 from codechallenge.entities import Game, Match, Question, User
 from codechallenge.entities.meta import Base, get_engine, get_tm_session
 from codechallenge.security import SecurityPolicy
@@ -60,6 +61,14 @@ def pytest_addoption(parser):
     parser.addoption("--ini", action="store", metavar="INI_FILE")
 
 
+@pytest.fixture(autouse=True)
+def digest_keys():
+    # tests set their own SIGNED_KEY, read it again in each test
+    reset_digest_service()
+    yield
+    reset_digest_service()
+
+
 @pytest.fixture(scope="session")
 def ini_file(request):
     # potentially grab this path from a pytest option
@@ -1,6 +1,9 @@
 from codechallenge.endpoints.match import MatchEndPoints
 from codechallenge.endpoints.question import QuestionEndPoints
-from codechallenge.entities import User
+from codechallenge.entities import Match, User
+from codechallenge.entities.user import UserFactory
+from codechallenge.exceptions import HasherBusyError
+from codechallenge.passwords import BcryptHasher, PasswordHasher
 from pyramid.httpexceptions import HTTPSeeOther
 
 
@@ -45,6 +48,53 @@ class TestCaseLogin:
             headers={"X-CSRF-Token": testapp.get_csrf_token()},
         )
 
+    def t_passwordIsRehashedWhenTheCostChanges(self, testapp, dbsession):
+        credentials = {
+            "email": "user@test.com",
+            "password": "p@ssworth",
+        }
+        user = User(email=credentials["email"]).save()
+        user.password_hash = BcryptHasher(rounds=4).hash(credentials["password"])
+        user.save()
+
+        testapp.post_json(
+            "/login",
+            credentials,
+            status=303,
+            headers={"X-CSRF-Token": testapp.get_csrf_token()},
+        )
+        # the login changed the user of the request session
+        user = dbsession.query(User).filter_by(email=user.email).one()
+        assert user.password_hash.startswith("$2b$12$")
+
+    def t_loginIsRefusedWhenHasherIsBusy(self, testapp, mocker):
+        credentials = {
+            "email": "user@test.com",
+            "password": "p@ssworth",
+        }
+        User(**credentials).save()
+        mocker.patch.object(
+            PasswordHasher, "verify", side_effect=HasherBusyError("busy")
+        )
+        response = testapp.post_json(
+            "/login",
+            credentials,
+            status=503,
+            headers={"X-CSRF-Token": testapp.get_csrf_token()},
+        )
+        assert response.headers["Retry-After"] == "1"
+
+    def t_anyViewIsRefusedWhenHasherIsBusy(self, testapp, mocker):
+        match = Match(is_restricted=False).save()
+        mocker.patch.object(UserFactory, "fetch", side_effect=HasherBusyError("busy"))
+        response = testapp.post_json(
+            "/play/start",
+            {"match_uid": match.uid},
+            status=503,
+            headers={"X-CSRF-Token": testapp.get_csrf_token()},
+        )
+        assert response.json == {"error": "busy"}
+
 
 class TestCaseLogOut:
     def t_cookiesAfterLogoutCompletedSuccessfully(self, testapp):
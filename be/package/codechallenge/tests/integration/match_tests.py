@@ -1,7 +1,10 @@
+from base64 import b64encode
 from datetime import datetime, timedelta
+from io import BytesIO
 
 from codechallenge.entities import Game, Match, Question, Questions, Reaction, User
 from codechallenge.tests.fixtures import TEST_1
+from openpyxl import Workbook
 
 
 class TestCaseBadRequest:
@@ -39,6 +42,31 @@ class TestCaseMatchEndpoints:
         assert questions[0][0]["text"] == TEST_1[0]["text"]
         assert response.json["match"]["is_restricted"]
 
+    def t_creationStatementsDoNotDependOnQuestionsCount(self, testapp, emitted_queries):
+        questions = [
+            {"text": f"Question {i}", "answers": [{"text": "Yes"}, {"text": "No"}]}
+            for i in range(200)
+        ]
+        before = len(emitted_queries)
+        response = testapp.post_json(
+            "/match/new",
+            {"name": "Big Match", "questions": questions},
+            headers={"X-CSRF-Token": testapp.get_csrf_token()},
+            status=200,
+        )
+
+        inserts = [
+            sql for sql, _ in emitted_queries[before:] if sql.startswith("INSERT")
+        ]
+        # match, game, questions and answers
+        assert len(inserts) == 4
+        assert Questions.count() == 200
+        questions = response.json["match"]["questions"]
+        assert questions[0][199]["text"] == "Question 199"
+        answers = {a["position"]: a for a in questions[0][199]["answers"]}
+        assert answers[0]["is_correct"]
+        assert not answers[1]["is_correct"]
+
     def t_createMatchWithCode(self, testapp):
         match_name = "New Match"
         now = datetime.now()
@@ -158,7 +186,54 @@ class TestCaseMatchEndpoints:
         )
 
         rjson = response.json
-        assert rjson["matches"] == [m.json for m in [m1, m2, m3]]
+        assert rjson["matches"] == [m.summary for m in [m1, m2, m3]]
+        assert rjson["next"] is None
+
+    def t_listMatchesPageByPage(self, testapp):
+        matches = [Match().save() for _ in range(5)]
+
+        response = testapp.get("/match/list", {"limit": 2}, status=200)
+        assert [m["name"] for m in response.json["matches"]] == [
+            matches[0].name,
+            matches[1].name,
+        ]
+        assert response.json["next"] == matches[1].uid
+
+        response = testapp.get(
+            "/match/list", {"limit": 2, "after": matches[3].uid}, status=200
+        )
+        assert [m["name"] for m in response.json["matches"]] == [matches[4].name]
+        assert response.json["next"] is None
+
+    def t_filterListedMatches(self, testapp):
+        expired = Match(to_time=datetime.now() - timedelta(hours=1)).save()
+        restricted = Match(is_restricted=True).save()
+        with_code = Match(with_code=True, is_restricted=False).save()
+
+        response = testapp.get("/match/list", {"active": "false"}, status=200)
+        assert [m["name"] for m in response.json["matches"]] == [expired.name]
+
+        response = testapp.get(
+            "/match/list", {"active": "true", "restricted": "true"}, status=200
+        )
+        assert [m["name"] for m in response.json["matches"]] == [restricted.name]
+
+        response = testapp.get("/match/list", {"with_code": "true"}, status=200)
+        assert [m["name"] for m in response.json["matches"]] == [with_code.name]
+
+    def t_listMatchesWithQuestions(self, testapp):
+        match = Match().save()
+        first_game = Game(match_uid=match.uid).save()
+        Question(text="Where is Paris?", game_uid=first_game.uid, position=0).save()
+
+        response = testapp.get("/match/list", status=200)
+        assert "questions" not in response.json["matches"][0]
+
+        response = testapp.get("/match/list", {"fields": "questions"}, status=200)
+        assert response.json["matches"] == [match.json]
+
+        testapp.get("/match/list", {"fields": "answers"}, status=400)
+        testapp.get("/match/list", {"limit": 1000}, status=400)
 
     def t_importQuestionsFromYaml(self, testapp, yaml_file_handler):
         match = Match().save()
@@ -173,3 +248,49 @@ class TestCaseMatchEndpoints:
 
         assert response.json["match"]["questions"][0][0]["text"] == "What is your name?"
         assert response.json["match"]["questions"][0][0]["answers"]
+
+    def t_streamingImportFromYaml(self, testapp, yaml_file_handler):
+        match = Match().save()
+        base64_content, fname = yaml_file_handler
+
+        response = testapp.post_json(
+            "/match/import",
+            {"match_uid": match.uid, "format": "yaml", "data": base64_content},
+            headers={"X-CSRF-Token": testapp.get_csrf_token(), "filename": fname},
+            status=200,
+        )
+
+        assert response.json == {
+            "match": match.uid,
+            "imported": 1,
+            "failed": 0,
+            "errors": [],
+        }
+        match.refresh()
+        question = match.games[0].questions[0]
+        assert question.text == "What is your name?"
+        assert len(question.answers) == 3
+
+    def t_streamingImportFromXlsx(self, testapp):
+        match = Match().save()
+        workbook = Workbook()
+        workbook.active.append(["question", "correct", "wrong"])
+        workbook.active.append(["Where is Paris?", "France", "Italy"])
+        workbook.active.append([None, "Spain"])
+        stream = BytesIO()
+        workbook.save(stream)
+
+        response = testapp.post_json(
+            "/match/import",
+            {
+                "match_uid": match.uid,
+                "format": "xlsx",
+                "data": b64encode(stream.getvalue()).decode(),
+            },
+            headers={"X-CSRF-Token": testapp.get_csrf_token()},
+            status=200,
+        )
+
+        assert response.json["imported"] == 1
+        assert response.json["failed"] == 1
+        assert response.json["errors"][0]["index"] == 1
@@ -1,7 +1,21 @@
 from datetime import datetime, timedelta, timezone
 
-from codechallenge.entities import Answer, Game, Match, Question, Rankings, User
+import pytest
+from codechallenge.app import main
+from codechallenge.entities import (
+    Answer,
+    Game,
+    Match,
+    MatchStats,
+    Question,
+    Rankings,
+    Reaction,
+    Reactions,
+    User,
+)
+from codechallenge.entities.meta import Base
 from codechallenge.entities.user import UserFactory, WordDigest
+from sqlalchemy import event, select
 
 
 class TestCaseBadRequest:
@@ -216,3 +230,179 @@ class TestCasePlayNext:
         )
         assert response.json["question"] is None
         assert len(Rankings.of_match(match.uid)) == 1
+
+    def t_matchStatsCountThePlays(self, testapp):
+        match = Match().save()
+        first_game = Game(match_uid=match.uid, index=0).save()
+        question = Question(
+            text="Where is London?", game_uid=first_game.uid, position=0, time=2
+        ).save()
+        answer = Answer(question=question, text="UK", position=1, level=2).save()
+        users = [User(email=f"user{i}@test.project").save() for i in range(2)]
+        Reaction(
+            match_uid=match.uid,
+            question_uid=question.uid,
+            game_uid=first_game.uid,
+            user_uid=users[1].uid,
+        ).save()
+        testapp.post_json(
+            "/play/next",
+            {
+                "match_uid": match.uid,
+                "question_uid": question.uid,
+                "answer_uid": answer.uid,
+                "user_uid": users[0].uid,
+            },
+            headers={"X-CSRF-Token": testapp.get_csrf_token()},
+            status=200,
+        )
+
+        response = testapp.get(f"/match/{match.uid}", status=200)
+        stats = response.json["stats"]
+        assert stats["players"] == {"started": 2, "completed": 1, "playing": 1}
+        assert stats["plays"] == 1
+        assert stats["average_score"] == Rankings.of_match(match.uid)[0].score
+        assert stats["answers"] == {str(question.uid): 1}
+
+    def t_answerQueriesAreBounded(self, testapp, trivia_match, emitted_queries):
+        match = trivia_match
+        user = UserFactory(signed=match.is_restricted).fetch()
+        question = match.questions[0][0]
+        answer = question.answers_by_position[0]
+        # counters of the match already built
+        MatchStats.of_match(match.uid)
+
+        before = len(emitted_queries)
+        testapp.post_json(
+            "/play/next",
+            {
+                "match_uid": match.uid,
+                "question_uid": question.uid,
+                "answer_uid": answer.uid,
+                "user_uid": user.uid,
+            },
+            headers={"X-CSRF-Token": testapp.get_csrf_token()},
+            status=200,
+        )
+        # the request starts with an empty session, then objects already
+        # loaded within the request are not reloaded; the first reaction
+        # of a play looks for completed ones, the last two queries count
+        # the new player and the answer (see MatchStats)
+        assert len(emitted_queries) == before + 10
+
+
+class TestCaseIdentityMapReuse:
+    """Statements of /play/next against the former always_refresh mappers"""
+
+    @pytest.fixture
+    def long_match(self, dbsession):
+        match = Match(is_restricted=False, times=None).save()
+        game = Game(match_uid=match.uid, index=0).save()
+        for position in range(50):
+            question = Question(
+                text=f"Question {position}", game_uid=game.uid, position=position
+            ).save()
+            Answer(question=question, text="Yes", position=0).save()
+            Answer(question=question, text="No", position=1).save()
+        return match, {q.position: q.uid for q in game.questions}
+
+    @pytest.fixture
+    def always_refresh(self):
+        mappers = list(Base.registry.mappers)
+
+        def toggle(value):
+            for mapper in mappers:
+                mapper.always_refresh = value
+
+        yield toggle
+        toggle(False)
+
+    def play(self, testapp, long_match, dbengine):
+        """Play the match, return the statements of /play/next"""
+        match, question_uids = long_match
+        headers = {"X-CSRF-Token": testapp.get_csrf_token()}
+        response = testapp.post_json(
+            "/play/start", {"match_uid": match.uid}, headers=headers, status=200
+        )
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(dbengine, "before_cursor_execute", count)
+        try:
+            question = response.json["question"]
+            while question:
+                params = {
+                    "match_uid": match.uid,
+                    "question_uid": question_uids[question["position"]],
+                    "answer_uid": question["answers"][0]["uid"],
+                    "user_uid": response.json["user"],
+                }
+                next_response = testapp.post_json(
+                    "/play/next", params, headers=headers, status=200
+                )
+                question = next_response.json["question"]
+        finally:
+            event.remove(dbengine, "before_cursor_execute", count)
+        return len(statements)
+
+    def t_loadedObjectsAreReusedByPlayNext(
+        self, testapp, long_match, dbengine, always_refresh
+    ):
+        # warm up the caches of the app and of SQLAlchemy
+        self.play(testapp, long_match, dbengine)
+        always_refresh(True)
+        refreshed = self.play(testapp, long_match, dbengine)
+        always_refresh(False)
+        reused = self.play(testapp, long_match, dbengine)
+
+        # lazy loads hit the identity map either way: refreshing costs
+        # the overwrite of the loaded objects, not more statements
+        assert reused <= refreshed
+
+
+class TestCasePlayNextWriteBehind:
+    @pytest.fixture
+    def worker(self, testapp, app_settings, dbengine, tmp_path):
+        settings = {
+            **app_settings,
+            "reactions.write_behind": "true",
+            "reactions.queue_path": str(tmp_path / "reactions.queue"),
+            "reactions.flush_interval": "3600",
+        }
+        testapp.app = main({}, dbengine=dbengine, **settings)
+        worker = testapp.app.registry["answers_worker"]
+        yield worker
+        worker.stop()
+
+    def t_answersAreWrittenInBackground(self, testapp, trivia_match, worker):
+        match = trivia_match
+        user = UserFactory(signed=match.is_restricted).fetch()
+        question = match.questions[0][0]
+        answer = question.answers_by_position[0]
+        params = {
+            "match_uid": match.uid,
+            "question_uid": question.uid,
+            "answer_uid": answer.uid,
+            "user_uid": user.uid,
+        }
+        headers = {"X-CSRF-Token": testapp.get_csrf_token()}
+        # counters of the match already built
+        MatchStats.of_match(match.uid)
+
+        testapp.post_json("/play/next", params, headers=headers, status=200)
+        answered = select(Reaction.answer_uid).where(
+            Reaction.user_uid == user.uid, Reaction.question_uid == question.uid
+        )
+        assert Reactions.session.execute(answered).scalar() is None
+        # counted with the write, not by the request
+        assert MatchStats.of_match(match.uid)["answers"] == {}
+        # pending answers are merged by the read paths
+        testapp.post_json("/play/next", params, headers=headers, status=400)
+
+        assert worker.flush() == 1
+        assert Reactions.session.execute(answered).scalar() == answer.uid
+        assert len(worker.queue) == 0
+        answers = MatchStats.of_match(match.uid)["answers"]
+        assert answers == {str(question.uid): 1}
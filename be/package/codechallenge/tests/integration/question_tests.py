@@ -88,4 +88,6 @@ class TestCaseQuestionEP:
             headers={"X-CSRF-Token": testapp.get_csrf_token()},
         )
 
+        # the request updated the answers through its own session
+        question.session.expire_all()
         assert question.answers_by_position[0].uid == a2.uid
@@ -1,4 +1,4 @@
-from codechallenge.entities import Match, Ranking
+from codechallenge.entities import Match, Ranking, User
 from codechallenge.entities.user import UserFactory
 
 
@@ -12,14 +12,73 @@ class TestCaseRankingEndpoints:
         response = testapp.get("/rankings", {"match_uid": match.uid}, status=200)
         assert response.json["rankings"] == [
             {
+                "rank": 0,
+                "score": 4.2,
                 "match": {"name": match.name, "uid": match.uid},
-                "user": {"name": user_1.name},
+                "user": {"uid": user_2.uid, "name": user_2.name},
             },
             {
+                "rank": 1,
+                "score": 4.1,
                 "match": {"name": match.name, "uid": match.uid},
-                "user": {"name": user_2.name},
+                "user": {"uid": user_1.uid, "name": user_1.name},
             },
         ]
 
     def t_match_uid_required(self, testapp):
         testapp.get("/rankings", {}, status=400)
+
+    def t_onlyTheBestScoreOfEachUserIsRanked(self, testapp):
+        match = Match().save()
+        users = [UserFactory().fetch() for _ in range(6)]
+        for score, user in enumerate(users):
+            Ranking(match_uid=match.uid, user_uid=user.uid, score=score).save()
+        Ranking(match_uid=match.uid, user_uid=users[0].uid, score=10).save()
+
+        response = testapp.get(
+            "/rankings", {"match_uid": match.uid, "limit": 2, "offset": 1}, status=200
+        )
+        assert [(r["rank"], r["score"]) for r in response.json["rankings"]] == [
+            (1, 5),
+            (2, 4),
+        ]
+
+    def t_rankingsAroundTheUser(self, testapp):
+        match = Match().save()
+        users = [UserFactory().fetch() for _ in range(6)]
+        for score, user in enumerate(users):
+            Ranking(match_uid=match.uid, user_uid=user.uid, score=score).save()
+
+        response = testapp.get(
+            "/rankings",
+            {"match_uid": match.uid, "limit": 3, "user_uid": users[2].uid},
+            status=200,
+        )
+        assert response.json["user_rank"] == 3
+        assert [r["user"]["uid"] for r in response.json["rankings"]] == [
+            users[3].uid,
+            users[2].uid,
+            users[1].uid,
+        ]
+
+        other = UserFactory().fetch()
+        response = testapp.get(
+            "/rankings", {"match_uid": match.uid, "user_uid": other.uid}, status=200
+        )
+        assert response.json == {"user_rank": None, "rankings": []}
+
+    def t_tiesAreOrderedAsByRedis(self, testapp):
+        match = Match().save()
+        # members of a sorted set compare as strings: "9" > "10"
+        users = [
+            User(uid=uid, email=f"user{uid}@test.project").save() for uid in (9, 10)
+        ]
+        for user in users:
+            Ranking(match_uid=match.uid, user_uid=user.uid, score=1).save()
+
+        response = testapp.get("/rankings", {"match_uid": match.uid}, status=200)
+        assert [r["user"]["uid"] for r in response.json["rankings"]] == [9, 10]
+        response = testapp.get(
+            "/rankings", {"match_uid": match.uid, "user_uid": 10}, status=200
+        )
+        assert response.json["user_rank"] == 1
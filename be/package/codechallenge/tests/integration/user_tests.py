@@ -1,4 +1,7 @@
-from codechallenge.entities import Game, Match, Question, Reaction
+import json
+from base64 import b64encode
+
+from codechallenge.entities import Game, Match, Question, Reaction, Users
 from codechallenge.entities.user import UserFactory
 
 
@@ -42,3 +45,51 @@ class TestCaseUser:
 
         response = testapp.get("/players", {"match_uid": first_match.uid}, status=200)
         assert len(response.json["players"]) == 3
+
+
+class TestCaseProvisionPlayers:
+    def t_playersAreCreatedOrUpdatedFromCsv(self, testapp):
+        existing = UserFactory(original_email="one@test.io", token="01012000").fetch()
+        document = (
+            "email,token\n"
+            "one@test.io,02012000\n"
+            "two@test.io,03012000\n"
+            "not-an-email,04012000\n"
+            "\n"
+            "three@test.io,05012000\n"
+        )
+
+        response = testapp.post_json(
+            "/players/provision",
+            {"data": b64encode(document.encode()).decode()},
+            headers={"X-CSRF-Token": testapp.get_csrf_token()},
+            status=200,
+        )
+
+        assert response.json["created"] == 2
+        assert response.json["updated"] == 1
+        assert response.json["failed"] == 1
+        assert response.json["errors"][0]["index"] == 2
+        assert "email" in response.json["errors"][0]["errors"]
+        Users.session.expire_all()
+        assert Users.signed("one@test.io", "02012000") == existing
+        assert Users.signed("one@test.io", "01012000") is None
+        assert Users.signed("three@test.io", "05012000") is not None
+
+    def t_playersAreReadFromJson(self, testapp):
+        players = [{"email": "one@test.io", "token": "02012000"}, "two@test.io"]
+
+        response = testapp.post_json(
+            "/players/provision",
+            {
+                "format": "json",
+                "data": b64encode(json.dumps(players).encode()).decode(),
+            },
+            headers={"X-CSRF-Token": testapp.get_csrf_token()},
+            status=200,
+        )
+
+        assert response.json["created"] == 1
+        assert response.json["errors"] == [
+            {"index": 1, "errors": {"player": ["must be of dict type"]}}
+        ]
@@ -1,6 +1,31 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from threading import Thread
+
 import pytest
-from codechallenge.app import StoreConfig
+from codechallenge.app import StoreConfig, main
+from codechallenge.constants import MATCH_CODE_LEN
+from codechallenge.entities import Match, Ranking, User, Users
+from codechallenge.entities.match import MatchCode, Matches, MatchHash
+from codechallenge.entities.meta import (
+    Base,
+    engine_options,
+    get_replica_engines,
+    get_session_factory,
+)
+from codechallenge.entities.user import UserFactory
+from codechallenge.identity import Identity, LocalBackend
+from codechallenge.importer import PlayersImport
+from codechallenge.instrumentation import QueryStats, instrument_engine, pool_stats
 from codechallenge.play.cache import ClientFactory
+from codechallenge.play.leaderboard import Leaderboard
+from codechallenge.play.plan import MatchPlan, MatchPlans
+from codechallenge.tests.conftest import TestApp
+from codechallenge.utils import CompiledValidator
+from codechallenge.validation.syntax import next_play_schema
+from sqlalchemy import create_engine, event, select, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import QueuePool
 
 
 class TestCaseConfigSingleton:
@@ -13,6 +38,77 @@ class TestCaseConfigSingleton:
             assert sc.config is settings_mock
 
 
+class TestCaseSessionScope:
+    def t_sessionsAreNotSharedAcrossThreads(self, app):
+        sessions = []
+        thread = Thread(target=lambda: sessions.append(StoreConfig().session))
+        thread.start()
+        thread.join()
+
+        assert StoreConfig().session is StoreConfig().session
+        assert sessions[0] is not StoreConfig().session
+
+    def t_concurrentRequestsAreIsolated(self, app_settings, tmp_path, mocker):
+        # a file database is visible from every thread, unlike :memory:
+        engine = create_engine(f"sqlite:///{tmp_path}/concurrency.db")
+        Base.metadata.create_all(bind=engine)
+        app = main({}, dbengine=engine, **app_settings)
+        mocker.patch("pyramid.request.Request.is_authenticated", return_value=True)
+
+        def create_matches(worker):
+            client = TestApp(app, extra_environ={"HTTP_HOST": "example.com"})
+            client.set_cookie("csrf_token", "dummy_csrf_token")
+            for n in range(5):
+                name = f"M-{worker}-{n}"
+                response = client.post_json(
+                    "/match/new",
+                    {"name": name, "questions": [{"text": f"{name}?"}]},
+                    headers={"X-CSRF-Token": "dummy_csrf_token"},
+                    status=200,
+                )
+                match = response.json["match"]
+                assert match["name"] == name
+                assert match["questions"][0][0]["text"] == f"{name}?"
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for future in [executor.submit(create_matches, w) for w in range(8)]:
+                future.result()
+
+        client = TestApp(app, extra_environ={"HTTP_HOST": "example.com"})
+        response = client.get("/match/list", {"limit": 100}, status=200)
+        assert len(response.json["matches"]) == 40
+        engine.dispose()
+
+
+class TestCaseCompiledValidator:
+    def t_schemaIsSharedByTheValidatorsOfEachThread(self):
+        compiled = CompiledValidator(next_play_schema)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            others = list(executor.map(lambda _: compiled.get(), range(2)))
+
+        assert compiled.get() is compiled.get()
+        assert compiled.get() not in others
+        assert all(v.schema is compiled.schema for v in others)
+
+    def t_concurrentValidationsDoNotInterfere(self):
+        compiled = CompiledValidator(next_play_schema)
+
+        def validate(uid):
+            v = compiled.get()
+            document = {
+                "match_uid": str(uid),
+                "user_uid": uid,
+                "answer_uid": uid,
+                "question_uid": uid if uid % 2 else 0,
+            }
+            return v.validate(document), v.document["match_uid"]
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(validate, range(1, 200)))
+
+        assert results == [(bool(uid % 2), uid) for uid in range(1, 200)]
+
+
 class TestCaseWrongMethod:
     def t_usingNotAllowedMethodsResultsIn404not405(self, testapp):
         testapp.post("/question", status=404)
@@ -26,3 +122,302 @@ class TestCaseCache:
         rclient.set("test_key", "test_value")
         v = rclient.get("test_key")
         assert v == b"test_value"
+
+    @pytest.mark.skip("Skipped due to problems with Redis")
+    def t_matchPlanIsCachedAndInvalidated(self, trivia_match, mocker):
+        mocker.patch.object(ClientFactory, "enabled", True)
+        rclient = ClientFactory().new_client()
+
+        plan = MatchPlans.get(trivia_match)
+        cached = rclient.get(MatchPlans.key(trivia_match.uid))
+        assert MatchPlan.from_json(cached).game_ids == plan.game_ids
+
+        MatchPlans.invalidate(trivia_match.uid)
+        assert rclient.get(MatchPlans.key(trivia_match.uid)) is None
+
+    @pytest.mark.skip("Skipped due to problems with Redis")
+    def t_leaderboardIsRebuiltAndKeepsTheBestScore(self, dbsession, mocker):
+        mocker.patch.object(ClientFactory, "enabled", True)
+        match = Match().save()
+        users = [UserFactory().fetch() for _ in range(3)]
+        for score, user in enumerate(users):
+            Ranking(match_uid=match.uid, user_uid=user.uid, score=score).save()
+
+        leaderboard = Leaderboard(match.uid)
+        ClientFactory().new_client().delete(leaderboard.key)
+        assert leaderboard.top(2) == [(0, users[2].uid, 2), (1, users[1].uid, 1)]
+
+        leaderboard.add(users[0].uid, 5)
+        leaderboard.add(users[0].uid, 1)
+        assert leaderboard.rank(users[0].uid) == 0
+        assert leaderboard.around(users[1].uid, 1) == (2, [(2, users[1].uid, 1)])
+
+    @pytest.mark.skip("Skipped due to problems with Redis")
+    def t_codesAreReservedUntilExpiration(self, dbsession, mocker):
+        mocker.patch.object(ClientFactory, "enabled", True)
+        rclient = ClientFactory().new_client()
+        allocator = MatchCode().allocator(MATCH_CODE_LEN)
+        rclient.delete(allocator.free_key, allocator.reserved_key)
+        tomorrow = datetime.now() + timedelta(days=1)
+        match = Match(with_code=True, expires=tomorrow).save()
+
+        assert rclient.scard(allocator.free_key) == 10**MATCH_CODE_LEN - 1
+        assert rclient.zscore(allocator.reserved_key, match.code) == (
+            tomorrow.timestamp()
+        )
+        # without expiration the code is given back at the next allocation
+        code = MatchCode().get_code()
+        MatchCode().get_code()
+        assert rclient.sismember(allocator.free_key, code)
+
+    @pytest.mark.skip("Skipped due to problems with Redis")
+    def t_hashesAreNotRepeated(self, dbsession, mocker):
+        mocker.patch.object(ClientFactory, "enabled", True)
+        rclient = ClientFactory().new_client()
+        rclient.delete("match_hashes:5:counter", "match_hashes:5:used")
+        get_method = mocker.spy(Matches, "get")
+
+        hashes = {MatchHash().get_hash() for _ in range(100)}
+        assert len(hashes) == 100
+        assert not get_method.called
+
+
+class TestCaseQueryStats:
+    @pytest.fixture
+    def stats_testapp(self, testapp, app_settings, dbengine):
+        settings = {
+            **app_settings,
+            "sql.stats.headers": "true",
+            "sql.slow_query_ms": "0",
+        }
+        testapp.app = main({}, dbengine=dbengine, **settings)
+        return testapp
+
+    def t_statementsAreCountedPerRequest(self, stats_testapp, mocker):
+        logger = mocker.patch("codechallenge.instrumentation.logger")
+        Match().save()
+        response = stats_testapp.get("/match/list", status=200)
+
+        assert int(response.headers["X-DB-Queries"]) >= 1
+        assert float(response.headers["X-DB-Time-Ms"]) >= 0
+        summary = logger.info.call_args.kwargs["extra"]["query_stats"]
+        assert summary["route"] == "list_matches"
+        assert summary["queries"] == int(response.headers["X-DB-Queries"])
+        assert "list_matches" in logger.warning.call_args.args[0]
+
+    def t_headersAreOptIn(self, testapp):
+        response = testapp.get("/match/list", status=200)
+        assert "X-DB-Queries" not in response.headers
+
+    def t_onlyTheSlowestStatementsAreKept(self):
+        stats = QueryStats(slow_threshold=10, slowest_size=2)
+        for duration in (0.1, 0.3, 0.2):
+            stats.record(f"SELECT {duration}", duration)
+
+        assert stats.count == 3
+        assert stats.json()["slowest"] == [
+            {"ms": 300.0, "statement": "SELECT 0.3"},
+            {"ms": 200.0, "statement": "SELECT 0.2"},
+        ]
+
+    def t_failedStatementsAreNotLeftOnTheStack(self, tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path}/stats.db")
+        instrument_engine(engine)
+        with engine.connect() as conn:
+            with pytest.raises(OperationalError):
+                conn.execute(text("SELECT * FROM missing"))
+            assert conn.info["query_start"] == []
+
+            conn.execute(text("SELECT 1"))
+            assert conn.info["query_start"] == []
+        engine.dispose()
+
+
+class TestCaseEnginePool:
+    def t_engineOptionsAreReadFromSettings(self):
+        options = engine_options(
+            {
+                "sqlalchemy.url": "mysql+pymysql://",
+                "sqlalchemy.pool_size": "8",
+                "sqlalchemy.pool_pre_ping": "true",
+                "sqlalchemy.isolation_level": "READ COMMITTED",
+                "sqlalchemy.pool_recycle": "",
+            }
+        )
+        assert options == {
+            "pool_size": 8,
+            "pool_pre_ping": True,
+            "isolation_level": "READ COMMITTED",
+        }
+
+    def t_poolUsageIsTracked(self, tmp_path):
+        engine = create_engine(
+            f"sqlite:///{tmp_path}/pool.db",
+            poolclass=QueuePool,
+            pool_size=1,
+            max_overflow=1,
+        )
+        stats = pool_stats(engine.pool)
+        assert pool_stats(engine.pool) is stats
+
+        with engine.connect(), engine.connect():
+            assert stats.json() == {
+                "size": 1,
+                "checked_out": 2,
+                "overflow": 1,
+                "peak": 2,
+                "saturated": 1,
+            }
+        assert stats.json()["checked_out"] == 0
+        engine.dispose()
+
+
+class TestCaseReadReplicas:
+    @pytest.fixture
+    def engines(self, tmp_path):
+        primary = create_engine(f"sqlite:///{tmp_path}/primary.db")
+        replica_url = f"sqlite:///{tmp_path}/replica.db"
+        replica = get_replica_engines({"sqlalchemy.replicas": replica_url})[0]
+        for engine in (primary, replica):
+            Base.metadata.create_all(bind=engine)
+
+        yield primary, replica, replica_url
+        primary.dispose()
+        replica.dispose()
+
+    def t_sessionSticksToPrimaryAfterWriting(self, engines):
+        primary, replica, _ = engines
+        session = get_session_factory(primary, [replica])()
+        assert session.get_bind() is primary
+
+        session.info["read_only"] = True
+        assert session.get_bind() is replica
+        session.execute(Match.__table__.insert().values(name="Written"))
+
+        assert session.get_bind() is primary
+        session.rollback()
+        session.close()
+
+    def t_appBuildsTheEnginesOfTheReplicas(self, engines, app_settings, monkeypatch):
+        primary, _, replica_url = engines
+        # the engine of the other tests is cached, build a new one
+        monkeypatch.setattr("codechallenge.entities.meta.cache", {})
+        app = main(
+            {},
+            **{
+                **app_settings,
+                "sqlalchemy.url": str(primary.url),
+                "sqlalchemy.replicas": replica_url,
+            },
+        )
+        engine = app.registry["dbengine"]
+        session = app.registry["dbsession_factory"]()
+        session.info["read_only"] = True
+        replica = session.get_bind()
+
+        assert str(engine.url) == str(primary.url)
+        assert str(replica.url) == replica_url
+        session.close()
+        engine.dispose()
+        replica.dispose()
+
+    def t_readOnlyViewsReadFromReplica(self, engines, app_settings, mocker):
+        primary, replica, replica_url = engines
+        replica.execute(Match.__table__.insert().values(name="On replica"))
+        app = main(
+            {}, dbengine=primary, **{**app_settings, "sqlalchemy.replicas": replica_url}
+        )
+        mocker.patch("pyramid.request.Request.is_authenticated", return_value=True)
+        client = TestApp(app, extra_environ={"HTTP_HOST": "example.com"})
+        client.set_cookie("csrf_token", "dummy_csrf_token")
+
+        client.post_json(
+            "/match/new",
+            {"name": "On primary"},
+            headers={"X-CSRF-Token": "dummy_csrf_token"},
+            status=200,
+        )
+        response = client.get("/match/list", status=200)
+
+        assert [m["name"] for m in response.json["matches"]] == ["On replica"]
+        names = primary.execute(select(Match.name)).scalars().all()
+        assert names == ["On primary"]
+
+
+class TestCaseIdentityCache:
+    @pytest.fixture
+    def auth_testapp(self, app, tm, dbsession):
+        # unlike testapp, authentication goes through the security policy
+        _testapp = TestApp(
+            app,
+            extra_environ={
+                "HTTP_HOST": "example.com",
+                "tm.active": True,
+                "tm.manager": tm,
+                "app.dbsession": dbsession,
+            },
+        )
+        _testapp.set_cookie("csrf_token", "dummy_csrf_token")
+        return _testapp
+
+    def t_usersAreReadOnceAcrossRequests(self, auth_testapp, dbengine):
+        credentials = {"email": "user@test.com", "password": "p@ssworth"}
+        user = User(**credentials).save()
+        auth_testapp.post_json(
+            "/login",
+            credentials,
+            status=303,
+            headers={"X-CSRF-Token": auth_testapp.get_csrf_token()},
+        )
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(dbengine, "before_cursor_execute", record)
+        try:
+            for _ in range(3):
+                auth_testapp.get("/match/list", status=200)
+        finally:
+            event.remove(dbengine, "before_cursor_execute", record)
+
+        assert len([s for s in statements if "FROM users" in s]) == 1
+        cache = auth_testapp.app.registry["identity_cache"]
+        assert cache.get(user.uid, load=None).email == user.email
+        stats = auth_testapp.get("/stats/cache", status=200).json["identity"]
+        assert stats["misses"] == 1
+        assert stats["hits"] == 4
+        assert stats["hit_ratio"] == 0.8
+
+    def t_identityIsInvalidatedOnceTheUserIsChanged(self, app, dbsession):
+        cache = app.registry["identity_cache"]
+        user = User(email="user@test.com").save()
+        cache.get(user.uid, lambda uid: Users.get(uid=uid))
+
+        user.name = "changed"
+        user.session.flush()
+        assert cache.backend.get(user.uid) is not None
+        user.session.commit()
+        assert cache.backend.get(user.uid) is None
+        assert cache.get(user.uid, lambda uid: Users.get(uid=uid)).name == "changed"
+
+    def t_identityIsInvalidatedOnceThePlayerIsProvisioned(self, app, dbsession):
+        cache = app.registry["identity_cache"]
+        user = UserFactory(original_email="one@test.io", token="01012000").fetch()
+        cache.get(user.uid, lambda uid: Users.get(uid=uid))
+
+        players = [{"email": "one@test.io", "token": "02012000"}]
+        assert PlayersImport(iter(players)).run()["updated"] == 1
+        assert cache.backend.get(user.uid) is None
+
+    def t_localBackendEvictsLeastRecentlyUsedAndExpired(self, mocker):
+        backend = LocalBackend(ttl=10, maxsize=2)
+        for uid in (1, 2):
+            backend.set(Identity(uid))
+        backend.get(1)
+        backend.set(Identity(3))
+
+        assert backend.get(2) is None
+        assert backend.get(1).uid == 1
+        mocker.patch("codechallenge.identity.monotonic", return_value=10**9)
+        assert backend.get(3) is None
@@ -0,0 +1,250 @@
+from io import BytesIO
+
+from codechallenge.digest import digest_service, reset_digest_service
+from codechallenge.entities import Match, User, Users
+from codechallenge.entities.user import UserFactory
+from codechallenge.importer import (
+    CsvPlayers,
+    PlayersImport,
+    QuestionsImport,
+    XlsxQuestions,
+    YamlQuestions,
+)
+from openpyxl import Workbook
+
+
+def xlsx_stream(rows):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(["question", "correct", "wrong"])
+    for row in rows:
+        sheet.append(row)
+
+    stream = BytesIO()
+    workbook.save(stream)
+    stream.seek(0)
+    return stream
+
+
+class TestCaseYamlQuestions:
+    def t_questionsAreReadInBothForms(self):
+        document = (
+            "title: quiz\n"
+            "questions:\n"
+            "  - Where is Paris?\n"
+            "  - answers:\n"
+            "    - France\n"
+            "    - Italy\n"
+            "  - text: Where is Rome?\n"
+            "    answers:\n"
+            "      - Italy\n"
+            "  -\n"
+            "  - answers:\n"
+            "    - Spain\n"
+        )
+
+        questions = list(YamlQuestions(BytesIO(document.encode())))
+        assert questions == [
+            {
+                "text": "Where is Paris?",
+                "answers": [{"text": "France"}, {"text": "Italy"}],
+            },
+            {"text": "Where is Rome?", "answers": [{"text": "Italy"}]},
+            {"text": None, "answers": [{"text": "Spain"}]},
+        ]
+
+    def t_questionsAreReadLazily(self):
+        document = "questions:\n  - text: First\n  - text: [unclosed\n"
+        questions = iter(YamlQuestions(BytesIO(document.encode())))
+
+        assert next(questions) == {"text": "First", "answers": []}
+
+
+class TestCaseXlsxQuestions:
+    def t_oneQuestionPerRowSkippingHeaderAndEmptyRows(self):
+        stream = xlsx_stream([["Where is Paris?", "France", "Italy"], [], ["1 + 1", 2]])
+
+        assert list(XlsxQuestions(stream)) == [
+            {
+                "text": "Where is Paris?",
+                "answers": [{"text": "France"}, {"text": "Italy"}],
+            },
+            {"text": "1 + 1", "answers": [{"text": "2"}]},
+        ]
+
+
+class TestCaseQuestionsImport:
+    def t_questionsAreInsertedInChunks(self, dbsession):
+        match = Match().save()
+        questions = [
+            {"text": f"Question {n}", "answers": [{"text": "yes"}, {"text": "no"}]}
+            for n in range(7)
+        ]
+        calls = []
+
+        summary = QuestionsImport(
+            match,
+            iter(questions),
+            chunk_size=3,
+            progress=lambda imported, failed: calls.append(imported),
+        ).run()
+
+        assert summary == {"imported": 7, "failed": 0, "errors": []}
+        assert calls == [3, 6, 7]
+        match.refresh()
+        game = match.games[0]
+        assert [q.text for q in game.ordered_questions] == [
+            f"Question {n}" for n in range(7)
+        ]
+        assert game.ordered_questions[0].answers_by_position[0].is_correct
+
+    def t_invalidQuestionsAreReported(self, dbsession):
+        match = Match().save()
+        questions = [
+            {"text": "Valid", "answers": [{"text": "yes"}]},
+            {"text": None, "answers": [{"text": "yes"}]},
+            {"text": "Valid too", "answers": []},
+        ]
+
+        summary = QuestionsImport(match, iter(questions)).run()
+
+        assert summary["imported"] == 2
+        assert summary["failed"] == 1
+        assert summary["errors"][0]["index"] == 1
+        assert "text" in summary["errors"][0]["errors"]
+
+    def t_repeatedAnswersAreReported(self, dbsession):
+        match = Match().save()
+        questions = [
+            {"text": "Repeated", "answers": [{"text": "Yes"}, {"text": "yes "}]},
+            {"text": "Valid", "answers": [{"text": "yes"}, {"text": "no"}]},
+        ]
+
+        summary = QuestionsImport(match, iter(questions)).run()
+
+        assert summary["imported"] == 1
+        assert summary["errors"] == [
+            {"index": 0, "errors": {"answers": ["Answers texts must be unique"]}}
+        ]
+
+    def t_gameIsAddedAfterTheExistingOnes(self, trivia_match):
+        questions = [{"text": "Where is Rome?", "answers": [{"text": "Italy"}]}]
+
+        summary = QuestionsImport(trivia_match, iter(questions)).run()
+
+        assert summary["imported"] == 1
+        trivia_match.refresh()
+        assert sorted(g.index for g in trivia_match.games) == [1, 2, 3]
+
+    def t_noGameWhenEveryQuestionFails(self, dbsession):
+        match = Match().save()
+        questions = [{"text": None}, {"answers": []}]
+
+        summary = QuestionsImport(match, iter(questions)).run()
+
+        assert summary["failed"] == 2
+        match.refresh()
+        assert match.games == []
+
+    def t_unreadableSourceStopsTheImport(self, dbsession):
+        match = Match().save()
+        document = "questions:\n  - text: First\n  - text: [unclosed\n"
+
+        summary = QuestionsImport(
+            match, YamlQuestions(BytesIO(document.encode()))
+        ).run()
+
+        assert summary["imported"] == 1
+        assert summary["failed"] == 1
+        # the first question was still waiting for its chunk
+        assert summary["errors"][0]["index"] == 1
+        assert "data" in summary["errors"][0]["errors"]
+
+
+class TestCaseCsvPlayers:
+    def t_onePlayerPerRowSkippingHeaderAndEmptyRows(self):
+        document = "Email, Token\n one@test.io , 01012000\n,\ntwo@test.io\n"
+
+        assert list(CsvPlayers(BytesIO(document.encode()))) == [
+            {"email": "one@test.io", "token": "01012000"},
+            {"email": "two@test.io", "token": None},
+        ]
+
+
+class TestCasePlayersImport:
+    def t_playersAreUpsertedInChunks(self, dbsession):
+        players = [
+            {"email": f"player{n}@test.io", "token": "01012000"} for n in range(5)
+        ]
+        players.append({"email": "player0@test.io", "token": "02012000"})
+        calls = []
+
+        summary = PlayersImport(
+            iter(players),
+            chunk_size=2,
+            progress=lambda provisioned, failed: calls.append(provisioned),
+        ).run()
+
+        assert summary == {"created": 5, "updated": 1, "failed": 0, "errors": []}
+        assert calls == [2, 4, 6]
+
+    def t_emailRepeatedInAChunkIsRejected(self, dbsession):
+        players = [
+            {"email": "one@test.io", "token": "01012000"},
+            {"email": "one@test.io", "token": "02012000"},
+        ]
+
+        summary = PlayersImport(iter(players)).run()
+
+        assert summary["created"] == 1
+        assert summary["failed"] == 1
+        assert summary["errors"] == [
+            {"index": 1, "errors": {"email": ["repeated in the source"]}}
+        ]
+
+    def t_playersSignedWithThePreviousKeyAreMoved(self, dbsession, monkeypatch):
+        old_key = "3ba57f9a004e42918eee6f73326aa89d"
+        monkeypatch.setenv("SIGNED_KEY", old_key, prepend=None)
+        signed_user = UserFactory(
+            original_email="one@test.io", token="01012000"
+        ).fetch()
+        users = Users.count()
+
+        monkeypatch.setenv("SIGNED_KEY", "a" * 32, prepend=None)
+        monkeypatch.setenv("SIGNED_KEY_PREVIOUS", old_key, prepend=None)
+        reset_digest_service()
+        players = [{"email": "one@test.io", "token": "02012000"}]
+        summary = PlayersImport(iter(players)).run()
+
+        assert summary["created"] == 0
+        assert summary["updated"] == 1
+        assert Users.count() == users
+        Users.session.expire_all()
+        assert Users.signed("one@test.io", "02012000") == signed_user
+        assert signed_user.email_digest == digest_service().digest("one@test.io")
+
+    def t_playersCreatedMeanwhileAreUpdated(self, dbsession):
+        email_digest = digest_service().digest("one@test.io")
+        # created by a concurrent import, after the users were looked up
+        Users.session.execute(
+            User.__table__.insert().values(
+                email=f"{email_digest}@progame.io", token_digest="stale"
+            )
+        )
+        users = Users.count()
+
+        players = [{"email": "one@test.io", "token": "02012000"}]
+        summary = PlayersImport(iter(players)).run()
+
+        assert summary["failed"] == 0
+        assert Users.count() == users
+        assert Users.signed("one@test.io", "02012000") is not None
+
+    def t_unreadableSourceStopsTheImport(self, dbsession):
+        document = b"\xff\xfeone@test.io,01012000\n"
+
+        summary = PlayersImport(CsvPlayers(BytesIO(document))).run()
+
+        assert summary["created"] == 0
+        assert summary["failed"] == 1
+        assert "data" in summary["errors"][0]["errors"]
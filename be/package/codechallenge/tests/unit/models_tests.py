@@ -1,28 +1,62 @@
 from datetime import datetime, timedelta
+from hashlib import blake2b
 from math import isclose
 
 import pytest
 from codechallenge.app import StoreConfig
 from codechallenge.constants import MATCH_HASH_LEN, MATCH_PASSWORD_LEN
+from codechallenge.digest import (
+    DigestService,
+    digest_service,
+    reset_digest_service,
+)
 from codechallenge.entities import (
     Answer,
     Answers,
     Game,
     Match,
+    Matches,
+    MatchStats,
     OpenAnswer,
     Question,
     Questions,
+    Ranking,
     Reaction,
     Reactions,
     User,
 )
 from codechallenge.entities.match import MatchCode, MatchHash, MatchPassword
 from codechallenge.entities.reaction import ReactionScore
-from codechallenge.entities.user import UserFactory
+from codechallenge.entities.stats import MatchStat
+from codechallenge.entities.user import UserFactory, Users
 from codechallenge.exceptions import NotUsableQuestionError
+from codechallenge.play.allocator import (
+    CodeAllocator,
+    FeistelPermutation,
+    HashAllocator,
+    to_word,
+)
+from codechallenge.play.cache import ClientFactory
+from codechallenge.play.stats import StatsReconciler
+from redis.exceptions import RedisError
+from sqlalchemy import text, update
 from sqlalchemy.exc import IntegrityError, InvalidRequestError
 
 
+class TestCaseDigestService:
+    def t_digestsAreTheOnesOfAKeyedBlake2b(self):
+        key = "3ba57f9a004e42918eee6f73326aa89d"
+        service = DigestService(key, "a" * 32)
+        expected = blake2b(b"test@progame.io", key=key.encode(), digest_size=16)
+
+        assert service.digest("test@progame.io") == expected.hexdigest()
+        assert service.digest_many(["test@progame.io", "x"])[0] == (
+            expected.hexdigest()
+        )
+        assert service.digests("test@progame.io")[0] == expected.hexdigest()
+        assert len(set(service.digests("test@progame.io"))) == 2
+
+
 class TestCaseUserFactory:
     def t_fetchNewSignedUser(self, dbsession, monkeypatch):
         monkeypatch.setenv(
@@ -46,6 +80,27 @@ class TestCaseUserFactory:
             == signed_user
         )
 
+    def t_usersSignedWithThePreviousKeyAreMovedToTheCurrentOne(
+        self, dbsession, monkeypatch
+    ):
+        monkeypatch.setenv(
+            "SIGNED_KEY", "3ba57f9a004e42918eee6f73326aa89d", prepend=None
+        )
+        signed_user = UserFactory(
+            original_email="test@progame.io", token="25111961"
+        ).fetch()
+
+        monkeypatch.setenv("SIGNED_KEY", "a" * 32, prepend=None)
+        monkeypatch.setenv(
+            "SIGNED_KEY_PREVIOUS", "3ba57f9a004e42918eee6f73326aa89d", prepend=None
+        )
+        reset_digest_service()
+        user = UserFactory(original_email="test@progame.io", token="25111961").fetch()
+        assert user == signed_user
+        assert user.email_digest == digest_service().digest("test@progame.io")
+        assert user.email == f"{user.email_digest}@progame.io"
+        assert user.token_digest == digest_service().digest("25111961")
+
     def t_fetchUnsignedUserShouldReturnNewUserEveryTime(self, dbsession, mocker):
         # called twice to showcase the expected behaviour
         mocker.patch(
@@ -147,6 +202,39 @@ class TestCaseQuestion:
         assert {e.text for e in new_question.answers} == expected
         assert Answer.with_text("The machine was undergoing repair").is_correct
 
+    def t_bulkCreateQuestionsWithAnswers(self, dbsession):
+        match = Match().save()
+        game = Game(match_uid=match.uid, index=0).save()
+        uids = Questions.bulk_create(
+            game.uid,
+            [
+                {"text": "Where is London?", "answers": [{"text": "UK"}]},
+                {"text": "Where is Paris?", "answers": []},
+            ],
+        )
+        Questions.session.commit()
+
+        assert len(uids) == 2
+        london = Questions.get(uid=uids[0])
+        assert london.position == 0
+        assert london.answers[0].text == "UK"
+        assert london.answers[0].is_correct
+        assert Questions.get(uid=uids[1]).is_open
+
+    def t_insertQuestionsKeepsReturningTheQuestions(self, dbsession):
+        match = Match().save()
+        questions = match.insert_questions(
+            [{"text": "Where is London?", "answers": [{"text": "UK"}]}]
+        )
+        uids = match.bulk_insert_questions(
+            [{"text": "Where is Paris?", "answers": [{"text": "France"}]}]
+        )
+
+        assert [q.text for q in questions] == ["Where is London?"]
+        assert questions[0].answers[0].text == "UK"
+        assert Questions.get(uid=uids[0]).text == "Where is Paris?"
+        assert len(match.games) == 2
+
     def t_cloningQuestion(self, dbsession):
         new_question = Question(text="new-question", position=0).save()
         Answer(
@@ -256,8 +344,60 @@ class TestCaseMatchModel:
         question = Question(text="1+1 is = to", position=0, game_uid=game.uid).save()
         Reaction(question=question, user=user, match=match, game_uid=game.uid).save()
 
-        assert match.reactions[0].user == user
+        assert match.is_started
+        assert match.left_attempts(user) == 1
+        Ranking(match_uid=match.uid, user_uid=user.uid, score=0).save()
         assert match.left_attempts(user) == 0
+        Ranking(match_uid=match.uid, user_uid=user.uid, score=0).save()
+        assert match.left_attempts(user) == 0
+
+    def t_matchWithoutTimesCanBePlayedAtWill(self, dbsession):
+        match = Match().save()
+        match.update(times=None)
+        user = User(email="user@test.project").save()
+        Ranking(match_uid=match.uid, user_uid=user.uid, score=0).save()
+
+        assert not match.is_started
+        assert match.left_attempts(user) is None
+
+    def t_loadedMatchIsReusedUnlessFreshIsRequested(self, dbsession):
+        match = Match(name="Old name").save()
+        Matches.session.execute(
+            update(Match)
+            .where(Match.uid == match.uid)
+            .values(name="New name")
+            .execution_options(synchronize_session=False)
+        )
+
+        assert Matches.get(uid=match.uid).name == "Old name"
+        assert Matches.get(uid=match.uid, fresh=True).name == "New name"
+
+    def t_matchJsonIsLoadedInFourQueries(self, dbsession, emitted_queries):
+        def serialize(games, questions):
+            match = Match().save()
+            for index in range(games):
+                game = Game(match_uid=match.uid, index=index).save()
+                Questions.bulk_create(
+                    game.uid,
+                    [
+                        {"text": f"Q{n}", "answers": [{"text": "a"}, {"text": "b"}]}
+                        for n in range(questions)
+                    ],
+                )
+            Matches.session.commit()
+            Matches.session.expire_all()
+
+            emitted_queries.clear()
+            result = Matches.get(uid=match.uid, with_questions=True).json
+            return result, len(emitted_queries)
+
+        small, small_count = serialize(1, 2)
+        big, big_count = serialize(4, 10)
+
+        assert small_count == big_count == 4
+        assert len(big["questions"]) == 4
+        assert [len(q["answers"]) for q in big["questions"][3]] == [2] * 10
+        assert [q["text"] for q in small["questions"][0]] == ["Q0", "Q1"]
 
 
 class TestCaseMatchHash:
@@ -273,17 +413,135 @@ class TestCaseMatchHash:
         assert random_method.call_count == 2
 
 
+class TestCaseFeistelPermutation:
+    def t_valuesAreShuffledWithoutRepetitions(self):
+        permutation = FeistelPermutation(1000, key=b"k" * 32)
+        values = [permutation(n) for n in range(1000)]
+
+        assert sorted(values) == list(range(1000))
+        assert values[:10] != list(range(10))
+        other = FeistelPermutation(1000, key=b"j" * 32)
+        assert [other(n) for n in range(10)] != values[:10]
+
+    def t_wordsHaveTheRequestedLength(self):
+        assert to_word(0, "ab", 3) == "aaa"
+        assert to_word(5, "ab", 3) == "bab"
+
+
+class MemoryRedis:
+    """The commands of Redis used by the allocators, in memory"""
+
+    def __init__(self):
+        self.values = {}
+
+    def exists(self, key):
+        return int(key in self.values)
+
+    def set(self, key, value, nx=False):
+        if not (nx and key in self.values):
+            self.values[key] = value
+
+    def incr(self, key):
+        self.values[key] = int(self.values.get(key, 0)) + 1
+        return self.values[key]
+
+    def sadd(self, key, *members):
+        members = set(members) - self.values.setdefault(key, set())
+        self.values[key] |= members
+        return len(members)
+
+    def zadd(self, key, mapping, xx=False):
+        zset = self.values.setdefault(key, {})
+        if xx:
+            mapping = {m: score for m, score in mapping.items() if m in zset}
+        zset.update(mapping)
+
+    def pipeline(self):
+        return self
+
+    def execute(self):
+        pass
+
+
+@pytest.fixture
+def rclient(mocker):
+    client = MemoryRedis()
+    mocker.patch.object(ClientFactory, "enabled", True)
+    mocker.patch.object(ClientFactory, "new_client", return_value=client)
+    return client
+
+
+class TestCaseHashAllocator:
+    def t_hashesInUseAreSkipped(self, rclient):
+        allocator = HashAllocator("ab", 2, lambda: ["ab", "ba"])
+        values = [allocator.allocate() for _ in range(2)]
+
+        assert sorted(values) == ["aa", "bb"]
+        assert rclient.values[allocator.used_key] == {"aa", "ab", "ba", "bb"}
+
+    def t_noHashOnceAllAreUsed(self, rclient):
+        allocator = HashAllocator("ab", 2, lambda: ["ab"])
+        values = [allocator.allocate() for _ in range(3)]
+
+        assert None not in values
+        assert allocator.allocate() is None
+        # each allocation stops at the end of the counter
+        assert allocator.allocate() is None
+        assert rclient.values[allocator.counter_key] == 6
+
+    def t_noHashWhenRedisFails(self, rclient, mocker):
+        mocker.patch.object(rclient, "incr", side_effect=RedisError("down"))
+        assert HashAllocator("ab", 2, lambda: []).allocate() is None
+
+    def t_noHashWithoutRedis(self, mocker):
+        new_client = mocker.patch.object(ClientFactory, "new_client")
+        assert HashAllocator("ab", 2, lambda: []).allocate() is None
+        assert not new_client.called
+
+
+class TestCaseCodeAllocator:
+    def t_codesInUseAreReserved(self, rclient):
+        tomorrow = datetime.now() + timedelta(days=1)
+        allocator = CodeAllocator("01", 2, lambda: [("01", tomorrow)])
+        rclient.eval = lambda *args: None
+        allocator.allocate()
+
+        assert rclient.values[allocator.free_key] == {"00", "10", "11"}
+        assert rclient.values[allocator.reserved_key] == {"01": tomorrow.timestamp()}
+
+    def t_codeIsReservedUntilExpiration(self, rclient, mocker):
+        tomorrow = datetime.now() + timedelta(days=1)
+        allocator = CodeAllocator("01", 2, lambda: [])
+        rclient.eval = mocker.Mock(return_value=b"10")
+
+        assert allocator.allocate(tomorrow) == "10"
+        script, numkeys, *args = rclient.eval.call_args[0]
+        assert args[:2] == [allocator.free_key, allocator.reserved_key]
+        assert args[3] == tomorrow.timestamp()
+
+    def t_onlyReservedCodesAreExtended(self, rclient):
+        tomorrow = datetime.now() + timedelta(days=1)
+        allocator = CodeAllocator("01", 2, lambda: [("01", datetime.now())])
+        allocator.extend("01", tomorrow)
+        allocator.extend("10", tomorrow)
+
+        assert rclient.values[allocator.reserved_key] == {"01": tomorrow.timestamp()}
+
+    def t_noCodeWhenRedisFails(self, rclient, mocker):
+        rclient.eval = mocker.Mock(side_effect=RedisError("down"))
+        assert CodeAllocator("01", 2, lambda: []).allocate() is None
+
+
 class TestCaseMatchPassword:
-    def t_passwordUniqueForEachMatch(self, dbsession, mocker):
-        # the first call return a value already used
+    def t_passwordIsGeneratedWithoutQueries(self, dbsession, mocker):
         random_method = mocker.patch(
-            "codechallenge.entities.match.choices",
-            side_effect=["00321", "34550"],
+            "codechallenge.entities.match.choices", return_value="00321"
         )
-        Match(uhash="AEDRF", password="00321").save()
+        get_method = mocker.patch("codechallenge.entities.match.Matches.get")
 
-        MatchPassword(uhash="AEDRF").get_value()
-        assert random_method.call_count == 2
+        assert MatchPassword(uhash="AEDRF").get_value() == "00321"
+        assert random_method.call_count == 1
+        assert not get_method.called
 
 
 class TestCaseMatchCode:
@@ -457,3 +715,136 @@ class TestCaseReactionScore:
     def t_computeScoreForOpenQuestion(self):
         rs = ReactionScore(timing=0.2, question_time=None, answer_level=None)
         assert rs.value() == 0
+
+
+def query_plan(session, query):
+    """Return the SQLite plan of the query as a single string"""
+    statement = query.statement.compile(
+        dialect=session.bind.dialect, compile_kwargs={"literal_binds": True}
+    )
+    rows = session.execute(text(f"EXPLAIN QUERY PLAN {statement}")).all()
+    return " ".join(row[-1] for row in rows)
+
+
+class TestCaseMatchStats:
+    @pytest.fixture
+    def played(self, dbsession):
+        match = Match().save()
+        game = Game(match_uid=match.uid, index=0).save()
+        question = Question(text="1+1 is = to", position=0, game_uid=game.uid).save()
+        users = [User(email=f"user{i}@test.project").save() for i in range(3)]
+        Reaction(
+            question=question, user=users[0], match=match, game_uid=game.uid
+        ).save()
+        Reaction(
+            question=question,
+            user=users[1],
+            match=match,
+            game_uid=game.uid,
+            answer_time=datetime.now(),
+        ).save()
+        Ranking(match_uid=match.uid, user_uid=users[1].uid, score=1.5).save()
+        return match, question, users
+
+    def t_countersAreBuiltFromThePlaysThenUpdated(self, played):
+        match, question, users = played
+
+        assert MatchStats.of_match(match.uid) == {
+            "players": {"started": 2, "completed": 1, "playing": 1},
+            "plays": 1,
+            "average_score": 1.5,
+            "answers": {str(question.uid): 1},
+        }
+
+        MatchStats.player_started(match.uid)
+        MatchStats.question_answered(match.uid, question.uid)
+        Ranking(match_uid=match.uid, user_uid=users[2].uid, score=2.5).save()
+        MatchStats.play_completed(match.uid, users[2].uid, 2.5)
+        Ranking(match_uid=match.uid, user_uid=users[2].uid, score=0.5).save()
+        MatchStats.play_completed(match.uid, users[2].uid, 0.5)
+        assert MatchStats.of_match(match.uid) == {
+            "players": {"started": 3, "completed": 2, "playing": 1},
+            "plays": 3,
+            "average_score": 1.5,
+            "answers": {str(question.uid): 2},
+        }
+
+    def t_firstUpdateBuildsTheCountersOfTheMatch(self, played):
+        match, question, users = played
+
+        MatchStats.player_started(match.uid)
+        # the row built from the plays already counts the new player
+        assert MatchStats.of_match(match.uid)["players"]["started"] == 2
+
+    def t_reconcileRestoresTheCountersOfThePlays(self, played):
+        match, question, users = played
+        expected = MatchStats.of_match(match.uid)
+        MatchStats.session.execute(
+            update(MatchStat).where(MatchStat.match_uid == match.uid).values(plays=9)
+        )
+        MatchStats.session.commit()
+
+        assert StatsReconciler(interval=1).reconcile() == 1
+        assert MatchStats.of_match(match.uid) == expected
+
+    def t_countersAreBuiltFromThePrimary(self, played):
+        match, question, users = played
+        session = MatchStats.session
+        session.info["read_only"] = True
+        try:
+            MatchStats.of_match(match.uid)
+            assert session.info["wrote"]
+        finally:
+            session.info.pop("read_only")
+            session.info.pop("wrote", None)
+
+
+class TestCaseIndexes:
+    def t_reactionsOfUserToMatch(self, dbsession):
+        query = Reactions.all_reactions_of_user_to_match(User(uid=1), Match(uid=1))
+        plan = query_plan(Reactions.session, query)
+        # both composite indexes match the filter and
+        # serve the ordering by uid (rowid) as well
+        assert "(user_uid=? AND match_uid=?)" in plan or (
+            "(match_uid=? AND user_uid=?)" in plan
+        )
+        assert "TEMP B-TREE" not in plan
+
+    def t_reactionOfUserToQuestion(self, dbsession):
+        query = Reactions.session.query(Reaction).filter_by(user_uid=1, question_uid=1)
+        assert "USING INDEX" in query_plan(Reactions.session, query)
+
+    def t_playersOfMatch(self, dbsession, emitted_queries):
+        match, other = Match().save(), Match().save()
+        game = Game(match_uid=match.uid, index=0).save()
+        question = Question(text="1+1 is = to", position=0, game_uid=game.uid).save()
+        player, outsider = (
+            User(email="player@test.project").save(),
+            User(email="outsider@test.project").save(),
+        )
+        Reaction(question=question, user=player, match=match, game_uid=game.uid).save()
+        Reaction(
+            question=question, user=outsider, match=other, game_uid=game.uid
+        ).save()
+
+        emitted_queries.clear()
+        assert Users.players_of_match(match.uid) == [player]
+        ((statement, parameters),) = emitted_queries
+        # the plan of the statement players_of_match actually emitted
+        rows = (
+            Users.session.connection()
+            .exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+            .all()
+        )
+        assert "ix_reactions_match_uid_user_uid" in " ".join(row[-1] for row in rows)
+
+    def t_matchByHash(self, dbsession):
+        query = Matches.session.query(Match).filter_by(uhash="AEDRF")
+        assert "ix_matches_uhash" in query_plan(Matches.session, query)
+
+    def t_activeMatchWithCode(self, dbsession):
+        query = Matches.session.query(Match).filter(
+            Match.code == "1234", Match.to_time > datetime.now()
+        )
+        plan = query_plan(Matches.session, query)
+        assert "ix_matches_code_to_time" in plan
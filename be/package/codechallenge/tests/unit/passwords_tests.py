@@ -0,0 +1,45 @@
+import threading
+
+import pytest
+from codechallenge.exceptions import HasherBusyError
+from codechallenge.passwords import Argon2Hasher, BcryptHasher, PasswordHasher
+
+
+class TestCasePasswordHasher:
+    def t_hashIsReplacedWhenTheCostChanges(self):
+        old_hash = BcryptHasher(rounds=4).hash("p@ssworth")
+        hasher = PasswordHasher([BcryptHasher(rounds=5)])
+
+        assert hasher.verify("p@ssworth", old_hash)
+        assert not hasher.verify("password", old_hash)
+        assert hasher.needs_rehash(old_hash)
+        assert not hasher.needs_rehash(hasher.hash("p@ssworth"))
+
+    def t_hashesOfAcceptedSchemesAreVerified(self):
+        pytest.importorskip("argon2")
+        old_hash = BcryptHasher(rounds=4).hash("p@ssworth")
+        hasher = PasswordHasher(
+            [Argon2Hasher(time_cost=1, memory_cost=1024), BcryptHasher(rounds=4)]
+        )
+
+        assert hasher.verify("p@ssworth", old_hash)
+        assert hasher.needs_rehash(old_hash)
+        assert hasher.hash("p@ssworth").startswith("$argon2")
+
+    def t_hashesBeyondTheLimitAreRefused(self):
+        hasher = PasswordHasher([BcryptHasher(rounds=4)], max_pending=1)
+        started, release = threading.Event(), threading.Event()
+
+        def blocking():
+            started.set()
+            release.wait()
+
+        thread = threading.Thread(target=hasher.run, args=(blocking,))
+        thread.start()
+        started.wait()
+        with pytest.raises(HasherBusyError):
+            hasher.hash("p@ssworth")
+
+        release.set()
+        thread.join()
+        assert hasher.verify("p@ssworth", hasher.hash("p@ssworth"))
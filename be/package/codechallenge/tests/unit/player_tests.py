@@ -5,6 +5,7 @@ from codechallenge.entities import (
     Answer,
     Game,
     Match,
+    MatchStats,
     Question,
     Rankings,
     Reaction,
@@ -18,15 +19,57 @@ from codechallenge.exceptions import (
     MatchNotPlayableError,
     MatchOver,
 )
+from codechallenge.play.cache import ClientFactory
+from codechallenge.play.plan import MatchPlan, MatchPlans
 from codechallenge.play.single_player import (
     GameFactory,
     PlayerStatus,
+    PlayOrder,
     PlayScore,
     QuestionFactory,
     SinglePlayer,
 )
 
 
+class TestCasePlayOrder:
+    def t_nextSkipsPlayedUids(self):
+        order = PlayOrder([10, 11, 12, 13], [12, 99])
+        assert order.next() == 10
+        assert order.next() == 11
+        assert not order.is_last
+        assert order.next() == 13
+        assert order.is_last
+        assert order.next() is None
+
+    def t_previousOnlyWithinTheOrder(self):
+        order = PlayOrder([10, 11], [99])
+        assert order.previous() is None
+        order.next()
+        # 99 belongs to another game
+        assert order.previous() is None
+        order.next()
+        assert order.previous() == 10
+
+    def t_playingAllUidsTakesLinearTime(self):
+        class CountingSet(set):
+            lookups = 0
+
+            def __contains__(self, uid):
+                CountingSet.lookups += 1
+                return super().__contains__(uid)
+
+        order = PlayOrder(range(1000), range(0, 1000, 2))
+        order._played = CountingSet(order._played)
+        played = []
+        while not order.is_last:
+            played.append(order.next())
+
+        assert played == list(range(1, 1000, 2))
+        assert order.next() is None
+        # each uid is looked up once, whatever the uids already played
+        assert CountingSet.lookups == 1000
+
+
 class TestCaseQuestionFactory:
     def t_nextQuestionWhenNotOrdered(self, dbsession):
         match = Match().save()
@@ -187,6 +230,87 @@ class TestCaseGameFactory:
             game_factory.previous()
 
 
+class TestCaseMatchPlan:
+    def t_compileFollowsPlayOrder(self, dbsession):
+        match = Match().save()
+        second_game = Game(match_uid=match.uid, index=1).save()
+        first_game = Game(match_uid=match.uid, index=0).save()
+        q2 = Question(text="Where is Paris?", game_uid=first_game.uid, position=1)
+        q2.save()
+        q1 = Question(text="Where is London?", game_uid=first_game.uid, position=0)
+        q1.save()
+        q3 = Question(text="Where is Rome?", game_uid=second_game.uid, position=0)
+        q3.save()
+        answer = Answer(question=q1, text="UK", position=0).save()
+
+        plan = MatchPlan.compile(match)
+        assert plan.game_ids == (first_game.uid, second_game.uid)
+        assert plan.question_ids(first_game.uid) == (q1.uid, q2.uid)
+        assert plan.question_json(q1.uid) == q1.json
+        assert plan.is_valid_answer(q1.uid, answer.uid)
+        assert not plan.is_valid_answer(q2.uid, answer.uid)
+
+    def t_jsonRoundTrip(self, trivia_match):
+        plan = MatchPlan.compile(trivia_match)
+        restored = MatchPlan.from_json(plan.to_json())
+
+        assert restored.match_uid == trivia_match.uid
+        assert restored.game_ids == plan.game_ids
+        for g_uid in plan.game_ids:
+            assert restored.question_ids(g_uid) == plan.question_ids(g_uid)
+            for q_uid in plan.question_ids(g_uid):
+                assert restored.question_json(q_uid) == plan.question_json(q_uid)
+                assert restored.answer_ids(q_uid) == plan.answer_ids(q_uid)
+
+    def t_factoriesFollowThePlan(self, trivia_match):
+        plan = MatchPlan.compile(trivia_match)
+        game_factory = GameFactory(trivia_match, plan=plan)
+        game = game_factory.next()
+        question_factory = QuestionFactory(game, plan=plan)
+
+        assert game == trivia_match.ordered_games[0]
+        assert question_factory.next() == game.ordered_questions[0]
+        assert question_factory.next() == game.ordered_questions[1]
+        assert question_factory.is_last_question
+        assert question_factory.previous() == game.ordered_questions[0]
+
+    def t_noPlanWhenCacheIsDisabled(self, trivia_match):
+        assert MatchPlans.get(trivia_match) is None
+
+
+class TestCaseMatchPlanInvalidation:
+    @pytest.fixture
+    def invalidate(self, trivia_match, mocker):
+        mocker.patch.object(ClientFactory, "enabled", True)
+        return mocker.patch.object(MatchPlans, "invalidate")
+
+    def t_planIsInvalidatedOnceCommitted(self, trivia_match, invalidate):
+        trivia_match.bulk_insert_questions([{"text": "Where is Rome?"}], commit=False)
+        question = trivia_match.ordered_games[0].ordered_questions[0]
+        question.text = "Where is Milan?"
+        trivia_match.session.flush()
+        assert not invalidate.called
+
+        trivia_match.session.commit()
+        invalidate.assert_called_once_with(trivia_match.uid)
+
+    def t_answersChangeThePlan(self, trivia_match, invalidate):
+        question = trivia_match.ordered_games[0].ordered_questions[0]
+        question.answers[0].text = "Milan"
+        trivia_match.session.commit()
+
+        invalidate.assert_called_once_with(trivia_match.uid)
+
+    def t_planIsKeptOnRollback(self, trivia_match, invalidate):
+        question = trivia_match.ordered_games[0].ordered_questions[0]
+        question.text = "Where is Milan?"
+        trivia_match.session.flush()
+        trivia_match.session.rollback()
+        trivia_match.session.commit()
+
+        assert not invalidate.called
+
+
 class TestCaseStatus:
     def t_questionsDisplayed(self, dbsession, emitted_queries):
         match = Match().save()
@@ -245,6 +369,42 @@ class TestCaseStatus:
         status = PlayerStatus(user, match)
         assert status.current_score() == 5.4
 
+    def t_reactionsAreLoadedOnce(self, dbsession, emitted_queries):
+        match = Match().save()
+        g1 = Game(match_uid=match.uid, index=0).save()
+        g2 = Game(match_uid=match.uid, index=1).save()
+        q1 = Question(text="Where is Miami", position=0, game=g1).save()
+        q2 = Question(text="Where is London", position=0, game=g2).save()
+        user = User(email="user@test.project").save()
+        Reaction(match=match, question=q1, user=user, game_uid=g1.uid, score=1).save()
+        Reaction(match=match, question=q2, user=user, game_uid=g2.uid, score=2).save()
+
+        status = PlayerStatus(user, match)
+        before = len(emitted_queries)
+        assert status.questions_displayed() == {q1.uid: q1, q2.uid: q2}
+        assert status.questions_displayed_by_game(g2) == {q2.uid: q2}
+        assert status.all_games_played() == {g1.uid: g1, g2.uid: g2}
+        assert status.current_score() == 3
+        assert len(status.all_reactions()) == 2
+        assert len(emitted_queries) == before + 1
+
+    def t_addedReactionIsPartOfTheSnapshot(self, dbsession):
+        match = Match().save()
+        game = Game(match_uid=match.uid, index=0).save()
+        q1 = Question(text="Where is Miami", position=0, game=game).save()
+        q2 = Question(text="Where is London", position=1, game=game).save()
+        user = User(email="user@test.project").save()
+        Reaction(match=match, question=q1, user=user, game_uid=game.uid).save()
+
+        status = PlayerStatus(user, match)
+        assert status.questions_displayed() == {q1.uid: q1}
+        reaction = Reaction(
+            match=match, question=q2, user=user, game_uid=game.uid
+        ).save()
+        status.add_reaction(reaction)
+        assert status.questions_displayed() == {q1.uid: q1, q2.uid: q2}
+        assert status.last_unanswered_reaction() == reaction
+
 
 class TestCaseSinglePlayer:
     def t_reactionIsCreatedAsSoonAsQuestionIsReturned(self, dbsession):
@@ -297,9 +457,9 @@ class TestCaseSinglePlayer:
         assert e.value.message == "Expired match"
 
     def t_matchRightBeforeReaction(self, dbsession):
-        # the to_time attribute is set right before the player initialisation
-        # to bypass the is_active check inside start() and fail at reaction
-        # time (where is expected)
+        # the match expires between start() and the reaction: the is_active
+        # check inside start() passes and the reaction fails (where is
+        # expected), whatever the time start() takes
         match = Match().save()
         first_game = Game(match_uid=match.uid, index=1).save()
         question = Question(
@@ -308,11 +468,13 @@ class TestCaseSinglePlayer:
         answer = Answer(question=question, text="UK", position=1).save()
         user = User(email="user@test.project").save()
 
-        match.to_time = datetime.now() + timedelta(microseconds=5000)
+        match.to_time = datetime.now() + timedelta(hours=1)
         match.save()
         status = PlayerStatus(user, match)
         player = SinglePlayer(status, user, match)
         player.start()
+        match.to_time = datetime.now() - timedelta(seconds=1)
+        match.save()
         with pytest.raises(MatchError) as e:
             player.react(answer)
 
@@ -325,16 +487,46 @@ class TestCaseSinglePlayer:
         question = Question(
             text="Where is London?", game_uid=game.uid, position=0
         ).save()
+        answer = Answer(question=question, text="UK", position=1).save()
 
         status = PlayerStatus(user, match)
         player = SinglePlayer(status, user, match)
         assert player.start() == question
+        # a play not completed is not an attempt
+        assert match.left_attempts(user) == 1
+        with pytest.raises(MatchOver):
+            player.react(answer)
+        PlayScore(match.uid, user.uid, status.current_score()).save_to_ranking()
 
         with pytest.raises(MatchNotPlayableError):
             player.start()
 
-        assert match.reactions
-        dbsession.rollback()
+    def t_matchCanBePlayedAgainUntilMatchTimes(self, dbsession):
+        match = Match(times=2).save()
+        user = User(email="user@test.project").save()
+        game = Game(match_uid=match.uid, index=1).save()
+        question = Question(
+            text="Where is London?", game_uid=game.uid, position=0
+        ).save()
+        answer = Answer(question=question, text="UK", position=1).save()
+
+        for left_attempts in (1, 0):
+            # one request per play
+            status = PlayerStatus(user, match)
+            player = SinglePlayer(status, user, match)
+            assert player.start() == question
+            with pytest.raises(MatchOver):
+                player.react(answer)
+            # only the reactions of this play are scored
+            assert len(status.all_reactions()) == 1
+            PlayScore(match.uid, user.uid, status.current_score()).save_to_ranking()
+            assert match.left_attempts(user) == left_attempts
+
+        stats = MatchStats.of_match(match.uid)
+        assert stats["players"] == {"started": 1, "completed": 1, "playing": 0}
+        assert stats["plays"] == 2
+        with pytest.raises(MatchNotPlayableError):
+            SinglePlayer(PlayerStatus(user, match), user, match).start()
 
     def t_matchOver(self, dbsession):
         match = Match().save()
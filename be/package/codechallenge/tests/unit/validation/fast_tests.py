@@ -0,0 +1,80 @@
+import random
+
+import pytest
+from cerberus import Validator
+from cerberus.validator import DocumentError
+from codechallenge.validation.fast import FastValidator, compile_schema
+from codechallenge.validation.syntax import (
+    code_play_schema,
+    land_play_schema,
+    next_play_schema,
+    sign_play_schema,
+    start_play_schema,
+)
+
+MISSING = object()
+# values of every kind the play endpoints may receive
+VALUES = [
+    MISSING,
+    None,
+    0,
+    1,
+    -3,
+    2**40,
+    True,
+    1.7,
+    "",
+    "0",
+    "1",
+    " 7 ",
+    "x",
+    "1e3",
+    "12345",
+    "1234",
+    "12345\n",
+    "abcde",
+    "abcdeX",
+    "aBcDe",
+    "1234a",
+    [1],
+    {"uid": 1},
+]
+
+
+def documents(schema, size, seed):
+    rng = random.Random(seed)
+    fields = list(schema) + ["unknown"]
+    for _ in range(size):
+        document = {}
+        for field in fields:
+            value = rng.choice(VALUES if field in schema else VALUES[:3])
+            if value is not MISSING:
+                document[field] = value
+        yield document
+
+
+class TestCaseFastValidator:
+    @pytest.mark.parametrize(
+        "schema",
+        [land_play_schema, code_play_schema, start_play_schema, next_play_schema],
+    )
+    def t_sameOutcomeOfCerberus(self, schema):
+        cerberus = Validator(schema)
+        fast = FastValidator(schema).get()
+        for document in documents(schema, 2000, seed=len(schema)):
+            assert fast.validate(document) == cerberus.validate(document), document
+            assert fast.errors == cerberus.errors, document
+            assert fast.document == cerberus.document, document
+
+    def t_documentsThatAreNotMappingsAreRejectedAsByCerberus(self):
+        validate = compile_schema(next_play_schema)
+        for document in [None, [], "match_uid=1"]:
+            with pytest.raises(DocumentError) as fast_error:
+                validate(document)
+            with pytest.raises(DocumentError) as cerberus_error:
+                Validator(next_play_schema).validate(document)
+            assert str(fast_error.value) == str(cerberus_error.value)
+
+    def t_unsupportedRulesAreRefused(self):
+        with pytest.raises(ValueError):
+            compile_schema(sign_play_schema)
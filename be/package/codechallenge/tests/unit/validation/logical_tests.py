@@ -139,6 +139,33 @@ class TestCaseNextEndPoint:
         with pytest.raises(NotFoundObjectError):
             ValidatePlayNext(answer_uid=10000).valid_answer()
 
+    def t_questionDoesNotBelongToMatch(self, trivia_match, dbsession):
+        other = Match().save()
+        question = trivia_match.questions[0][0]
+        answer = question.answers_by_position[0]
+        with pytest.raises(ValidateError) as err:
+            ValidatePlayNext(
+                match_uid=other.uid, answer_uid=answer.uid, question_uid=question.uid
+            ).valid_answer()
+
+        assert err.value.message == "Invalid question"
+
+    def t_validationRunsOneQuery(self, trivia_match, dbsession, emitted_queries):
+        question = trivia_match.questions[0][0]
+        answer = question.answers_by_position[0]
+        user = UserFactory(signed=trivia_match.is_restricted).fetch()
+
+        before = len(emitted_queries)
+        data = ValidatePlayNext(
+            match_uid=trivia_match.uid,
+            user_uid=user.uid,
+            answer_uid=answer.uid,
+            question_uid=question.uid,
+        ).is_valid()
+
+        assert len(emitted_queries) == before + 1
+        assert data == {"match": trivia_match, "user": user, "answer": answer}
+
     def t_userDoesNotExists(self, dbsession):
         with pytest.raises(NotFoundObjectError):
             ValidatePlayNext(user_uid=1).valid_user()
@@ -0,0 +1,69 @@
+from datetime import datetime, timezone
+
+from codechallenge.play.write_behind import AnswersQueue
+
+
+def answer_values(answer_uid):
+    now = datetime.now(tz=timezone.utc)
+    return {
+        "score": 0.5,
+        "update_timestamp": now,
+        "answer_time": now,
+        "answer_uid": answer_uid,
+        "open_answer_uid": None,
+    }
+
+
+class TestCaseAnswersQueue:
+    def t_pendingAnswersAreReplayedAfterRestart(self, tmp_path):
+        path = str(tmp_path / "reactions.queue")
+        queue = AnswersQueue(path)
+        values = answer_values(3)
+        queue.append(1, values)
+        queue.close()
+        with open(path, "ab") as fp:
+            # write interrupted by a crash
+            fp.write(b'{"reaction_uid": 2, "sco')
+
+        queue = AnswersQueue(path)
+        assert len(queue) == 1
+        assert queue.get(1) == values
+        assert queue.get(2) is None
+        queue.append(2, answer_values(4))
+        queue.close()
+
+        assert len(AnswersQueue(path)) == 2
+
+    def t_fileIsEmptiedOnceDrained(self, tmp_path):
+        path = tmp_path / "reactions.queue"
+        queue = AnswersQueue(str(path))
+        queue.append(1, answer_values(3))
+        queue.append(2, answer_values(4))
+
+        entries = queue.take(1)
+        queue.append(1, answer_values(5))
+        queue.ack(entries)
+        # the answer replaced meanwhile is still pending
+        assert queue.get(1)["answer_uid"] == 5
+
+        queue.ack(queue.take(10))
+        assert len(queue) == 0
+        assert path.stat().st_size == 0
+
+    def t_fileIsCompactedWhileAnswersArePending(self, tmp_path):
+        path = tmp_path / "reactions.queue"
+        queue = AnswersQueue(str(path), compact_size=1000)
+        for reaction_uid in range(1, 21):
+            queue.append(reaction_uid, answer_values(reaction_uid))
+        size = path.stat().st_size
+
+        # one answer always pending, the file is never drained
+        queue.ack(queue.take(19))
+        assert path.stat().st_size < size / 10
+        queue.append(21, answer_values(21))
+        queue.close()
+
+        queue = AnswersQueue(str(path))
+        assert len(queue) == 2
+        assert queue.get(20)["answer_uid"] == 20
+        assert queue.get(21)["answer_uid"] == 21
@@ -1,14 +1,37 @@
+import threading
+
 from cerberus import Validator
 from codechallenge.exceptions import InternalException
+from codechallenge.validation.fast import FastValidator
 from pyramid.response import Response
 from pyramid.view import view_config
 
 
+class CompiledValidator:
+    """Validator of a schema, normalized only once
+
+    Validators keep the state of the document being processed,
+    hence one instance per thread shares the compiled schema.
+    """
+
+    def __init__(self, schema):
+        self.schema = Validator(schema).schema
+        self._local = threading.local()
+
+    def get(self):
+        validator = getattr(self._local, "validator", None)
+        if validator is None:
+            validator = self._local.validator = Validator(self.schema)
+        return validator
+
+
 class view_decorator(view_config):
     def __call__(self, wrapped):
         settings = self.__dict__.copy()
         syntax_schema = settings.pop("syntax", None)
         data_attr = settings.pop("data_attr", None)
+        # compiled validation of the play schemas, see validation.fast
+        fast_syntax = settings.pop("fast_syntax", False)
         depth = settings.pop("_depth", 0)
         category = settings.pop("_category", "pyramid")
 
@@ -24,12 +47,17 @@ class view_decorator(view_config):
             if settings.get("attr") is None:
                 settings["attr"] = wrapped.__name__
 
+        compiled = None
+        if syntax_schema:
+            factory = FastValidator if fast_syntax else CompiledValidator
+            compiled = factory(syntax_schema)
+
         def wrapped_f(*args, **kwargs):
             request = args[0].request
             user_input = getattr(request, data_attr, {})
             if data_attr == "params":
                 user_input = dict(user_input)
-            v = Validator(syntax_schema)
+            v = compiled.get()
             if not v.validate(user_input):
                 return Response(status=400, json=v.errors)
 
@@ -0,0 +1,135 @@
+import re
+from collections.abc import Mapping
+
+from cerberus.validator import DocumentError
+
+# rules compile_schema supports, every other one is refused
+SUPPORTED_RULES = {"type", "coerce", "required", "min", "regex"}
+TYPES = {"integer": int, "string": str}
+
+
+def compile_regex(pattern):
+    # same semantic as Cerberus: match() plus an implicit trailing $
+    compiled = re.compile(pattern if pattern.endswith("$") else pattern + "$")
+    message = f"value does not match regex '{pattern}'"
+
+    def check(value):
+        if isinstance(value, str) and not compiled.match(value):
+            return message
+
+    return check
+
+
+def compile_min(min_value):
+    message = f"min value is {min_value}"
+
+    def check(value):
+        try:
+            if value < min_value:
+                return message
+        except TypeError:
+            pass
+
+    return check
+
+
+def compile_field(name, rules):
+    """Return a callable (value) -> (value, errors) of one field"""
+    unsupported = set(rules) - SUPPORTED_RULES
+    if unsupported:
+        raise ValueError(f"Rules {sorted(unsupported)} of {name} are not supported")
+
+    coerce = rules.get("coerce")
+    type_name = rules.get("type")
+    expected_type = TYPES[type_name] if type_name else None
+    # the other rules run in the order they are defined, as in Cerberus
+    checks = [
+        compile_regex(constraint) if rule == "regex" else compile_min(constraint)
+        for rule, constraint in rules.items()
+        if rule in ("regex", "min")
+    ]
+
+    def check(value):
+        errors = []
+        if coerce is not None:
+            try:
+                value = coerce(value)
+            except Exception as e:
+                errors.append(f"field '{name}' cannot be coerced: {e}")
+
+        if value is None:
+            errors.append("null value not allowed")
+            return value, errors
+
+        if expected_type is not None and not isinstance(value, expected_type):
+            errors.append(f"must be of {type_name} type")
+            return value, errors
+
+        for rule_check in checks:
+            error = rule_check(value)
+            if error:
+                errors.append(error)
+        return value, errors
+
+    return check
+
+
+def compile_schema(schema):
+    """
+    Compile a flat schema into a callable (document) -> (document, errors).
+
+    Only the rules of the play schemas are supported, the document
+    and the errors are the ones Cerberus returns for the same schema.
+    """
+    fields = {name: compile_field(name, rules) for name, rules in schema.items()}
+    required = [name for name, rules in schema.items() if rules.get("required")]
+
+    def validate(document):
+        if document is None:
+            raise DocumentError("document is missing")
+        if not isinstance(document, Mapping):
+            raise DocumentError(f"'{document}' is not a document, must be a dict")
+
+        normalized = dict(document)
+        errors = {}
+        for name, value in document.items():
+            check = fields.get(name)
+            if check is None:
+                errors[name] = ["unknown field"]
+                continue
+
+            normalized[name], field_errors = check(value)
+            if field_errors:
+                errors[name] = field_errors
+
+        for name in required:
+            if name not in document:
+                errors[name] = ["required field"]
+        return normalized, errors
+
+    return validate
+
+
+class FastValidation:
+    """Outcome of one validation, with the attributes of a Validator"""
+
+    __slots__ = ("check", "document", "errors")
+
+    def __init__(self, check):
+        self.check = check
+        self.document = None
+        self.errors = {}
+
+    def validate(self, document):
+        self.document, self.errors = self.check(document)
+        return not self.errors
+
+
+class FastValidator:
+    """Alternative to CompiledValidator for the hottest endpoints"""
+
+    def __init__(self, schema):
+        self.check = compile_schema(schema)
+
+    def get(self):
+        return FastValidation(self.check)
@@ -1,14 +1,29 @@
 from datetime import datetime
 
-from codechallenge.entities import Answers, Matches, Questions, Reactions, Users
-from codechallenge.entities.user import WordDigest
+from codechallenge.entities import (
+    Answer,
+    Answers,
+    Game,
+    Match,
+    Matches,
+    Question,
+    Questions,
+    Reaction,
+    Reactions,
+    User,
+    Users,
+)
 from codechallenge.exceptions import NotFoundObjectError, ValidateError
+from codechallenge.play.write_behind import merge_pending
+from sqlalchemy import and_, literal, select
 
 
 class RetrieveObject:
-    def __init__(self, uid, otype):
+    def __init__(self, uid, otype, fresh=False):
         self.object_uid = uid
         self.otype = otype
+        # when True the row is reloaded even if already in session
+        self.fresh = fresh
 
     def get(self):
         klass = {
@@ -18,7 +33,7 @@ class RetrieveObject:
             "user": Users,
         }.get(self.otype)
 
-        obj = klass.get(uid=self.object_uid)
+        obj = klass.get(uid=self.object_uid, fresh=self.fresh)
         if obj:
             return obj
         raise NotFoundObjectError()
@@ -66,9 +81,7 @@ class ValidatePlaySign:
         self.token = token
 
     def valid_user(self):
-        email_digest = WordDigest(self.original_email).value()
-        token_digest = WordDigest(self.token).value()
-        user = Users.get(email_digest=email_digest, token_digest=token_digest)
+        user = Users.signed(self.original_email, self.token)
         if user:
             return user
         raise NotFoundObjectError("Invalid email-token")
@@ -123,34 +136,69 @@ class ValidatePlayNext:
         self.user_uid = kwargs.get("user_uid")
         self.question_uid = kwargs.get("question_uid")
         self._data = {}
+        self._rows = None
+
+    @property
+    def rows(self):
+        """
+        User, match, answer and reactions to the question, in one query
+
+        Each entity is joined to a one-row anchor, so it is None when
+        missing instead of discarding the others. The question is
+        joined only if the answer belongs to it, the game only if the
+        question belongs to a game, whose match_uid is returned.
+        """
+        if self._rows is not None:
+            return self._rows
+
+        anchor = select(literal(1).label("anchor")).subquery()
+        query = (
+            select(User, Match, Answer, Question.uid, Game.match_uid, Reaction)
+            .select_from(anchor)
+            .outerjoin(User, User.uid == self.user_uid)
+            .outerjoin(Match, Match.uid == self.match_uid)
+            .outerjoin(Answer, Answer.uid == self.answer_uid)
+            .outerjoin(
+                Question,
+                and_(
+                    Question.uid == Answer.question_uid,
+                    Question.uid == self.question_uid,
+                ),
+            )
+            .outerjoin(Game, Game.uid == Question.game_uid)
+            .outerjoin(
+                Reaction,
+                and_(
+                    Reaction.user_uid == User.uid,
+                    Reaction.question_uid == self.question_uid,
+                ),
+            )
+        )
+        self._rows = Reactions.session.execute(query).all()
+        return self._rows
 
     def valid_reaction(self):
-        user = self._data.get("user")
-        if not user:
-            user = Users.get(uid=self.user_uid)
-
-        question = self._data.get("question")
-        if not question:
-            question = Questions.get(uid=self.question_uid)
-
-        reaction = Reactions.reaction_of_user_to_question(user, question)
-        if reaction and reaction.answer:
-            raise ValidateError("Duplicate Reactions")
+        reactions = [row.Reaction for row in self.rows if row.Reaction]
+        # answers might not be written yet
+        for reaction in merge_pending(reactions):
+            if reaction.answer_uid or reaction.open_answer_uid:
+                raise ValidateError("Duplicate Reactions")
 
     def valid_answer(self):
-        answer = Answers.get(uid=self.answer_uid)
-        if answer is None:
+        row = self.rows[0]
+        if row.Answer is None:
             raise NotFoundObjectError("Unexisting answer")
 
-        question = Questions.get(uid=self.question_uid)
-        if question and answer in question.answers:
-            self._data["answer"] = answer
-            return
+        if row.uid is None:
+            raise ValidateError("Invalid answer")
+
+        if self.match_uid and row.match_uid != self.match_uid:
+            raise ValidateError("Invalid question")
 
-        raise ValidateError("Invalid answer")
+        self._data["answer"] = row.Answer
 
     def valid_user(self):
-        user = Users.get(uid=self.user_uid)
+        user = self.rows[0].User
         if user:
             self._data["user"] = user
             return
@@ -158,7 +206,10 @@ class ValidatePlayNext:
         raise NotFoundObjectError()
 
     def valid_match(self):
-        match = RetrieveObject(self.match_uid, otype="match").get()
+        match = self.rows[0].Match
+        if match is None:
+            raise NotFoundObjectError()
+
         self._data["match"] = match
 
     def is_valid(self):
@@ -175,7 +226,7 @@ class ValidateEditMatch:
         self.match_uid = match_uid
 
     def valid_match(self):
-        match = RetrieveObject(self.match_uid, otype="match").get()
+        match = RetrieveObject(self.match_uid, otype="match", fresh=True).get()
         if not match.is_started:
             return match
 
@@ -204,7 +255,7 @@ class ValidateMatchImport:
         self.match_uid = match_uid
 
     def valid_match(self):
-        return RetrieveObject(self.match_uid, otype="match").get()
+        return RetrieveObject(self.match_uid, otype="match", fresh=True).get()
 
     def is_valid(self):
         return self.valid_match()
@@ -9,9 +9,14 @@ from codechallenge.constants import (
     ISOFORMAT,
     MATCH_CODE_LEN,
     MATCH_HASH_LEN,
+    MATCH_LIST_MAX_PAGE_SIZE,
+    MATCH_LIST_PAGE_SIZE,
     MATCH_PASSWORD_LEN,
     PASSWORD_POPULATION,
+    RANKINGS_MAX_PAGE_SIZE,
+    RANKINGS_PAGE_SIZE,
 )
+from pyramid.settings import asbool
 
 land_play_schema = {
     "match_uhash": {
@@ -204,8 +209,46 @@ player_list_schema = {
 }
 
 
+def coerce_fields(value):
+    if isinstance(value, list):
+        return value
+    return [f for f in value.split(",") if f]
+
+
+list_matches_schema = {
+    "after": {"type": "integer", "coerce": int, "min": 1},
+    "limit": {
+        "type": "integer",
+        "coerce": int,
+        "min": 1,
+        "max": MATCH_LIST_MAX_PAGE_SIZE,
+        "default": MATCH_LIST_PAGE_SIZE,
+    },
+    # query string values, i.e. "true" or "false"
+    "active": {"type": "boolean", "coerce": asbool},
+    "restricted": {"type": "boolean", "coerce": asbool},
+    "with_code": {"type": "boolean", "coerce": asbool},
+    "fields": {
+        "type": "list",
+        "coerce": coerce_fields,
+        "allowed": ["questions"],
+        "default": [],
+    },
+}
+
+
 match_rankings_schema = {
     "match_uid": {"type": "integer", "coerce": int, "required": True, "min": 1},
+    "limit": {
+        "type": "integer",
+        "coerce": int,
+        "min": 1,
+        "max": RANKINGS_MAX_PAGE_SIZE,
+        "default": RANKINGS_PAGE_SIZE,
+    },
+    "offset": {"type": "integer", "coerce": int, "min": 0, "default": 0},
+    # when set, the page is centered on the user
+    "user_uid": {"type": "integer", "coerce": int, "min": 1},
 }
 
 
@@ -237,6 +280,30 @@ def to_expected_mapping(value):
     return result
 
 
+def check_unique_texts(field, value, error):
+    # as the case-insensitive collation of the answers table does
+    texts = [
+        a["text"].casefold().rstrip()
+        for a in value
+        if isinstance(a, dict) and isinstance(a.get("text"), str)
+    ]
+    if len(set(texts)) < len(texts):
+        error(field, "Answers texts must be unique")
+
+
+import_question_schema = {
+    "text": {"type": "string", "required": True},
+    "answers": {
+        "type": "list",
+        "check_with": check_unique_texts,
+        "schema": {
+            "type": "dict",
+            "schema": {"text": {"type": "string", "required": True}},
+        },
+    },
+}
+
+
 match_yaml_import_schema = {
     "match_uid": {"type": "integer", "coerce": int, "required": True, "min": 1},
     "data": {
@@ -246,22 +313,28 @@ match_yaml_import_schema = {
         "schema": {
             "questions": {
                 "type": "list",
-                "schema": {
-                    "type": "dict",
-                    "schema": {
-                        "text": {"type": "string", "required": True},
-                        "answers": {
-                            "type": "list",
-                            "schema": {
-                                "type": "dict",
-                                "schema": {
-                                    "text": {"type": "string", "required": True}
-                                },
-                            },
-                        },
-                    },
-                },
+                "schema": {"type": "dict", "schema": import_question_schema},
             }
         },
     },
 }
+
+
+def coerce_data_url(value):
+    b64content = re.sub(r"^data:[^;,]*;base64,", "", value)
+    return b64decode(b64content)
+
+
+match_import_schema = {
+    "match_uid": {"type": "integer", "coerce": int, "required": True, "min": 1},
+    "format": {"type": "string", "allowed": ["yaml", "xlsx"], "default": "yaml"},
+    # base64 encoded file, the data url prefix is optional
+    "data": {"type": "binary", "required": True, "coerce": coerce_data_url},
+}
+
+
+provision_players_schema = {
+    "format": {"type": "string", "allowed": ["csv", "json"], "default": "csv"},
+    # base64 encoded file, the data url prefix is optional
+    "data": {"type": "binary", "required": True, "coerce": coerce_data_url},
+}
@@ -31,6 +31,8 @@ setup(
     install_requires=requires,
     extras_require={
         "dev": dev_requires,
+        # passwords.schemes = argon2
+        "argon2": ["argon2-cffi"],
     },
     entry_points={
         "paste.app_factory": ["main = codechallenge:main"],